@@ -0,0 +1,218 @@
+"""
+End-to-end ingest benchmark.
+
+Starts a loopback WebSocket server, connects a real SocklyTab to it under
+offscreen Qt and measures, per content mode and payload size:
+ - messages/sec from the first frame sent to the last frame painted
+ - p50/p99 frame-to-paint latency (server send to output repaint)
+ - peak RSS of the process (kB on Linux, bytes on macOS)
+
+Every scenario runs in a separate process with its own settings database,
+so results don't affect each other or the user's settings.
+
+Usage:
+python -m benchmarks.e2e [--modes plain,json,bson,binary] [--sizes 64,1024,16384] [--count 5000]
+                         [--virtual] [--output results.json]
+python -m benchmarks.e2e --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ('plain', 'json', 'bson', 'binary')
+
+
+def make_frames(mode, size, count):
+    """
+    Build `count` frames of roughly `size` bytes for given content mode
+    """
+    from benchmarks.ws_server import TEXT, BINARY
+    frames = []
+    items = []
+    while len(json.dumps({'seq': count, 'items': items})) < size:
+        items.append({'id': len(items), 'price': 1.25, 'ok': True, 'tag': 'abc'})
+    for i in range(count):
+        if mode == 'plain':
+            payload = ('%08d ' % i + 'x' * size)[:max(size, 9)].encode()
+            frames.append((TEXT, payload))
+        elif mode == 'json':
+            frames.append((TEXT, json.dumps({'seq': i, 'items': items}).encode()))
+        elif mode == 'bson':
+            import bson
+            frames.append((BINARY, bson.dumps({'seq': i, 'items': items})))
+        else:
+            frames.append((BINARY, bytes((i + j) % 256 for j in range(size))))
+    return frames
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_scenario(mode, size, count, virtual, timeout):
+    """
+    Run a single scenario in this process. Must be called before anything imports sockly
+    """
+    home = tempfile.mkdtemp(prefix='sockly-bench-')
+    os.makedirs(os.path.join(home, '.config'), exist_ok=True)
+    os.environ['HOME'] = home
+    os.environ['APPDATA'] = home
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    import resource
+    from PyQt5 import QtCore, QtWidgets
+    from benchmarks.ws_server import StandInServer
+    from sockly.app import Sockly
+    from sockly.structs import MessageTypes
+
+    app = QtWidgets.QApplication(sys.argv)
+    win = Sockly()
+    win.show()
+    tab = win.tabs_widget.widget(0)
+    tab.virtual_output.setChecked(virtual)
+    output = tab.output
+
+    server = StandInServer(make_frames(mode, size, count)).start()
+    painted_times = []
+    state = {'painted': 0}
+
+    class PaintWatcher(QtCore.QObject):
+        def eventFilter(self, obj, ev):
+            if ev.type() == QtCore.QEvent.Paint:
+                now = time.monotonic()
+                items = output.items
+                for i in range(state['painted'], len(items)):
+                    if items[i].type == MessageTypes.INCOMING:
+                        painted_times.append(now)
+                state['painted'] = len(items)
+                if len(painted_times) >= count:
+                    app.quit()
+            return False
+
+    watcher = PaintWatcher()
+    output.text.viewport().installEventFilter(watcher)
+    output.view.viewport().installEventFilter(watcher)
+
+    tab.url_input.setText(server.url)
+    tab.toggle_connect()
+    QtCore.QTimer.singleShot(int(timeout * 1000), app.quit)
+    app.exec()
+    if tab.worker:
+        # a QThread still running when the process exits aborts it
+        tab.worker.shutdown()
+        tab.worker.wait()
+    server.stop()
+
+    sent = server.sent_times[:len(painted_times)]
+    latencies = [(p - s) * 1000 for s, p in zip(sent, painted_times)]
+    elapsed = painted_times[-1] - sent[0] if painted_times else None
+    return {
+        'mode': mode,
+        'size': size,
+        'count': count,
+        'virtual': virtual,
+        'received': len(painted_times),
+        'msgs_per_sec': len(painted_times) / elapsed if elapsed else None,
+        'latency_p50_ms': percentile(latencies, 50),
+        'latency_p99_ms': percentile(latencies, 99),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_file, new_file):
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    key = lambda r: (r['mode'], r['size'], r['virtual'])
+    old_results = {key(r): r for r in old['results']}
+    print('%-8s %7s %5s  %22s  %22s  %22s' % ('mode', 'size', 'virt', 'msgs/s', 'p99 ms', 'peak RSS kB'))
+    for r in new['results']:
+        o = old_results.get(key(r))
+        if not o:
+            continue
+        cells = []
+        for metric in ('msgs_per_sec', 'latency_p99_ms', 'peak_rss_kb'):
+            a, b = o[metric], r[metric]
+            if a and b:
+                cells.append('%9.1f -> %9.1f' % (a, b) + (' %+5.0f%%' % ((b - a) / a * 100)))
+            else:
+                cells.append('%22s' % 'n/a')
+        print('%-8s %7d %5s  %s' % (r['mode'], r['size'], r['virtual'], '  '.join(cells)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--sizes', default='64,1024,16384')
+    parser.add_argument('--count', type=int, default=5000)
+    parser.add_argument('--virtual', action='store_true', help='use virtualized output view')
+    parser.add_argument('--timeout', type=float, default=120, help='per-scenario timeout, seconds')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    if args.scenario:
+        mode, size = args.scenario.split(':')
+        print(json.dumps(run_scenario(mode, int(size), args.count, args.virtual, args.timeout)))
+        return
+
+    results = []
+    failed = []
+    for mode in args.modes.split(','):
+        for size in map(int, args.sizes.split(',')):
+            cmd = [sys.executable, '-m', 'benchmarks.e2e', '--scenario', '%s:%d' % (mode, size),
+                   '--count', str(args.count), '--timeout', str(args.timeout)]
+            if args.virtual:
+                cmd.append('--virtual')
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE)
+            try:
+                result = json.loads(proc.stdout.decode().strip().split('\n')[-1])
+            except ValueError:
+                result = None
+            if proc.returncode or result is None:
+                failed.append({'mode': mode, 'size': size, 'returncode': proc.returncode})
+                print('%-8s %7d  failed, exit code %d' % (mode, size, proc.returncode), file=sys.stderr)
+                continue
+            results.append(result)
+            print('%-8s %7d  %10.1f msg/s  p50 %8.2f ms  p99 %8.2f ms  %8d kB' % (
+                mode, size, result['msgs_per_sec'] or 0, result['latency_p50_ms'] or 0,
+                result['latency_p99_ms'] or 0, result['peak_rss_kb']), file=sys.stderr)
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'count': args.count,
+        'results': results,
+        'failed': failed,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
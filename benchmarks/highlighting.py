@@ -0,0 +1,78 @@
+"""
+Compares single-pass highlighting tokenizers with the regex rules they replaced.
+
+Builds ~1 MB documents (pretty-printed JSON and a hexdump of random bytes)
+and reports, for each highlighter, the best time of `--repeat` runs of:
+ - rules: one regex pass per rule, overlapping spans resolved per character
+   (what highlighting output messages used to cost)
+ - tokenizer: one pass producing disjoint spans
+Also checks that both produce the same runs.
+
+Usage:
+python -m benchmarks.highlighting [--size 1048576] [--repeat 5]
+"""
+import argparse
+import json
+import random
+import time
+
+from sockly.structs import MessageContent, MessageTypes
+from sockly.utils.hexdump import HexdumpLines
+from sockly.utils.highlighters import get_highlighter, overlay
+
+
+def make_json(size, rnd):
+    items = []
+    text = ''
+    while len(text) < size:
+        for _ in range(100):
+            items.append({
+                'id': len(items),
+                'name': 'item\t{}'.format(rnd.random()),
+                'price': round(rnd.random() * 1000, 2),
+                'ok': rnd.random() < 0.5,
+                'parent': None,
+                'tags': ['a', 'bé', str(rnd.randint(0, 9))],
+                'url': 'http://localhost:8080/items/{}'.format(len(items)),
+            })
+        text = json.dumps({'items': items}, indent=2)
+    return text
+
+
+def make_hexdump(size, rnd):
+    # hexdump lines are ~4.3 times as long as the data they show
+    data = bytes(rnd.getrandbits(8) for _ in range(size * 10 // 43))
+    return '\n'.join(HexdumpLines(data))
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1 << 20, help='document size in characters')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the best one is reported')
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    documents = (
+        ('json', get_highlighter(MessageContent.JSON, MessageTypes.INCOMING), make_json(args.size, rnd)),
+        ('hexdump', get_highlighter(MessageContent.BINARY, MessageTypes.INCOMING), make_hexdump(args.size, rnd)),
+    )
+    print('{:>10} {:>10} {:>12} {:>12} {:>8} {:>8}'.format('document', 'chars', 'rules, ms', 'tokens, ms',
+                                                            'speedup', 'same'))
+    for name, hl, text in documents:
+        rules, expected = best(lambda: overlay(hl.rule_spans(text), len(text)), args.repeat)
+        tokens, runs = best(lambda: hl.runs(text), args.repeat)
+        print('{:>10} {:>10} {:>12.1f} {:>12.1f} {:>7.1f}x {:>8}'.format(
+            name, len(text), rules * 1000, tokens * 1000, rules / tokens, 'yes' if runs == expected else 'NO'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Measures per-append cost of SocketOutput as the capture grows.
+
+Appends small JSON messages one by one (like SocklyTab.add_incoming does)
+and reports the mean time of the last `--window` appends before each checkpoint.
+Per-append cost should stay flat from 1k to 1M messages.
+
+Usage:
+python -m benchmarks.output_append [--max 1000000] [--window 1000] [--virtual]
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+from sockly.structs import SocketMessage, MessageTypes, MessageContent
+from sockly.widgets.SocketOutput import SocketOutput
+
+
+def checkpoints(maximum):
+    n = 1000
+    while n <= maximum:
+        yield n
+        n *= 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max', type=int, default=1000000, help='number of messages to append')
+    parser.add_argument('--window', type=int, default=1000, help='number of appends averaged at each checkpoint')
+    parser.add_argument('--virtual', action='store_true', help='use virtualized output view')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    output = SocketOutput()
+    output.resize(1000, 600)
+    output.show()
+    output.set_virtual(args.virtual)
+
+    message = SocketMessage(MessageTypes.INCOMING, ['{', '  "id": 42,', '  "price": 1.5', '}'], MessageContent.JSON)
+    marks = set(checkpoints(args.max))
+    window_start = time.perf_counter()
+
+    print('%10s  %14s' % ('messages', 'us/append'))
+    for n in range(1, args.max + 1):
+        if n + args.window - 1 in marks:
+            window_start = time.perf_counter()
+        output.items.append(message)
+        output.notify_set_changed('append')
+        if n in marks:
+            elapsed = time.perf_counter() - window_start
+            app.processEvents()
+            print('%10d  %14.2f' % (n, elapsed / min(n, args.window) * 1e6))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
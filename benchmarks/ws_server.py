@@ -0,0 +1,169 @@
+"""
+Minimal loopback WebSocket server (RFC 6455, no extensions) used as a stand-in
+for real services in benchmarks.
+
+It sends prepared frames to every client right after the handshake, recording
+when each was sent, and optionally echoes back whatever the client sends.
+"""
+import base64
+import hashlib
+import socket
+import struct
+import threading
+import time
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+
+def encode_frame(opcode, payload):
+    header = bytes([0x80 | opcode])
+    n = len(payload)
+    if n < 126:
+        header += bytes([n])
+    elif n < 1 << 16:
+        header += bytes([126]) + struct.pack('>H', n)
+    else:
+        header += bytes([127]) + struct.pack('>Q', n)
+    return header + payload
+
+
+def _recv_exact(conn, n):
+    data = b''
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return data
+
+
+def read_frame(conn):
+    """
+    Read a single (masked, client-to-server) frame
+
+    :return: Tuple of opcode and payload
+    """
+    b1, b2 = _recv_exact(conn, 2)
+    n = b2 & 0x7f
+    if n == 126:
+        n, = struct.unpack('>H', _recv_exact(conn, 2))
+    elif n == 127:
+        n, = struct.unpack('>Q', _recv_exact(conn, 8))
+    mask = _recv_exact(conn, 4) if b2 & 0x80 else None
+    payload = _recv_exact(conn, n)
+    if mask and n:
+        mask = (mask * (n // 4 + 1))[:n]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(mask, 'big')).to_bytes(n, 'big')
+    return b1 & 0x0f, payload
+
+
+class StandInServer:
+    """
+    :param frames: List of (opcode, payload) sent to each client after the handshake
+    :param echo: Whether data frames received from clients are sent back
+    :param interval: Delay between prepared frames, seconds
+    """
+    def __init__(self, frames=(), echo=False, interval=0, host='127.0.0.1', port=0):
+        self.frames = list(frames)
+        self.echo = echo
+        self.interval = interval
+        self.sent_times = []
+        self.received = 0
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.listen(128)
+        self._running = True
+
+    @property
+    def url(self):
+        host, port = self._sock.getsockname()
+        return 'ws://{}:{}/'.format(host, port)
+
+    def start(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._sock.close()
+
+    def _accept(self):
+        while self._running:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _handshake(conn):
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = conn.recv(4096)
+            if not chunk:
+                raise ConnectionError('connection closed')
+            request += chunk
+        key = None
+        for line in request.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'sec-websocket-key':
+                key = value.strip()
+        accept = base64.b64encode(hashlib.sha1(key + GUID).digest())
+        conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\n'
+                     b'Upgrade: websocket\r\n'
+                     b'Connection: Upgrade\r\n'
+                     b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+    def _serve(self, conn):
+        lock = threading.Lock()
+
+        def send(opcode, payload):
+            with lock:
+                conn.sendall(encode_frame(opcode, payload))
+
+        try:
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._handshake(conn)
+            if self.frames:
+                threading.Thread(target=self._send_frames, args=(send,), daemon=True).start()
+            while True:
+                opcode, payload = read_frame(conn)
+                if opcode == CLOSE:
+                    send(CLOSE, payload[:2])
+                    break
+                if opcode == PING:
+                    send(PONG, payload)
+                elif opcode in (TEXT, BINARY):
+                    self.received += 1
+                    if self.echo:
+                        send(opcode, payload)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def _send_frames(self, send):
+        try:
+            for opcode, payload in self.frames:
+                self.sent_times.append(time.monotonic())
+                send(opcode, payload)
+                if self.interval:
+                    time.sleep(self.interval)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    server = StandInServer(echo=True, port=8765).start()
+    print('Echo server listening on ' + server.url)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
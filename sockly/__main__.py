@@ -1,8 +1,25 @@
-from sockly.app import Sockly
-from PyQt5.QtWidgets import QApplication
 import sys
 
-app = QApplication(sys.argv)
-win = Sockly()
-win.show()
+if '--headless' in sys.argv[1:]:
+    from sockly.headless import main
+    sys.exit(main(sys.argv[1:]))
+
+from sockly.utils import startup
+
+if '--startup-profile' in sys.argv[1:]:
+    sys.argv.remove('--startup-profile')
+    startup.enable()
+
+with startup.phase('import Qt'):
+    from PyQt5.QtWidgets import QApplication
+with startup.phase('import Sockly'):
+    from sockly.app import Sockly
+
+with startup.phase('QApplication'):
+    app = QApplication(sys.argv)
+with startup.phase('main window'):
+    win = Sockly()
+with startup.phase('show'):
+    win.show()
+startup.report_on_first_paint(win)
 sys.exit(app.exec())
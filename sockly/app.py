@@ -17,6 +17,12 @@ class Sockly(QtWidgets.QMainWindow):
         self.add_tab_btn.setText('+')
         self.add_tab_btn.clicked.connect(self.add_tab)
         self.tabs_widget.setCornerWidget(self.add_tab_btn)
+
+        self.search_btn = QtWidgets.QToolButton(self.widget)
+        self.search_btn.setText('Search')
+        self.search_btn.clicked.connect(self.show_search)
+        self.tabs_widget.setCornerWidget(self.search_btn, QtCore.Qt.TopLeftCorner)
+        self.search_window = None
         self.uid = 0
         self.tabs = {}
         self.broadcast.connect(self.on_broadcast)
@@ -31,6 +37,14 @@ class Sockly(QtWidgets.QMainWindow):
         self.resize(1500, 800)
         self.setWindowTitle('Sockly — the WebSocket client')
 
+    def closeEvent(self, ev):
+        # stop connections of every tab, a QThread deleted while running at exit aborts the process
+        for i in range(self.tabs_widget.count()):
+            self.tabs_widget.widget(i).cleanup()
+        from sockly.utils.SocketThread import SocketThread
+        SocketThread.stop_all()
+        super().closeEvent(ev)
+
     def add_tab(self):
         uid = self.uid
         self.uid += 1
@@ -42,6 +56,14 @@ class Sockly(QtWidgets.QMainWindow):
         self.tabs_widget.setCurrentIndex(i)
         self.update_close_buttons()
 
+    def show_search(self):
+        if self.search_window is None:
+            from sockly.widgets.SearchWindow import SearchWindow
+            self.search_window = SearchWindow(self)
+        self.search_window.show()
+        self.search_window.raise_()
+        self.search_window.query_input.setFocus()
+
     def update_close_buttons(self):
         c = self.tabs_widget.count()
         bar = self.tabs_widget.tabBar()
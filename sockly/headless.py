@@ -0,0 +1,155 @@
+"""
+Headless Sockly: connect, send messages and print what comes back, without any widgets.
+
+Usage:
+python -m sockly --headless ws://localhost:8080 -H 'Authorization: Bearer x' --send messages.txt --ndjson
+"""
+import argparse
+import sys
+import threading
+import time
+
+from sockly.structs import MessageContent
+from sockly.utils.connection import create_connection, send
+from sockly.utils.decoding import decode_data, parse_data, encode_data, payload_size, SEND_MODES
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='sockly --headless', description='Headless WebSocket client')
+    parser.add_argument('--headless', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('url', help='WebSocket URL')
+    parser.add_argument('-H', '--header', action='append', default=[], metavar='"Name: Value"',
+                        help='additional request header, can be repeated')
+    parser.add_argument('--proxy', help='http[s]://[user[:password]@]domain.tld[:port]')
+    parser.add_argument('--compress', action='store_true', help='use compression')
+    parser.add_argument('--persist', action='store_true', help='auto-reconnect')
+    parser.add_argument('--no-bson', action='store_true', help='do not decode binary frames as BSON')
+    parser.add_argument('--send', metavar='FILE', help='send messages from FILE, `-` for stdin')
+    parser.add_argument('--whole', action='store_true', help='send FILE as a single message instead of line by line')
+    parser.add_argument('--mode', choices=SEND_MODES, default='plain_text', help='how messages are encoded')
+    parser.add_argument('--ndjson', action='store_true', help='print frames as newline-delimited JSON')
+    parser.add_argument('--quiet', action='store_true', help='do not print frames, only the summary')
+    parser.add_argument('--count', type=int, help='exit after receiving COUNT frames')
+    parser.add_argument('--duration', type=float, help='exit after DURATION seconds')
+    return parser
+
+
+def create_config(args):
+    """
+    Build worker config, same as SocklyTab._create_worker_config does
+    """
+    headers = {}
+    for line in args.header:
+        k, *v = line.split(': ')
+        headers[k] = ': '.join(v)
+    return {
+        'url': args.url,
+        'headers': headers,
+        'proxy': args.proxy,
+        'compress': args.compress,
+        'persist': args.persist,
+        'decode_bson': not args.no_bson,
+        'poll': 0.5,
+    }
+
+
+def read_messages(args):
+    f = sys.stdin if args.send == '-' else open(args.send)
+    with f:
+        if args.whole:
+            yield f.read()
+        else:
+            for line in f:
+                line = line.rstrip('\n')
+                if line:
+                    yield line
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.connected = None
+        self.received = 0
+        self.received_bytes = 0
+        self.sent = 0
+        self.sent_bytes = 0
+
+    def summary(self):
+        elapsed = time.monotonic() - (self.connected or self.started)
+        rate = elapsed if elapsed > 0 else 1
+        return ('received {} frames ({} bytes), sent {} frames ({} bytes) in {:.2f}s: '
+                '{:.1f} msg/s in, {:.1f} msg/s out, {:.1f} B/s in').format(
+            self.received, self.received_bytes, self.sent, self.sent_bytes, elapsed,
+            self.received / rate, self.sent / rate, self.received_bytes / rate)
+
+
+def sender(ws, args, stats, compress):
+    for data in read_messages(args):
+        payload = encode_data(data, args.mode)
+        if isinstance(payload, ValueError):
+            print('Error: ' + payload.args[0], file=sys.stderr)
+            continue
+        send(ws, payload, compress)
+        stats.sent += 1
+        stats.sent_bytes += payload_size(payload)
+
+
+def print_frame(args, data):
+    decode_bson = not args.no_bson
+    now = time.time()
+    if args.ndjson:
+        value, typ = decode_data(data, decode_bson)
+        if typ == MessageContent.BINARY:
+            value = data.hex()
+        try:
+            line = json.dumps({'time': now, 'content': typ.name.lower(), 'size': len(data),
+                               'data': value})
+        except (TypeError, ValueError, OverflowError):
+            line = json.dumps({'time': now, 'content': 'binary', 'size': len(data),
+                               'data': data.hex() if type(data) is bytes else data})
+        print(line)
+    else:
+        lines, _ = parse_data(data, decode_bson)
+        print('<<- ' + '\n    '.join(lines))
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    stats = Stats()
+    ws, events = create_connection(create_config(args))
+    deadline = time.monotonic() + args.duration if args.duration else None
+    try:
+        for ev in events:
+            if ev.name == 'ready':
+                stats.connected = time.monotonic()
+                print('Connected to ' + args.url, file=sys.stderr)
+                if args.send:
+                    threading.Thread(target=sender, args=(ws, args, stats, args.compress), daemon=True).start()
+            elif ev.name in ('text', 'binary'):
+                data = ev.text if ev.name == 'text' else ev.data
+                stats.received += 1
+                stats.received_bytes += payload_size(ev.data if ev.name == 'binary' else ev.text)
+                if not args.quiet:
+                    print_frame(args, data)
+                if args.count and stats.received >= args.count:
+                    ws.close()
+                    if args.persist:
+                        break
+            elif ev.name in ('rejected', 'connect_fail'):
+                print('Error: ' + ev.reason, file=sys.stderr)
+            elif ev.name == 'disconnected':
+                print('Disconnected ({})'.format(ev.reason), file=sys.stderr)
+            if deadline and time.monotonic() >= deadline:
+                if not ws.is_active or args.persist:
+                    break
+                ws.close()
+                deadline = None
+    except KeyboardInterrupt:
+        pass
+    print(stats.summary(), file=sys.stderr)
+    return 0 if stats.connected else 1
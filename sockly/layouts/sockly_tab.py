@@ -2,7 +2,8 @@ from PyQt5 import QtWidgets
 
 from sockly.structs import MessageTypes, SocketMessage, MessageContent
 from sockly.utils.helpers import MONOSPACE, get_font, label, ellipsize, button
-from sockly.utils.highlighters import JsonHighlighter
+from sockly.utils.highlighters import get_highlighter
+from sockly.utils.InputHighlighter import InputHighlighter
 from sockly.widgets.BetterPlainTextEdit import BetterPlainTextEdit
 from sockly.widgets.SocketOutput import SocketOutput
 
@@ -83,8 +84,93 @@ def layout_left_pane(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
     layout.addLayout(checkboxes_row2)
     self.decode_bson = QtWidgets.QCheckBox('Decode BSON')
     self.decode_bson.setChecked(True)
+    self.decode_bson.toggled.connect(self.on_decode_bson)
     checkboxes_row2.addWidget(self.decode_bson)
 
+    self.virtual_output = QtWidgets.QCheckBox('Virtualized output')
+    checkboxes_row2.addWidget(self.virtual_output)
+
+    self.archive_messages = QtWidgets.QCheckBox('Archive for search')
+    self.archive_messages.setToolTip('Store sent and received messages in a searchable archive, '
+                                     'only the latest 500 000 are kept')
+    checkboxes_row2.addWidget(self.archive_messages)
+
+    self.async_engine = QtWidgets.QCheckBox('Shared async engine')
+    self.async_engine.setToolTip('Run connections of all tabs on one event loop thread instead of a thread per tab.\n'
+                                 'Applies on next connect')
+    checkboxes_row2.addWidget(self.async_engine)
+
+    spinboxes_row = QtWidgets.QHBoxLayout()
+    layout.addLayout(spinboxes_row)
+    self.flush_interval = QtWidgets.QSpinBox()
+    self.flush_interval.setRange(1, 1000)
+    self.flush_interval.setSuffix(' ms')
+    self.flush_interval.setToolTip('How often incoming events are flushed to the output')
+    spinboxes_row.addWidget(label('Flush every'))
+    spinboxes_row.addWidget(self.flush_interval)
+
+    self.batch_cap = QtWidgets.QSpinBox()
+    self.batch_cap.setRange(1, 1000000)
+    self.batch_cap.setToolTip('Maximum number of events rendered in one pass')
+    spinboxes_row.addWidget(label('Batch cap'))
+    spinboxes_row.addWidget(self.batch_cap)
+
+    self.ping_interval = QtWidgets.QSpinBox()
+    self.ping_interval.setRange(0, 3600)
+    self.ping_interval.setSuffix(' s')
+    self.ping_interval.setSpecialValueText('never')
+    self.ping_interval.setToolTip('How often pings measuring round-trip time are sent')
+    self.ping_interval.valueChanged.connect(lambda _: self.on_ping_interval_changed())
+    spinboxes_row.addWidget(label('Ping every'))
+    spinboxes_row.addWidget(self.ping_interval)
+
+    retention_row = QtWidgets.QHBoxLayout()
+    layout.addLayout(retention_row)
+    self.retention_messages = QtWidgets.QSpinBox()
+    self.retention_messages.setRange(0, 100000000)
+    self.retention_messages.setSpecialValueText('all')
+    self.retention_messages.setSuffix(' msgs')
+    self.retention_messages.valueChanged.connect(lambda _: self.on_retention_changed())
+    self.retention_mb = QtWidgets.QSpinBox()
+    self.retention_mb.setRange(0, 1000000)
+    self.retention_mb.setSpecialValueText('any size')
+    self.retention_mb.setSuffix(' MB')
+    self.retention_mb.valueChanged.connect(lambda _: self.on_retention_changed())
+    self.retention_messages.setToolTip('Older messages are moved to disk')
+    self.retention_mb.setToolTip('Older messages are moved to disk')
+    retention_row.addWidget(label('Keep in memory'))
+    retention_row.addWidget(self.retention_messages)
+    retention_row.addWidget(self.retention_mb)
+
+    correlation_row = QtWidgets.QHBoxLayout()
+    layout.addLayout(correlation_row)
+    self.correlate = QtWidgets.QCheckBox('Match replies by')
+    self.correlate.setToolTip('Match JSON/BSON replies to sent messages by a key and measure latency')
+    correlation_row.addWidget(self.correlate)
+    self.correlation_key = QtWidgets.QLineEdit()
+    self.correlation_key.setFont(get_font(MONOSPACE))
+    self.correlation_key.setPlaceholderText('id, e.g. params.0.request_id')
+    self.correlation_key.editingFinished.connect(self.on_correlation_key_changed)
+    correlation_row.addWidget(self.correlation_key)
+    self.correlation_timeout = QtWidgets.QSpinBox()
+    self.correlation_timeout.setRange(1, 3600)
+    self.correlation_timeout.setSuffix(' s')
+    self.correlation_timeout.setToolTip('Requests without reply for this long are flagged')
+    self.correlation_timeout.valueChanged.connect(lambda _: self.on_correlation_changed())
+    correlation_row.addWidget(label('within'))
+    correlation_row.addWidget(self.correlation_timeout)
+
+    self.rtt_label = label('RTT: no pongs yet')
+    self.rtt_label.setFont(get_font(MONOSPACE, 9))
+    self.rtt_label.setToolTip('Round-trip time of the latest pings: min / median / 99th percentile / max')
+    layout.addWidget(self.rtt_label)
+
+    self.send_label = label('Send queue: 0 queued')
+    self.send_label.setFont(get_font(MONOSPACE, 9))
+    self.send_label.setToolTip('Messages waiting to be written to the socket, and how long '
+                               'the last one waited in the queue and took to write')
+    layout.addWidget(self.send_label)
+
     tabs = QtWidgets.QTabWidget()
 
     history_widget = QtWidgets.QWidget()
@@ -99,6 +185,18 @@ def layout_left_pane(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
     tabs.addTab(favourites_widget, 'Favourites')
     layout_favs(self, favourites_layout)
 
+    # the panels are built when their tab is first opened, see SocklyTab.on_panel_tab_changed
+    self.perf_panel = None
+    self.perf_tab = QtWidgets.QWidget()
+    QtWidgets.QVBoxLayout(self.perf_tab).setContentsMargins(0, 0, 0, 0)
+    tabs.addTab(self.perf_tab, 'Performance')
+
+    self.latency_panel = None
+    self.latency_tab = QtWidgets.QWidget()
+    QtWidgets.QVBoxLayout(self.latency_tab).setContentsMargins(0, 0, 0, 0)
+    tabs.addTab(self.latency_tab, 'Latency')
+    tabs.currentChanged.connect(lambda index: self.on_panel_tab_changed(tabs.widget(index)))
+
     layout.addWidget(tabs)
 
     bottom = QtWidgets.QHBoxLayout()
@@ -106,7 +204,10 @@ def layout_left_pane(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
             ('Clear history', 'clear_hist'),
             ('Save', 'save'),
             ('Save as', 'save_as'),
-            ('Open', 'open')
+            ('Open', 'open'),
+            ('Load test', 'show_load'),
+            ('Record', 'toggle_record'),
+            ('Replay', 'show_replay'),
     ):
         widget = button(name, getattr(self, slug))
         setattr(self, slug + '_btn', widget)
@@ -127,8 +228,8 @@ def layout_history(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
 
 def layout_favs(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
     buttons = QtWidgets.QHBoxLayout()
-    spacer = QtWidgets.QSpacerItem(0, 0, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
-    buttons.addItem(spacer)
+    # the layout owns its items, so every spacer is a separate one (a shared one is deleted twice)
+    buttons.addItem(QtWidgets.QSpacerItem(0, 0, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed))
 
     buttons.addWidget(button('Add', self.add_fav))
     self.del_fav_btn = button('Remove', self.del_fav)
@@ -138,7 +239,7 @@ def layout_favs(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
     self.set_fav_btn.setEnabled(False)
     buttons.addWidget(self.set_fav_btn)
 
-    buttons.addItem(spacer)
+    buttons.addItem(QtWidgets.QSpacerItem(0, 0, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed))
     layout.addLayout(buttons)
 
     self.favourites_list = QtWidgets.QListWidget()
@@ -152,7 +253,9 @@ def layout_right_pane(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
     self.right_splitter.setOrientation(2)  # Vertical
     layout.addWidget(self.right_splitter)
 
-    self.output = SocketOutput()
+    self.output = SocketOutput(self.database)
+    self.output.stats = self.stats
+    self.virtual_output.toggled.connect(self.output.set_virtual)
     self.right_splitter.addWidget(self.output)
 
     bottom = QtWidgets.QHBoxLayout()
@@ -220,11 +323,5 @@ def layout_right_pane(self: QtWidgets.QWidget, layout: QtWidgets.QVBoxLayout):
     self.input = BetterPlainTextEdit()
     self.input.setFont(get_font(MONOSPACE))
 
-    self.input.jhl = JsonHighlighter()
-
-    self.input.textEdited.connect(lambda:
-                                  self.input.jhl.highlight(
-                                      self.input.toPlainText(),
-                                      self.input.document()
-                                  ) if (self.send_json_radio.isChecked() or self.send_bson_radio.isChecked()) else 1)
+    self.input_highlighter = InputHighlighter(self.input, get_highlighter(MessageContent.JSON, MessageTypes.OUTGOING))
     bottom_left.addWidget(self.input)
@@ -0,0 +1,514 @@
+"""
+Shared asyncio connection engine.
+
+Every AsyncConnection runs on the same event loop thread, instead of having
+a SocketThread (and an OS thread) per tab. lomond's WebSocket is IO independent:
+it parses bytes given to `feed` and writes frames through its session, so it is
+used as is with an asyncio-driven session. Events are the very same lomond events
+SocketThread produces, so tabs don't care which engine they are connected with.
+"""
+import asyncio
+import atexit
+import math
+import ssl
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from random import random
+from urllib.parse import urlparse
+
+from lomond import errors, events
+from lomond.frame import Frame
+from lomond.proxy import build_request, ProxyParser, ProxyFail
+from sockly.utils.EventBatcher import EventBatcher
+from sockly.utils.connection import create_websocket, send
+from sockly.utils.decoding import decode_event
+from sockly.utils.rtt import RttMeter
+from sockly.utils.send_queue import SendQueue
+
+
+class _ForceDisconnect(Exception):
+    pass
+
+
+def _ssl_context():
+    # same as lomond does: no certificate verification
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class AsyncSession(asyncio.Protocol):
+    """
+    lomond session (see lomond.session.WebsocketSession) driven by asyncio.
+
+    Incoming data is fed to the websocket in `data_received`, events are passed
+    to `push`. Frames may be sent from any thread.
+    """
+    CONNECT_TIMEOUT = 30
+    TICK = 1
+
+    def __init__(self, websocket, loop, push):
+        self.websocket = websocket
+        self.loop = loop
+        self.push = push
+        self.transport = None
+        self.ready = False
+        self.lost = loop.create_future()
+        self._reason = None
+        self._start_time = None
+        self._poll_start = None
+        self._next_ping = 0.0
+        self._proxy_parser = None
+        self._proxy_waiter = None
+
+    @property
+    def session_time(self):
+        return 0.0 if self._start_time is None else time.monotonic() - self._start_time
+
+    async def open(self):
+        """
+        Connect to the server, through a proxy if websocket has one
+
+        :return: Proxy URL or None
+        """
+        ws = self.websocket
+        proxy = ws.proxies.get('https' if ws.is_secure else 'http')
+        if proxy:
+            url = urlparse(proxy)
+            port = url.port or (443 if url.scheme == 'https' else 80)
+            self._proxy_parser = ProxyParser()
+            self._proxy_waiter = self.loop.create_future()
+            await asyncio.wait_for(self.loop.create_connection(
+                lambda: self, url.hostname, port,
+                ssl=_ssl_context() if url.scheme == 'https' else None
+            ), self.CONNECT_TIMEOUT)
+            self.transport.write(build_request(ws.host, ws.port, url.username, url.password))
+            await asyncio.wait_for(self._proxy_waiter, self.CONNECT_TIMEOUT)
+            if ws.is_secure:
+                self.transport = await self.loop.start_tls(self.transport, self, _ssl_context(),
+                                                           server_hostname=ws.host)
+        else:
+            await asyncio.wait_for(self.loop.create_connection(
+                lambda: self, ws.host, ws.port,
+                ssl=_ssl_context() if ws.is_secure else None,
+                server_hostname=ws.host if ws.is_secure else None
+            ), self.CONNECT_TIMEOUT)
+        return proxy
+
+    async def run(self, poll=5.0, ping_rate=30.0, close_timeout=30.0):
+        """
+        Wait until the connection is lost, doing polls, pings and close timeout meanwhile
+
+        :return: Disconnected event
+        """
+        while not self.lost.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self.lost), min(poll, self.TICK))
+            except asyncio.TimeoutError:
+                pass
+            if self.ready and not self.lost.done():
+                self._regular(poll, ping_rate, close_timeout)
+        if self._reason is None and not self.websocket.is_closed:
+            self._reason = 'socket fail; connection lost'
+        if self._reason is None:
+            return events.Disconnected(graceful=True)
+        return events.Disconnected(self._reason)
+
+    def _regular(self, poll, ping_rate, close_timeout):
+        now = self.session_time
+        if self._poll_start is None or now - self._poll_start >= poll:
+            self._poll_start = now
+            self.push(events.Poll())
+        if ping_rate and now > self._next_ping:
+            self._next_ping = math.ceil(now / ping_rate) * ping_rate
+            try:
+                self.websocket.send_ping()
+            except errors.WebSocketError:
+                pass
+        sent_close_time = self.websocket.sent_close_time
+        if close_timeout and sent_close_time is not None and now >= sent_close_time + close_timeout:
+            self.disconnect("disconnected; server didn't respond to close packet within {}s".format(close_timeout))
+
+    def disconnect(self, reason):
+        """
+        Drop the connection right away
+        """
+        if self._reason is None:
+            self._reason = reason
+        if self.transport is not None:
+            self.transport.abort()
+
+    # lomond session interface
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def force_disconnect(self):
+        raise _ForceDisconnect()
+
+    def write(self, data):
+        if self.transport is None:
+            raise errors.WebSocketUnavailable('not connected')
+        if self.websocket.is_closed:
+            raise errors.WebSocketClosed('data not sent')
+        if self.websocket.is_closing:
+            raise errors.WebSocketClosing('data not sent')
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._write(data)
+        else:
+            self.loop.call_soon_threadsafe(self._write, bytes(data))
+
+    def _write(self, data):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(data)
+
+    def send(self, opcode, data):
+        self.write(Frame(opcode, payload=bytearray(data)).to_bytes())
+
+    def send_compressed(self, opcode, data):
+        self.write(Frame(opcode, payload=bytearray(data), rsv1=1).to_bytes())
+
+    # asyncio.Protocol interface
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if self._proxy_parser is not None:
+            try:
+                for _ in self._proxy_parser.feed(data):
+                    self._proxy_parser = None
+                    self._proxy_waiter.set_result(None)
+                    break
+            except ProxyFail as error:
+                self._proxy_parser = None
+                self._proxy_waiter.set_exception(error)
+            return
+        try:
+            for event in self.websocket.feed(data):
+                self._on_event(event)
+        except _ForceDisconnect:
+            self.disconnect('disconnected; protocol error')
+            return
+        if self.websocket.is_closed:
+            self.close()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if exc is not None and self._reason is None:
+            self._reason = 'socket fail; recv fail; {}'.format(exc)
+        if self._proxy_waiter is not None and not self._proxy_waiter.done():
+            self._proxy_waiter.set_exception(ConnectionError('proxy closed the connection'))
+        if not self.lost.done():
+            self.lost.set_result(None)
+
+    def _on_event(self, event):
+        if event.name == 'ready':
+            self.ready = True
+            self._start_time = time.monotonic()
+        elif event.name == 'ping':
+            try:
+                self.websocket.send_pong(event.data)
+            except errors.WebSocketError:
+                pass
+        self.push(event)
+
+
+class BaseConnection:
+    """
+    Reconnecting WebSocket running on the shared AsyncEngine. Events are passed
+    to `_push` on the loop thread, subclasses decide what to do with them
+
+    :param config: Worker config, see SocklyTab._create_worker_config
+    :param engine: Engine to run on, process-wide one by default
+    """
+    MIN_WAIT = 5
+    MAX_WAIT = 30
+
+    def __init__(self, config: dict, engine=None):
+        self.config = config
+        self.engine = engine or get_engine()
+        self.conn = create_websocket(config)
+        self._stopping = False
+        self._wakeup = None
+        # set while not running, same as QThread.isFinished()
+        self._stopped = threading.Event()
+        self._stopped.set()
+
+    def start(self):
+        self._stopped.clear()
+        self.engine.start(self, self._on_stopped)
+
+    def _on_stopped(self):
+        self._stopped.set()
+
+    def wait(self, timeout=None):
+        """
+        Wait until the connection is stopped, like QThread.wait()
+
+        :param timeout: ms, forever if None
+        :return: Whether it is stopped
+        """
+        return self._stopped.wait(None if timeout is None else timeout / 1000)
+
+    def close(self, code=1000, reason='goodbye'):
+        self.conn.close(code, reason)
+
+    def shutdown(self):
+        """
+        Stop the connection for good: close it gracefully if it is open,
+        abort connecting or reconnect back-off otherwise. Doesn't block
+        """
+        self.engine.call(self._shutdown)
+
+    def _push(self, ev):
+        raise NotImplementedError
+
+    async def run(self):
+        retries = 0
+        while not self._stopping:
+            retries += 1
+            if await self._run_once():
+                retries = 0
+            if not self.config['persist'] or self._stopping:
+                break
+            wait_for = self.MIN_WAIT + random() * min(self.MAX_WAIT - self.MIN_WAIT, 2 ** retries)
+            self._push(events.BackOff(wait_for))
+            self._wakeup = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self._wakeup, wait_for)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_once(self):
+        """
+        Connect once and wait until disconnected, same as lomond's WebSocket.connect()
+
+        :return: Whether the server accepted the connection
+        """
+        ws = self.conn
+        ws.reset()
+        ws.state.session = session = AsyncSession(ws, asyncio.get_running_loop(), self._push)
+        self._push(events.Connecting(ws.url))
+        try:
+            try:
+                proxy = await session.open()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self._push(events.ConnectFail('unable to connect; {}'.format(error or type(error).__name__)))
+                return False
+            try:
+                session.write(ws.build_request())
+            except errors.WebSocketError as error:
+                self._push(events.ConnectFail('request failed; {}'.format(error)))
+                return False
+            self._push(events.Connected(ws.url, proxy=proxy))
+            self._push(await session.run(
+                self.config.get('poll', 5.0),
+                self.config.get('ping_rate', 30.0),
+                self.config.get('close_timeout', 30.0),
+            ))
+            return session.ready
+        finally:
+            session.close()
+
+    def _shutdown(self):
+        self._stopping = True
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+        session = self.conn.session
+        if session is not None and session.ready and self.conn.is_active and not session.lost.done():
+            # closing handshake, run() finishes when the server responds (or close timeout trips)
+            self.conn.close()
+        else:
+            self.engine.cancel(self)
+
+
+class AsyncConnection(BaseConnection):
+    """
+    Drop-in replacement for SocketThread running on the shared AsyncEngine
+
+    :param config: Worker config, see SocklyTab._create_worker_config
+    :param stats: PerfStats to count incoming frames in
+    :param engine: Engine to run on, process-wide one by default
+    """
+    def __init__(self, config: dict, stats=None, engine=None):
+        super().__init__(config, engine)
+        self.stats = stats
+        self.rtt = RttMeter()
+        self.recorder = None
+        self.events = EventBatcher(config.get('flush_interval', 16), config.get('batch_cap', 1000))
+        # drained on the loop thread, frames are handed to the transport there
+        self.queue = SendQueue(self._write, self._report, lambda: self.engine.call(self.queue.drain),
+                               lambda: self.rtt.ping(self.conn))
+        self._decoder = None
+        self._undecoded = deque()
+        self._decode_lock = threading.Lock()
+        self._decoding = False
+
+    def start(self):
+        # frames are decoded on a thread of the connection's own, in order, so a busy tab
+        # doesn't hold the loop (and network IO of every other connection) up
+        self._decoder = ThreadPoolExecutor(1, 'sockly-decode')
+        super().start()
+
+    def _on_stopped(self):
+        # events still being decoded are pushed all the same
+        self._decoder.shutdown(wait=False)
+        super()._on_stopped()
+
+    def send(self, data, compressed=False, tag=None):
+        """
+        Queue a frame to be sent. Doesn't block, result comes as a `sent` event
+
+        :return: QueuedFrame
+        """
+        return self.queue.put(data, compressed, tag)
+
+    def send_ping(self):
+        """
+        Queue a timestamped ping, see RttMeter. Doesn't block
+
+        :return: QueuedFrame
+        """
+        return self.queue.put_ping()
+
+    def _write(self, data, compressed):
+        send(self.conn, data, compressed)
+
+    def _report(self, ev):
+        if self.recorder:
+            self.recorder.on_event(ev)
+        try:
+            self.events.push((ev, None, None))
+        except RuntimeError:
+            pass
+
+    def _push(self, ev):
+        self.rtt.on_event(ev)
+        if self.recorder:
+            self.recorder.on_event(ev)
+        with self._decode_lock:
+            self._undecoded.append(ev)
+            if self._decoding:
+                return
+            self._decoding = True
+        try:
+            self._decoder.submit(self._decode)
+        except RuntimeError:
+            # stopped at exit, after executors are
+            pass
+
+    def _decode(self):
+        """
+        Decode and push every event queued by _push, on the decoder thread
+        """
+        decode_bson = self.config.get('decode_bson', True)
+        key_path = self.config.get('correlation_key')
+        while True:
+            with self._decode_lock:
+                if not self._undecoded:
+                    self._decoding = False
+                    return
+                ev = self._undecoded.popleft()
+            try:
+                self.events.push((ev, *decode_event(ev, decode_bson, self.stats, key_path)))
+            except RuntimeError:
+                # batcher is gone together with its tab, nobody is listening anymore
+                pass
+
+
+class AsyncEngine:
+    """
+    Event loop thread shared by all AsyncConnection's
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.tasks = {}
+        self._thread = threading.Thread(target=self._run, name='sockly-engine', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        self.loop.close()
+
+    def call(self, fn, *args):
+        """
+        Call `fn` on the loop thread. Safe to call from any thread
+        """
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def start(self, connection, done=None):
+        """
+        Run `connection.run()` on the loop
+
+        :param done: Callable called on the loop thread once it is finished or cancelled
+        """
+        self.call(self._start, connection, done)
+
+    def _start(self, connection, done):
+        task = self.loop.create_task(connection.run())
+        self.tasks[connection] = task
+
+        def finished(_):
+            self.tasks.pop(connection, None)
+            if done:
+                done()
+        task.add_done_callback(finished)
+
+    def cancel(self, connection):
+        task = self.tasks.get(connection)
+        if task:
+            task.cancel()
+
+    def shutdown(self, timeout=5):
+        """
+        Close all connections gracefully and stop the loop thread
+
+        :param timeout: How long to wait for close handshakes, seconds
+        """
+        if not self._thread.is_alive():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(timeout), self.loop)
+        try:
+            future.result(timeout + 1)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+    async def _shutdown(self, timeout):
+        tasks = list(self.tasks.values())
+        for connection in list(self.tasks):
+            connection._shutdown()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+_engine = None
+
+
+def get_engine():
+    """
+    Process-wide engine, created on first use
+    """
+    global _engine
+    if _engine is None:
+        _engine = AsyncEngine()
+    return _engine
@@ -0,0 +1,74 @@
+import time
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class CaptureReplay(QObject):
+    """
+    Plays frames of a capture back on the GUI thread with their original
+    timing, reading them from disk as they become due.
+
+    Frames due at the same time are emitted with `frames` as one batch of at
+    most `cap`, like EventBatcher does for live traffic, so replay loads the
+    output the way the original connection did.
+
+    :param reader: CaptureReader
+    :param speed: Gaps are divided by this, 0 for replaying as fast as possible
+    :param cap: Maximum number of frames per batch
+    """
+    frames = pyqtSignal(list)
+    finished = pyqtSignal()
+
+    def __init__(self, reader, speed=1, cap=1000):
+        super().__init__()
+        self.reader = reader
+        self.speed = speed
+        self.cap = cap or 1000
+        self.count = 0
+        self._frames = None
+        self._next = None
+        self._first = None
+        self._started = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._tick)
+
+    @property
+    def running(self):
+        return self._frames is not None
+
+    def start(self):
+        self._frames = iter(self.reader)
+        self._next = next(self._frames, None)
+        self._first = self._next.time if self._next else 0
+        self._started = time.monotonic()
+        self._tick()
+
+    def stop(self):
+        self._timer.stop()
+        if self._frames is not None:
+            self._frames.close()
+            self._frames = None
+            self.finished.emit()
+
+    def _due(self, frame):
+        """
+        Seconds until the frame is due, negative if it is late
+        """
+        if not self.speed:
+            return 0
+        return (frame.time - self._first) / self.speed - (time.monotonic() - self._started)
+
+    def _tick(self):
+        if self._frames is None:
+            return
+        batch = []
+        while self._next is not None and len(batch) < self.cap and self._due(self._next) <= 0:
+            batch.append(self._next)
+            self._next = next(self._frames, None)
+        if batch:
+            self.count += len(batch)
+            self.frames.emit(batch)
+        if self._next is None:
+            self.stop()
+        else:
+            self._timer.start(max(0, int(self._due(self._next) * 1000)))
@@ -0,0 +1,59 @@
+from collections import deque
+from threading import Lock
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class EventBatcher(QObject):
+    """
+    Thread-safe queue coalescing worker events into batches.
+
+    Events are pushed from the worker thread and emitted with `flushed` on
+    the thread batcher lives in (GUI thread), at most once per `interval` ms
+    and at most `cap` events per batch. Full batches are flushed right away.
+    """
+    flushed = pyqtSignal(list)
+    _wakeup = pyqtSignal()
+
+    def __init__(self, interval=16, cap=1000):
+        super().__init__()
+        self.interval = interval
+        self.cap = cap
+        self._events = deque()
+        self._lock = Lock()
+        self._scheduled = False
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self._wakeup.connect(self._schedule)
+
+    def __len__(self):
+        return len(self._events)
+
+    def push(self, ev):
+        """
+        Queue an event. Safe to call from any thread
+        """
+        with self._lock:
+            self._events.append(ev)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._wakeup.emit()
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start(self.interval)
+
+    def flush(self):
+        """
+        Emit queued events (up to `cap`) as one batch
+        """
+        with self._lock:
+            n = min(self.cap, len(self._events)) if self.cap else len(self._events)
+            batch = [self._events.popleft() for _ in range(n)]
+            more = bool(self._events)
+            self._scheduled = more
+        if more:
+            self._timer.start(0)
+        if batch:
+            self.flushed.emit(batch)
@@ -0,0 +1,170 @@
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtGui import QTextLayout
+
+
+class InputHighlighter(QObject):
+    """
+    Highlights an editable QPlainTextEdit while it is being typed in.
+
+    Formats are set on block layouts instead of editing char formats, so
+    highlighting neither touches the undo stack nor emits text changes.
+    Every edit re-highlights only the touched blocks and a few around them,
+    the whole text is re-highlighted once typing pauses, a chunk of blocks
+    per event loop iteration.
+
+    :param editor: QPlainTextEdit
+    :param highlighter: TokenHighlighter, its spans must not overlap
+    """
+    # blocks around the edited ones tokenized with them
+    CONTEXT_BLOCKS = 2
+    # edits touching more blocks or characters (e.g. pasting a file, or typing
+    # in a huge single-line document) wait for the full pass
+    INCREMENTAL_BLOCKS = 200
+    INCREMENTAL_CHARS = 65536
+    # ms since the last edit before the full pass starts
+    FULL_PASS_DELAY = 500
+    # blocks highlighted by the full pass per event loop iteration
+    FULL_PASS_CHUNK = 2000
+
+    def __init__(self, editor, highlighter):
+        super().__init__(editor)
+        self.editor = editor
+        self.highlighter = highlighter
+        self.enabled = False
+        self._applying = False
+        self._pass = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._start_full_pass)
+        editor.document().contentsChange.connect(self._on_contents_change)
+
+    def set_enabled(self, enabled):
+        enabled = bool(enabled)
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        self._pass = None
+        if enabled:
+            self._timer.start(0)
+        else:
+            self._timer.stop()
+            block = self.editor.document().firstBlock()
+            while block.isValid():
+                if block.userState() != -1:
+                    self._apply(block, [], True)
+                    block.setUserState(-1)
+                block = block.next()
+
+    def _on_contents_change(self, position, removed, added):
+        if not self.enabled or self._applying:
+            return
+        doc = self.editor.document()
+        first = doc.findBlock(position)
+        last = doc.findBlock(position + added)
+        if not last.isValid():
+            last = doc.lastBlock()
+        self._timer.start(self.FULL_PASS_DELAY)
+        touched = range(first.blockNumber(), last.blockNumber() + 1)
+        for _ in range(self.CONTEXT_BLOCKS):
+            if first.previous().isValid():
+                first = first.previous()
+            if last.next().isValid():
+                last = last.next()
+        start = first.position()
+        if len(touched) > self.INCREMENTAL_BLOCKS or \
+                last.position() + last.length() - start > self.INCREMENTAL_CHARS:
+            # blocks kept by the edit may still have formats of their old text
+            doc.findBlock(position).setUserState(-1)
+            doc.findBlock(position + added).setUserState(-1)
+            return
+        text = self._text(first, last)
+        runs = iter(self.highlighter.spans(text))
+        run = next(runs, None)
+        block = first
+        while True:
+            ranges, run = self._block_runs(block, start, runs, run)
+            self._apply(block, ranges, block.blockNumber() in touched)
+            if block == last:
+                break
+            block = block.next()
+
+    @staticmethod
+    def _text(first, last):
+        parts = []
+        block = first
+        while True:
+            parts.append(block.text())
+            if block == last:
+                return '\n'.join(parts)
+            block = block.next()
+
+    @staticmethod
+    def _block_runs(block, offset, runs, run):
+        """
+        Take runs covering `block` from `runs`
+
+        :param offset: Position of the tokenized text in the document
+        :param run: Current run, taken from `runs` before
+        :return: Tuple of (start, end, format) list relative to the block and the current run
+        """
+        start = block.position() - offset
+        end = start + block.length() - 1
+        ranges = []
+        while run is not None:
+            s, e, fmt = run
+            if s >= end:
+                break
+            if e > start:
+                ranges.append((max(s, start) - start, min(e, end) - start, fmt))
+            if e > end:
+                # continues on the next block
+                break
+            run = next(runs, None)
+        return ranges, run
+
+    def _apply(self, block, ranges, force=False):
+        """
+        Set formats on block's layout. Its user state keeps a hash of formats
+        last set, so unchanged blocks aren't laid out again
+        """
+        state = hash(tuple((s, e, id(fmt)) for s, e, fmt in ranges)) & 0x7fffffff
+        if not force and block.userState() == state:
+            return
+        block.setUserState(state)
+        formats = []
+        for s, e, fmt in ranges:
+            r = QTextLayout.FormatRange()
+            r.start, r.length, r.format = s, e - s, fmt
+            formats.append(r)
+        self._applying = True
+        try:
+            block.layout().setFormats(formats)
+            block.document().markContentsDirty(block.position(), block.length())
+        finally:
+            self._applying = False
+
+    def _start_full_pass(self):
+        if not self.enabled:
+            return
+        doc = self.editor.document()
+        runs = iter(self.highlighter.spans(doc.toPlainText()))
+        self._pass = [doc.revision(), doc.firstBlock(), runs, next(runs, None)]
+        self._full_pass_chunk()
+
+    def _full_pass_chunk(self):
+        if self._pass is None:
+            return
+        revision, block, runs, run = self._pass
+        if revision != self.editor.document().revision():
+            # edited meanwhile, a new pass is scheduled by the edit
+            self._pass = None
+            return
+        for _ in range(self.FULL_PASS_CHUNK):
+            if not block.isValid():
+                self._pass = None
+                return
+            ranges, run = self._block_runs(block, 0, runs, run)
+            self._apply(block, ranges)
+            block = block.next()
+        self._pass = [revision, block, runs, run]
+        QTimer.singleShot(0, self._full_pass_chunk)
@@ -1,32 +1,145 @@
-from PyQt5.QtCore import QThread, pyqtSignal
+import time
+from threading import Event, Thread, Timer
+
+from PyQt5 import sip
+from PyQt5.QtCore import QThread
 import lomond
-from lomond.persist import persist
+from sockly.utils.EventBatcher import EventBatcher
+from sockly.utils.connection import create_connection, send
+from sockly.utils.decoding import decode_event
+from sockly.utils.rtt import RttMeter
+from sockly.utils.send_queue import SendQueue
 
 
 class SocketThread(QThread):
-    signal = pyqtSignal(lomond.websocket.events.Event)
+    # ms the server is given to answer the close before the socket is dropped
+    SHUTDOWN_TIMEOUT = 2000
+    # ms stop_all() waits for workers at exit
+    EXIT_TIMEOUT = 500
+    # workers shut down but not finished yet, deleting a running QThread aborts the process
+    _stopping_workers = set()
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, stats=None):
         super().__init__()
         self.conn: lomond.WebSocket = None
         self.config = config
+        self.stats = stats
+        self.rtt = RttMeter()
+        self.recorder = None
+        self.events = EventBatcher(config.get('flush_interval', 16), config.get('batch_cap', 1000))
+        self.queue = SendQueue(self._write, self._report, ping=lambda: self.rtt.ping(self.conn))
+        self._sender = None
+        self._stopping = Event()
+        # whether the connection is upgraded, lomond's is_active is true before that too
+        self._ready = False
 
     def run(self):
-        self.conn = lomond.WebSocket(self.config['url'], proxies={
-            'http': self.config['proxy'],
-            'https': self.config['proxy']
-        } if self.config['proxy'] else None, compress=self.config['compress'])
-        for k, v in self.config['headers'].items():
-            self.conn.add_header(k.encode(), v.encode())
-        conn = persist(self.conn) if self.config['persist'] else self.conn
-        for ev in conn:
-            self.signal.emit(ev)
-
-    def send(self, data, compressed=False):
-        if type(data) is bytes:
-            self.conn.send_binary(data, compress=compressed)
-        else:
-            self.conn.send_text(data, compress=compressed)
+        self.conn, events = create_connection(self.config, self._stopping)
+        # lomond's event iterator blocks in the socket, so frames are written by a sender thread of their own
+        self._sender = Thread(target=self._send, name='sockly-sender', daemon=True)
+        self._sender.start()
+        for ev in events:
+            if ev.name in ('ready', 'disconnected'):
+                self._ready = ev.name == 'ready'
+            if self._stopping.is_set():
+                # stopped for good, frames still coming until the server answers the close aren't wanted
+                if ev.name in ('disconnected', 'back_off'):
+                    break
+                if ev.name in ('connected', 'ready'):
+                    # shut down while connecting, there's nothing to close gracefully
+                    self.drop()
+                continue
+            self.rtt.on_event(ev)
+            if self.recorder:
+                self.recorder.on_event(ev)
+            self.events.push((ev, *self.decode(ev)))
+        self.queue.close()
+
+    def _send(self):
+        self.queue.run()
+        if self._stopping.is_set() and self._ready and self.conn.is_active:
+            # closed here rather than by shutdown(), as it waits for the frame being written
+            self.conn.close()
+
+    def decode(self, ev):
+        """
+        Decode data frame into a ready-to-display message, so GUI thread doesn't have to
+
+        :param ev: lomond event
+        :return: Tuple of SocketMessage and correlation key, see decode_event
+        """
+        return decode_event(ev, self.config.get('decode_bson', True), self.stats, self.config.get('correlation_key'))
+
+    def send(self, data, compressed=False, tag=None):
+        """
+        Queue a frame to be sent. Doesn't block, result comes as a `sent` event
+
+        :return: QueuedFrame
+        """
+        return self.queue.put(data, compressed, tag)
+
+    def send_ping(self):
+        """
+        Queue a timestamped ping, see RttMeter. Doesn't block
+
+        :return: QueuedFrame
+        """
+        return self.queue.put_ping()
+
+    def _write(self, data, compressed):
+        send(self.conn, data, compressed)
+
+    def _report(self, ev):
+        if self.recorder:
+            self.recorder.on_event(ev)
+        self.events.push((ev, None, None))
 
     def close(self, code=1000, reason='goodbye'):
         self.conn.close(code, reason)
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Stop the worker for good: close the connection gracefully and stop reconnecting.
+        Doesn't block, the worker is kept until its thread finishes. If the server doesn't
+        answer the close within `timeout` ms, the socket is dropped. A thread still in
+        connect() finishes once it times out
+        """
+        self._stopping.set()
+        # wakes the sender up, which then closes the connection
+        self.queue.close()
+        if not self.isRunning():
+            return
+        SocketThread._stopping_workers.add(self)
+        self.finished.connect(self._on_finished)
+        if self.isFinished():
+            return self._on_finished()
+        # dropping the socket waits for the frame being written, so not on the caller's thread
+        timer = Timer(timeout / 1000 if self._ready else 0, self.drop)
+        timer.daemon = True
+        timer.start()
+
+    def _on_finished(self):
+        SocketThread._stopping_workers.discard(self)
+
+    def drop(self):
+        """
+        Shut the socket down, which wakes lomond's loop up
+        """
+        if self.conn and self.conn.session:
+            self.conn.session.close()
+
+    @classmethod
+    def stop_all(cls, timeout=EXIT_TIMEOUT):
+        """
+        At exit: drop sockets of workers still being shut down and wait for them, `timeout` ms
+        in total. Workers still in connect() after that are never deleted, they end with the process
+        """
+        workers = list(cls._stopping_workers)
+        for worker in workers:
+            timer = Timer(0, worker.drop)
+            timer.daemon = True
+            timer.start()
+        deadline = time.monotonic() + timeout / 1000
+        for worker in workers:
+            if not worker.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+                sip.transferto(worker, None)
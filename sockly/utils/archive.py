@@ -0,0 +1,95 @@
+"""
+Full-text message archive.
+
+Messages shown in tabs with archiving enabled are written into FTS5-indexed
+`messages` table of SocklyDB, so they can be searched across tabs and past
+sessions. Writes happen on a dedicated thread in batched transactions, only
+the latest MAX_MESSAGES messages are kept.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from sockly.utils.database import get_database
+from sockly.utils.hexdump import HexdumpLines
+
+SESSION_ID = os.urandom(16).hex()
+
+
+def message_text(item):
+    """
+    Text of the message to be indexed. Binary frames are indexed as hex bytes
+    """
+    if isinstance(item.lines, HexdumpLines):
+        return item.lines.data.hex()
+    return '\n'.join(item.lines)
+
+
+class MessageArchive:
+    BATCH_SIZE = 5000
+    MAX_MESSAGES = 500000
+
+    def __init__(self, database=None):
+        self.database = database or get_database()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='sockly-archive', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, tab, url, item, timestamp=None):
+        """
+        Queue a message for archiving. Cheap, the text is built on the writer thread
+
+        :param tab: Tab name
+        :param url: Connection URL
+        :param item: SocketMessage
+        :param timestamp: Unix time of the message, now by default
+        """
+        self._queue.put((tab, url, item, timestamp or time.time()))
+
+    def close(self):
+        """
+        Write out everything queued and stop the writer
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(5)
+
+    def _run(self):
+        self.database.prune_messages(self.MAX_MESSAGES)
+        # pruned once in a while, so the archive stays within about 10% over the limit
+        unpruned = 0
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = batch[:batch.index(None)]
+            if batch:
+                self.database.archive_messages([
+                    (SESSION_ID, tab, url, item.type.value, item.content.value, timestamp, message_text(item))
+                    for tab, url, item, timestamp in batch
+                ])
+                unpruned += len(batch)
+                if unpruned >= self.MAX_MESSAGES // 10:
+                    self.database.prune_messages(self.MAX_MESSAGES)
+                    unpruned = 0
+
+
+_archive = None
+
+
+def get_archive():
+    """
+    Process-wide message archive, created on first use
+    """
+    global _archive
+    if _archive is None:
+        _archive = MessageArchive()
+    return _archive
@@ -0,0 +1,221 @@
+"""
+Traffic captures: every frame of a connection with the monotonic time it
+arrived at (or was sent at), for replaying an incident later.
+
+Capture file layout (all integers are little-endian):
+  MAGIC
+  <header length: u32> <JSON header>
+  frame records, each: <direction: u8> <opcode: u8> <time: f64> <length: u32> <payload>
+
+Direction is MessageTypes value, opcode is 1 for text frames and 2 for
+binary ones, time is seconds since the capture started. Records are only
+appended, so a capture cut short (e.g. by a crash) is still readable up to
+its last complete record. Captures are read sequentially, never as a whole.
+"""
+import asyncio
+import json
+import struct
+import time
+from collections import namedtuple
+from threading import Lock
+
+from lomond.errors import WebSocketError
+from sockly.structs import MessageTypes
+from sockly.utils.connection import send
+
+MAGIC = b'SOCKCAP\x01'
+RECORD = struct.Struct('<BBdI')
+TEXT = 1
+BINARY = 2
+
+CapturedFrame = namedtuple('CapturedFrame', 'direction time payload')
+
+
+class CaptureWriter:
+    """
+    Appends frames to a capture file. Safe to use from any thread
+
+    :param filename: Capture file name, overwritten
+    :param header: JSON-serializable dict describing the capture, e.g. URL
+    """
+    def __init__(self, filename, header):
+        self.filename = filename
+        self.count = 0
+        self.started = time.monotonic()
+        self._lock = Lock()
+        self._file = open(filename, 'wb')
+        header = json.dumps(dict(header, started=time.time())).encode()
+        self._file.write(MAGIC + struct.pack('<I', len(header)) + header)
+
+    def record(self, direction, payload, timestamp=None):
+        """
+        :param direction: MessageTypes.INCOMING or MessageTypes.OUTGOING
+        :param payload: `str` for text frames, `bytes` for binary ones
+        :param timestamp: time.monotonic() the frame arrived or was sent at, now by default
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if type(payload) is bytes:
+            opcode = BINARY
+        else:
+            opcode = TEXT
+            payload = payload.encode()
+        record = RECORD.pack(direction.value, opcode, timestamp - self.started, len(payload)) + payload
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(record)
+            self.count += 1
+
+    def on_event(self, ev):
+        """
+        Feed a lomond event or FrameSent, on the network thread, so frame times aren't delayed by GUI.
+        Outgoing frames are recorded once written, at the time their write started
+        """
+        if ev.name == 'text':
+            self.record(MessageTypes.INCOMING, ev.text)
+        elif ev.name == 'binary':
+            self.record(MessageTypes.INCOMING, bytes(ev.data))
+        elif ev.name == 'sent' and not ev.frame.error and not ev.frame.ping:
+            # frame times are time.time(), the write has just completed, so the offset is tiny
+            self.record(MessageTypes.OUTGOING, ev.frame.payload,
+                        time.monotonic() - (time.time() - ev.frame.write_started))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class CaptureReader:
+    """
+    Lazy read-only sequence of frames stored in a capture file
+
+    :param filename: Capture file name
+    :raises ValueError: If the file is not a capture
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('not a Sockly capture')
+            try:
+                size, = struct.unpack('<I', f.read(4))
+                self.header = json.loads(f.read(size).decode())
+            except (struct.error, UnicodeDecodeError, ValueError):
+                raise ValueError('capture header is broken')
+            self._start = f.tell()
+
+    def __iter__(self):
+        with open(self.filename, 'rb') as f:
+            f.seek(self._start)
+            while True:
+                head = f.read(RECORD.size)
+                if len(head) < RECORD.size:
+                    return
+                direction, opcode, timestamp, size = RECORD.unpack(head)
+                payload = f.read(size)
+                if len(payload) < size:
+                    return
+                if opcode == TEXT:
+                    payload = payload.decode(errors='replace')
+                yield CapturedFrame(MessageTypes(direction), timestamp, payload)
+
+
+class CaptureSender:
+    """
+    Re-sends outgoing frames of a capture to a server with their original gaps.
+    Replies are counted, not decoded
+
+    :param config: Worker config, see SocklyTab._create_worker_config
+    :param reader: CaptureReader
+    :param speed: Gaps are divided by this, 0 for sending as fast as possible
+    :param compress: Whether messages should be compressed
+    """
+    # how many messages are sent at most before letting other tasks run
+    BURST = 256
+
+    def __init__(self, config, reader, speed=1, compress=False, engine=None):
+        # only replaying needs the engine, recording and reading captures don't
+        from sockly.utils.AsyncEngine import get_engine
+        from sockly.utils.load_generator import LoadConnection
+
+        self.engine = engine or get_engine()
+        self.connection = LoadConnection(dict(config, persist=False), self)
+        self.reader = reader
+        self.speed = speed
+        self.compress = compress
+        self._stopping = False
+        self.finished = False
+        self.sent = 0
+        self.replies = 0
+        self.errors = 0
+        self.last_error = None
+
+    def start(self):
+        self.connection.start()
+        self.engine.start(self)
+
+    def stop(self):
+        """
+        Stop sending and close the connection. Doesn't block
+        """
+        self.engine.call(self._shutdown)
+
+    def _shutdown(self):
+        self._stopping = True
+        self.connection._shutdown()
+
+    @property
+    def running(self):
+        return not self._stopping and not self.finished
+
+    def on_event(self, connection, ev):
+        if ev.name == 'ready':
+            connection.ready = True
+        elif ev.name in ('text', 'binary'):
+            self.replies += 1
+        elif ev.name in ('connect_fail', 'rejected'):
+            self._error(ev.reason)
+        elif ev.name == 'disconnected':
+            connection.ready = False
+            if not ev.graceful and not self._stopping:
+                self._error(ev.reason)
+
+    def _error(self, reason):
+        self.errors += 1
+        self.last_error = reason
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while not self.connection.ready:
+            if self._stopping or self.connection not in self.engine.tasks:
+                self.finished = True
+                return
+            await asyncio.sleep(0.01)
+        started = loop.time()
+        first = None
+        for frame in self.reader:
+            if self._stopping or not self.connection.ready:
+                break
+            if frame.direction != MessageTypes.OUTGOING:
+                continue
+            if first is None:
+                first = frame.time
+            if self.speed:
+                delay = (frame.time - first) / self.speed - (loop.time() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif self.sent % self.BURST == self.BURST - 1:
+                await asyncio.sleep(0)
+            try:
+                send(self.connection.conn, frame.payload, self.compress)
+            except WebSocketError as error:
+                self._error(str(error))
+                continue
+            self.sent += 1
+        self.finished = True
+
+    def summary(self):
+        return '{}sent {}, {} replies, {} errors{}'.format(
+            'done, ' if self.finished else '', self.sent, self.replies, self.errors,
+            ' (last: {})'.format(self.last_error) if self.last_error else '')
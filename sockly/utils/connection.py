@@ -0,0 +1,46 @@
+import lomond
+from lomond.persist import persist
+
+
+def create_websocket(config):
+    """
+    Create lomond WebSocket (not connected yet) from a worker config.
+
+    Config keys: url, headers (dict), proxy (or None), compress
+
+    :param config: Worker config, see SocklyTab._create_worker_config
+    """
+    ws = lomond.WebSocket(config['url'], proxies={
+        'http': config['proxy'],
+        'https': config['proxy']
+    } if config['proxy'] else None, compress=config['compress'])
+    for k, v in config['headers'].items():
+        ws.add_header(k.encode(), v.encode())
+    return ws
+
+
+def create_connection(config, exit_event=None):
+    """
+    Create lomond WebSocket from a worker config and connect it.
+
+    Config keys are those of `create_websocket` plus persist
+    and optional poll and ping_rate (seconds)
+
+    :param config: Worker config, see SocklyTab._create_worker_config
+    :param exit_event: threading.Event stopping reconnects once set
+    :return: Tuple of WebSocket and its events iterator
+    """
+    ws = create_websocket(config)
+    kwargs = {k: config[k] for k in ('poll', 'ping_rate') if config.get(k) is not None}
+    events = persist(ws, exit_event=exit_event, **kwargs) if config['persist'] else ws.connect(**kwargs)
+    return ws, events
+
+
+def send(ws, data, compressed=False):
+    """
+    Send text (`str`) or binary (`bytes`) frame
+    """
+    if type(data) is bytes:
+        ws.send_binary(data, compress=compressed)
+    else:
+        ws.send_text(data, compress=compressed)
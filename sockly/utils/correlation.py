@@ -0,0 +1,169 @@
+"""
+Request/response correlation for JSON-RPC style protocols.
+
+A key (e.g. `id`) is extracted from every outgoing and incoming JSON/BSON
+message, a reply is the first incoming message carrying the key of a pending
+request. Requests not answered within the timeout are flagged. A request
+whose key is still pending is counted as a duplicate and not tracked, the
+pending one keeps waiting for its reply.
+
+Latency counts from when the request was written to the socket, not from
+when it was queued, if the request is registered with its QueuedFrame.
+"""
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from sockly.utils.rtt import percentile
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+# upper bounds of histogram buckets, seconds
+BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, float('inf'))
+
+
+def parse_key_path(text):
+    """
+    Parse dotted key path, e.g. `params.0.id`. Numeric parts index lists
+    """
+    return [int(part) if part.lstrip('-').isdigit() else part for part in text.strip().split('.') if part]
+
+
+def extract_key(value, path):
+    """
+    Get value at `path` from decoded message
+
+    :return: Hashable key or None if message has no such key
+    """
+    if not path:
+        return None
+    for part in path:
+        if isinstance(value, dict):
+            if type(part) is int:
+                part = str(part)
+            if part not in value:
+                return None
+            value = value[part]
+        elif isinstance(value, list) and type(part) is int:
+            if not -len(value) <= part < len(value):
+                return None
+            value = value[part]
+        else:
+            return None
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def sent_time(sent):
+    """
+    :param sent: Unix time, or QueuedFrame
+    :return: Unix time the frame write started at, or it was queued at if not written yet
+    """
+    if isinstance(sent, (int, float)):
+        return sent
+    return sent.write_started if sent.write_started is not None else sent.enqueued
+
+
+def format_latency(seconds):
+    if seconds < 1:
+        return '{:.1f}ms'.format(seconds * 1000)
+    return '{:.2f}s'.format(seconds)
+
+
+class Correlator:
+    """
+    Matches replies to requests by key and keeps latency distribution
+
+    :param key_path: Key path, see parse_key_path
+    :param timeout: Seconds after which request without reply is considered unanswered
+    :param window: Number of latest latencies kept for the distribution
+    """
+    WINDOW = 10000
+
+    def __init__(self, key_path='id', timeout=10, window=WINDOW):
+        self.path = parse_key_path(key_path)
+        self.timeout = timeout
+        self.latencies = deque(maxlen=window)
+        self.pending = OrderedDict()
+        self.answered = 0
+        self.unanswered = 0
+        self.duplicates = 0
+
+    def reset(self):
+        self.latencies.clear()
+        self.pending.clear()
+        self.answered = 0
+        self.unanswered = 0
+        self.duplicates = 0
+
+    def request(self, value, index, sent):
+        """
+        Register outgoing message
+
+        :param value: Decoded message
+        :param index: Message index in the output
+        :param sent: Unix time the message was sent at, or its QueuedFrame, see sent_time
+        :return: Whether message is tracked, False if it carries no key or is a duplicate
+        """
+        key = extract_key(value, self.path)
+        if key is None:
+            return False
+        if key in self.pending:
+            self.duplicates += 1
+            return False
+        self.pending[key] = (index, sent)
+        return True
+
+    def response(self, key, timestamp):
+        """
+        Match incoming message to a pending request
+
+        :param key: Key of the message, see extract_key
+        :param timestamp: Unix time the message was received at
+        :return: Tuple of request message index and latency in seconds, or None
+        """
+        if key is None or key not in self.pending:
+            return None
+        index, sent = self.pending.pop(key)
+        latency = max(0.0, timestamp - sent_time(sent))
+        self.latencies.append(latency)
+        self.answered += 1
+        return index, latency
+
+    def expire(self, now):
+        """
+        Flag requests pending for longer than timeout as unanswered
+
+        :param now: Current Unix time
+        :return: List of message indices of expired requests
+        """
+        ret = []
+        while self.pending:
+            key, (index, sent) = next(iter(self.pending.items()))
+            if now - sent_time(sent) < self.timeout:
+                break
+            del self.pending[key]
+            self.unanswered += 1
+            ret.append(index)
+        return ret
+
+    def histogram(self):
+        """
+        :return: List of counts per BUCKETS
+        """
+        ret = [0] * len(BUCKETS)
+        for latency in self.latencies:
+            ret[bisect_left(BUCKETS, latency)] += 1
+        return ret
+
+    def summary(self):
+        values = sorted(self.latencies)
+        ret = {'answered': self.answered, 'unanswered': self.unanswered, 'pending': len(self.pending),
+               'duplicates': self.duplicates}
+        for key, p in (('min', 0), ('p50', 50), ('p90', 90), ('p99', 99), ('max', 100)):
+            ret[key] = percentile(values, p) if values else None
+        return ret
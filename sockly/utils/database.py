@@ -1,23 +1,53 @@
+import atexit
 import os
 import os.path
+import sys
+from threading import Lock, Timer
 from sockly.utils.db_versions import DB_VERSIONS
 from sockly.utils.sqlite import Database
-from platform import system as __platform
-platform = __platform()
 
 
 def _db_path():
-    if platform == 'Windows':
+    if sys.platform == 'win32':
         return os.path.join(os.environ['APPDATA'], 'sockly.db')
-    elif platform == 'Linux':
+    elif sys.platform.startswith('linux'):
         return os.path.expanduser('~/.config/sockly.db')
     else:
         return os.path.expanduser('~/sockly.db')
 
 
 class SocklyDB(Database):
-    def __init__(self, path=_db_path(), v=1):
+    """
+    Settings are read from an in-memory cache, loaded with the first read.
+    Writes go to the cache right away and to disk in one transaction
+    `FLUSH_INTERVAL` seconds later (and at exit), so a burst of writes,
+    e.g. while dragging a splitter, costs a single commit.
+
+    Messages spilled by MessageStore's go to a temp table: it is private to the
+    process, kept on disk by SQLite and gone with the connection, so nothing is
+    left behind by closed tabs, exited or crashed processes.
+
+    Use `get_database()` instead of creating instances
+    """
+    FLUSH_INTERVAL = 1
+
+    def __init__(self, path=_db_path(), v=4):
         super().__init__(path, v, DB_VERSIONS)
+        self.query('create temp table spilled_messages (store text, idx integer, type integer, content integer, '
+                   'payload blob)')
+        self.query('create unique index temp.spilled_messages_uindex on spilled_messages (store, idx)')
+        self._config = None
+        self._blobs = None
+        self._pending = {}
+        self._pending_blobs = {}
+        self._pending_lock = Lock()
+        self._flush_timer = None
+        atexit.register(self.flush)
+
+    def _load_config(self):
+        if self._config is None:
+            self._config = {row['k']: row['v'] for row in self.query('select k, v from config')}
+            self._blobs = {row['k']: bytes(row['v']) for row in self.query('select k, v from config_blobs')}
 
     def get_int(self, key, default=0):
         ret = self.get(key, None)
@@ -32,21 +62,123 @@ class SocklyDB(Database):
         self.set(key, int(value))
 
     def get_blob(self, key, default=b''):
-        ret = self.query('select v from config_blobs where k = ?', str(key))
-        if not ret:
-            return default
-        return bytes(ret[0]['v'])
+        self._load_config()
+        return self._blobs.get(str(key), default)
 
     def set_blob(self, key, value):
-        self.query('insert into config_blobs (k, v) values (?, ?) on conflict(k) do update set v = excluded.v',
-                   str(key), value)
+        self._load_config()
+        key, value = str(key), bytes(value)
+        if self._blobs.get(key) == value:
+            return
+        self._blobs[key] = value
+        with self._pending_lock:
+            self._pending_blobs[key] = value
+            self._schedule_flush()
 
     def get(self, key, default=None):
-        ret = self.query('select v from config where k = ?', str(key))
-        if not ret:
-            return default
-        return ret[0]['v']
+        self._load_config()
+        return self._config.get(str(key), default)
 
     def set(self, key, value):
-        self.query('insert into config (k, v) values (?, ?) on conflict(k) do update set v = excluded.v',
-                   str(key), str(value))
+        self._load_config()
+        key, value = str(key), str(value)
+        if self._config.get(key) == value:
+            return
+        self._config[key] = value
+        with self._pending_lock:
+            self._pending[key] = value
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = Timer(self.FLUSH_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """
+        Write pending settings to disk in one transaction
+        """
+        with self._pending_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            pending, self._pending = self._pending, {}
+            pending_blobs, self._pending_blobs = self._pending_blobs, {}
+        if not pending and not pending_blobs:
+            return
+        with self.lock:
+            conn, cur = self._prepare_connection()
+            cur.executemany('insert into config (k, v) values (?, ?) on conflict(k) do update set v = excluded.v',
+                            pending.items())
+            cur.executemany('insert into config_blobs (k, v) values (?, ?) '
+                            'on conflict(k) do update set v = excluded.v', pending_blobs.items())
+            conn.commit()
+
+    def spill_messages(self, rows):
+        """
+        Store messages evicted from memory in one transaction
+
+        :param rows: Iterable of (store, idx, type, content, payload) tuples
+        """
+        self.query_many('insert or replace into spilled_messages (store, idx, type, content, payload) '
+                        'values (?, ?, ?, ?, ?)', rows)
+
+    def load_messages(self, store, start, stop):
+        return self.query('select idx, payload from spilled_messages where store = ? and idx >= ? and idx < ? '
+                          'order by idx', store, start, stop)
+
+    def drop_messages(self, store):
+        self.query('delete from spilled_messages where store = ?', store)
+
+    def archive_messages(self, rows):
+        """
+        Add messages to full-text archive in one transaction
+
+        :param rows: Iterable of (session, tab, url, direction, content, time, body) tuples
+        """
+        self.query_many('insert into messages (session, tab, url, direction, content, time, body) '
+                        'values (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def prune_messages(self, keep, chunk=10000):
+        """
+        Delete archived messages but the latest `keep`, oldest first, in transactions
+        of `chunk` messages so other threads don't wait for the whole deletion
+
+        :return: Number of deleted messages
+        """
+        bounds = self.query('select min(id) as first, max(id) as last from messages', one=True)
+        if bounds['last'] is None:
+            return 0
+        cutoff = bounds['last'] - keep
+        deleted = 0
+        for start in range(bounds['first'], cutoff + 1, chunk):
+            self.query('delete from messages where id >= ? and id < ?', start, min(start + chunk, cutoff + 1))
+            deleted += self.query('select changes() as n', one=True)['n']
+        return deleted
+
+    def search_messages(self, text, limit=200):
+        """
+        Find archived messages containing `text`, newest first
+        """
+        phrase = '"' + text.replace('"', '""') + '"'
+        return self.query('select m.id, m.session, m.tab, m.url, m.direction, m.content, m.time, '
+                          "snippet(messages_fts, 0, '[', ']', '...', 12) as snippet "
+                          'from messages_fts join messages m on m.id = messages_fts.rowid '
+                          'where messages_fts match ? order by messages_fts.rowid desc limit ?', phrase, limit)
+
+    def archived_message(self, id_):
+        return self.query('select * from messages where id = ?', id_, one=True)
+
+
+_database = None
+
+
+def get_database():
+    """
+    Process-wide SocklyDB, created on first use
+    """
+    global _database
+    if _database is None:
+        _database = SocklyDB()
+    return _database
@@ -4,5 +4,19 @@ DB_VERSIONS = {
         'create unique index config_uindex on config (k)',
         'create table config_blobs (k text, v blob)',
         'create unique index config_blobs_uindex on config_blobs (k)'
-    ]
-}
\ No newline at end of file
+    ],
+    # spilled messages are kept in a temp table, see SocklyDB
+    2: [],
+    # idempotent, as older builds may have reset the version and run it again
+    3: [
+        'create table if not exists messages (id integer primary key, session text, tab text, url text, '
+        'direction integer, content integer, time real, body text)',
+        "create virtual table if not exists messages_fts using fts5(body, content='messages', content_rowid='id')",
+        'create trigger if not exists messages_ai after insert on messages begin '
+        'insert into messages_fts (rowid, body) values (new.id, new.body); end',
+        'create trigger if not exists messages_ad after delete on messages begin '
+        "insert into messages_fts (messages_fts, rowid, body) values ('delete', old.id, old.body); end"
+    ],
+    # kept so that databases already upgraded to 4 don't skip the next version
+    4: []
+}
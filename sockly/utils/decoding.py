@@ -0,0 +1,224 @@
+"""
+Encoding, decoding and pretty-printing of WebSocket frames.
+
+Doesn't touch any widgets, so it is safe to run off the GUI thread
+and without a display. bson and base64 are imported on first use
+"""
+import time
+from collections.abc import Sequence
+
+from sockly.structs import SocketMessage, MessageTypes, MessageContent
+from sockly.utils.correlation import extract_key
+from sockly.utils.hexdump import HexdumpLines
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+SEND_MODES = (
+    'plain_text',
+    'binary',
+    'hex',
+    'base64',
+    'json',
+    'bson',
+)
+
+
+def decode_data(data, decode_bson=True):
+    """
+    Decode frame payload
+
+    :param data: `str` for text frames, `bytes` for binary ones
+    :param decode_bson: Whether binary frames should be tried as BSON
+    :return: Tuple of decoded value and MessageContent
+    """
+    if type(data) is bytes:
+        if decode_bson:
+            import bson
+            try:
+                return bson.loads(data), MessageContent.BSON
+            except:
+                pass
+        return data, MessageContent.BINARY
+    try:
+        return json.loads(data), MessageContent.JSON
+    except:
+        return data, MessageContent.PLAIN
+
+
+class PayloadLines(Sequence):
+    """
+    Display lines of a text or BSON frame, derived from its payload on access.
+
+    Line count and width are known upfront, so a message can be laid out
+    without keeping its lines around: MessageStore retains only the payload
+    and re-creates lines of messages that are actually looked at
+
+    :param payload: Frame payload (`str` or `bytes`) or display text
+    :param content: MessageContent the payload was decoded as
+    :param lines: Already derived lines, if any
+    :param pretty: Whether payload is a frame to be pretty-printed according
+                   to `content` or display text to be just split into lines
+    :param shape: Tuple of line count and width, if known
+    """
+    __slots__ = ('payload', 'content', 'pretty', 'count', 'width', '_lines')
+
+    def __init__(self, payload, content, lines=None, pretty=True, shape=None):
+        self.payload = payload
+        self.content = content
+        self.pretty = pretty
+        self._lines = lines
+        if shape is None:
+            lines = self.lines()
+            shape = len(lines), max(map(len, lines), default=0)
+        self.count, self.width = shape
+
+    def __reduce__(self):
+        return PayloadLines, (self.payload, self.content, None, self.pretty, (self.count, self.width))
+
+    def lines(self):
+        if self._lines is None:
+            self._lines = self._derive()
+        return self._lines
+
+    def _derive(self):
+        if self.pretty and self.content == MessageContent.JSON:
+            return json.dumps(json.loads(self.payload), indent=2).split('\n')
+        if self.pretty and self.content == MessageContent.BSON:
+            import bson
+            return json.dumps(bson.loads(self.payload), indent=2).split('\n')
+        return self.payload.split('\n')
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.lines()[i]
+
+    def __iter__(self):
+        return iter(self.lines())
+
+
+def parse_data(data, decode_bson=True):
+    """
+    Decode frame payload into display lines
+
+    :param data: `str` for text frames, `bytes` for binary ones
+    :param decode_bson: Whether binary frames should be tried as BSON
+    :return: Tuple of lines (PayloadLines or HexdumpLines) and MessageContent
+    """
+    return _display_lines(data, *decode_data(data, decode_bson))
+
+
+def _display_lines(data, value, typ):
+    if typ in (MessageContent.JSON, MessageContent.BSON):
+        try:
+            return PayloadLines(data, typ, json.dumps(value, indent=2).split('\n')), typ
+        except:
+            typ = MessageContent.BINARY if type(data) is bytes else MessageContent.PLAIN
+    if typ == MessageContent.BINARY:
+        return HexdumpLines(data), typ
+    return PayloadLines(data, typ), typ
+
+
+def decode_frame(data, decode_bson=True, key_path=None):
+    """
+    Decode incoming frame payload into a ready-to-display message, decoding it only once
+
+    :param data: `str` for text frames, `bytes` for binary ones
+    :param decode_bson: Whether binary frames should be tried as BSON
+    :param key_path: Correlation key path (see correlation.parse_key_path) to extract, if any
+    :return: Tuple of SocketMessage and correlation key, None if there is no key
+    """
+    value, typ = decode_data(data, decode_bson)
+    message = SocketMessage(MessageTypes.INCOMING, *_display_lines(data, value, typ))
+    if not key_path or message.content not in (MessageContent.JSON, MessageContent.BSON):
+        return message, None
+    return message, extract_key(value, key_path)
+
+
+def decode_event(ev, decode_bson=True, stats=None, key_path=None):
+    """
+    Decode lomond data frame event into a ready-to-display message
+
+    :param ev: lomond event
+    :param decode_bson: Whether binary frames should be tried as BSON
+    :param stats: PerfStats to count the frame and parsing time in, if any
+    :param key_path: Correlation key path to extract, if any
+    :return: Tuple of SocketMessage and correlation key for text and binary frames, (None, None) otherwise
+    """
+    if ev.name == 'text':
+        data = ev.text
+    elif ev.name == 'binary':
+        data = ev.data
+    else:
+        return None, None
+    if stats is None:
+        return decode_frame(data, decode_bson, key_path)
+    start = time.perf_counter()
+    ret = decode_frame(data, decode_bson, key_path)
+    stats.add('parse', time.perf_counter() - start)
+    stats.count('in', payload_size(data))
+    return ret
+
+
+def payload_size(payload):
+    """
+    Size of a `str` or `bytes` frame payload on the wire, in bytes
+    """
+    if type(payload) is bytes or payload.isascii():
+        return len(payload)
+    return len(payload.encode())
+
+
+def encode_data(data, mode):
+    """
+    Encode user input into frame payload
+
+    :param data: Input text
+    :param mode: One of SEND_MODES
+    :return: `str` or `bytes` payload, or ValueError if input is invalid
+    """
+    res = encode_input(data, mode)
+    return res[0] if type(res) is tuple else res
+
+
+def encode_input(data, mode):
+    """
+    Encode user input into frame payload, keeping the value parsed on the way
+
+    :param data: Input text
+    :param mode: One of SEND_MODES
+    :return: Tuple of `str` or `bytes` payload and the parsed JSON value
+             (None unless mode is json or bson), or ValueError if input is invalid
+    """
+    if mode == 'plain_text':
+        return data, None
+    if mode == 'binary':
+        return data.encode(), None
+    if mode == 'hex':
+        try:
+            return bytes.fromhex(data), None
+        except ValueError:
+            return ValueError('Invalid hex!')
+    if mode == 'base64':
+        import base64
+        try:
+            return base64.b64decode(data.encode()), None
+        except:
+            return ValueError('Invalid Base64!')
+    if mode == 'json':
+        try:
+            value = json.loads(data)
+            return json.dumps(value), value  # validate and minify
+        except:
+            return ValueError('Invalid JSON!')
+    if mode == 'bson':
+        import bson
+        try:
+            value = json.loads(data)
+            return bson.dumps(value), value
+        except:
+            return ValueError('Invalid JSON!')
@@ -69,29 +69,6 @@ def button(text, onclick):
     return widget
 
 
-def hexdump(src, length=16, sep='.'):
-    """
-    Took from some gist and edited a bit. Hexdumps a binary data from `src`
-
-    :param src:
-    :param length:
-    :param sep:
-    :return:
-    """
-    filter_ = ''.join(
-        [(len(repr(chr(x))) == 3) and chr(x) or sep for x in range(256)]
-    )
-    lines = []
-    for c in range(0, len(src), length):
-        chars = src[c:c + length]
-        hexstr = ' '.join(["%02x" % ord(x) for x in chars]) if type(chars) is str else ' '.join(
-            ['{:02x}'.format(x) for x in chars])
-        printable = ''.join(["%s" % ((ord(x) <= 127 and filter_[ord(x)]) or sep) for x in chars]) if type(
-            chars) is str else ''.join(['{}'.format((x <= 127 and filter_[x]) or sep) for x in chars])
-        lines.append("%08x:  %-*s  |%s|" % (c, length * 3, hexstr, printable))
-    return lines
-
-
 def debounce(wait):
     """
     Took from some gist, idr. Does exactly the same as lodash's debounce
@@ -0,0 +1,85 @@
+"""
+Hexdump of binary data. Doesn't import Qt, so it is safe to use headless
+"""
+from collections.abc import Sequence
+from functools import lru_cache
+
+
+@lru_cache()
+def _hexdump_filter(sep):
+    """
+    Translation table replacing non-printable bytes with `sep`
+    """
+    sep = ord(sep)
+    return bytes(x if len(repr(chr(x))) == 3 and x <= 127 else sep for x in range(256))
+
+
+def _hex(data):
+    """
+    Space-separated hex representation of `data`
+    """
+    try:
+        return data.hex(' ')
+    except TypeError:  # python < 3.8
+        h = data.hex()
+        return ' '.join(h[i:i + 2] for i in range(0, len(h), 2))
+
+
+class HexdumpLines(Sequence):
+    """
+    Lazy hexdump of binary data. Rows are formatted only when accessed,
+    so only visible rows of a large frame are ever rendered.
+    Iterating formats all rows at once using bulk conversions
+    """
+    def __init__(self, src, length=16, sep='.'):
+        if isinstance(src, str):
+            src = src.encode('latin-1', 'replace')
+        self.data = bytes(src)
+        self.length = length
+        self.sep = sep
+
+    def __len__(self):
+        return (len(self.data) + self.length - 1) // self.length
+
+    def _row(self, c, hexstr, printable):
+        return '%08x:  %-*s  |%s|' % (c, self.length * 3, hexstr, printable)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('hexdump row index out of range')
+        c = i * self.length
+        chunk = self.data[c:c + self.length]
+        return self._row(c, _hex(chunk), chunk.translate(_hexdump_filter(self.sep)).decode('latin-1'))
+
+    def __iter__(self):
+        length = self.length
+        hexstr = _hex(self.data)
+        printable = self.data.translate(_hexdump_filter(self.sep)).decode('latin-1')
+        for c in range(0, len(self.data), length):
+            yield self._row(c, hexstr[c * 3:(c + length) * 3 - 1], printable[c:c + length])
+
+    @property
+    def width(self):
+        """
+        Length of the longest row
+        """
+        if not self.data:
+            return 0
+        return max(len(self[0]), len(self[-1]))
+
+
+def hexdump(src, length=16, sep='.'):
+    """
+    Hexdumps a binary data from `src`
+
+    :param src: Data to dump
+    :param length: Bytes per row
+    :param sep: Placeholder for non-printable characters
+    :return: List of rows
+    """
+    return list(HexdumpLines(src, length, sep))
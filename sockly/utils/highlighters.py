@@ -1,10 +1,44 @@
 from PyQt5.QtGui import QTextCharFormat, QTextCursor, QFont, QColor
 from collections import namedtuple
+from functools import lru_cache
+from itertools import groupby
 from PyQt5.QtCore import Qt
+from sockly.structs import MessageContent, MessageTypes
 import re
 
 HighlightingRule = namedtuple('HighlightingRule', 'pattern format group')
 
+JSON_TOKENS = re.compile(r'''
+    :\s*(?:(?P<number>\d+(?:\.\d+)?\b)|(?P<bool>(?:true|false)\b)|(?P<null>null\b)|(?P<colon>))
+  | (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")(?P<key>(?=\s*:))?
+  | (?P<escape>\\u[0-f]{4}|\\x[0-f]{2}|\\.)
+''', re.X)
+JSON_VALUES = re.compile(r':\s*(?:(?P<number>\d+(?:\.\d+)?\b)|(?P<bool>(?:true|false)\b)|(?P<null>null\b))')
+JSON_ESCAPES = re.compile(r'\\u[0-f]{4}|\\x[0-f]{2}|\\.')
+HEXDUMP_TOKENS = re.compile(r'^(?P<group>[0-f]+)|(?P<data> (?: [0-f]{2})+ {2})', re.M)
+
+
+def overlay(spans, length, offset=0):
+    """
+    Resolve overlapping spans, later ones winning, into sorted disjoint runs
+
+    :param spans: Iterable of (start, end, format) tuples
+    :param length: Length of the highlighted text
+    :param offset: Position of the text, subtracted from span positions and added to runs
+    :return: List of (start, end, format) tuples
+    """
+    fmts = [None] * length
+    for s, e, fmt in spans:
+        fmts[s - offset:e - offset] = [fmt] * (e - s)
+    runs = []
+    pos = offset
+    for fmt, group in groupby(fmts):
+        n = sum(1 for _ in group)
+        if fmt is not None:
+            runs.append((pos, pos + n, fmt))
+        pos += n
+    return runs
+
 
 class SimpleHighlighter:
     def __init__(self):
@@ -18,20 +52,35 @@ class SimpleHighlighter:
         rule = HighlightingRule(pattern, fmt, group)
         self.rules.append(rule)
 
-    def highlight(self, text, document, offset=0, reset=True):
-        if reset:
-            self.reset(document)
+    def spans(self, text):
+        """
+        Iterate over formatted spans of `text`.
+        Later spans override earlier ones, same as in `highlight`
+
+        :param text: Text to highlight
+        :return: Iterator of (start, end, format) tuples
+        """
         for pattern, fmt, group in self.rules:
             for m in re.finditer(pattern, text):
                 s, e = m.span(group)
                 if s == e:
                     continue
-                cur = QTextCursor(document)
-                cur.setPosition(offset + s, QTextCursor.MoveAnchor)
-                cur.setPosition(offset + e, QTextCursor.KeepAnchor)
-                cur.setCharFormat(fmt)
-                # self.setFormat(index, length, fmt)
-                # index = expression.indexIn(text, index + length)
+                yield s, e, fmt
+
+    def runs(self, text):
+        """
+        Formatted spans of `text` as sorted disjoint (start, end, format) tuples
+        """
+        return overlay(self.spans(text), len(text))
+
+    def highlight(self, text, document, offset=0, reset=True):
+        if reset:
+            self.reset(document)
+        for s, e, fmt in self.spans(text):
+            cur = QTextCursor(document)
+            cur.setPosition(offset + s, QTextCursor.MoveAnchor)
+            cur.setPosition(offset + e, QTextCursor.KeepAnchor)
+            cur.setCharFormat(fmt)
 
     @staticmethod
     def reset(document):
@@ -40,33 +89,108 @@ class SimpleHighlighter:
         cur.setCharFormat(QTextCharFormat())
 
 
-class JsonHighlighter(SimpleHighlighter):
+class TokenHighlighter(SimpleHighlighter):
+    """
+    Highlighter classifying text in a single pass of a tokenizer, which yields
+    sorted disjoint spans. Its rules are kept as the reference the tokenizer
+    must match, see benchmarks/highlighting.py
+    """
+    def spans(self, text):
+        return self.tokenize(text)
+
+    def runs(self, text):
+        return list(self.tokenize(text))
+
+    def rule_spans(self, text):
+        """
+        Spans of `text` produced by the rules, one pass per rule
+        """
+        return SimpleHighlighter.spans(self, text)
+
+    def tokenize(self, text):
+        raise NotImplemented()
+
+
+class JsonHighlighter(TokenHighlighter):
+    """
+    Colours well-formed JSON the same as the rules, except strings starting
+    or ending with a colon, which the rules mistook for parts of keys or values
+    """
     def init(self):
-        key_fmt = QTextCharFormat()
+        self.key_fmt = key_fmt = QTextCharFormat()
         key_fmt.setForeground(Qt.blue)
         self.set_rule(re.compile(r'("(?:[^"\\]|\\.)*?")\s*?:'), key_fmt, 1)
 
-        val_str_fmt = QTextCharFormat()
+        self.val_str_fmt = val_str_fmt = QTextCharFormat()
         val_str_fmt.setForeground(Qt.red)
         self.set_rule(re.compile(r':\s*?("(?:[^"\\]|\\.)*?")'), val_str_fmt, 1)
 
-        val_num_fmt = QTextCharFormat()
+        self.val_num_fmt = val_num_fmt = QTextCharFormat()
         val_num_fmt.setForeground(Qt.darkGreen)
         self.set_rule(re.compile(r':\s*?(\b(\d+(?:\.\d+)?)\b)'), val_num_fmt, 1)
 
-        val_bool_fmt = QTextCharFormat()
+        self.val_bool_fmt = val_bool_fmt = QTextCharFormat()
         val_bool_fmt.setForeground(Qt.darkBlue)
         val_bool_fmt.setFontWeight(QFont.Bold)
         self.set_rule(re.compile(r':\s*?(\b(true|false)\b)'), val_bool_fmt, 1)
 
-        val_null_fmt = QTextCharFormat()
+        self.val_null_fmt = val_null_fmt = QTextCharFormat()
         val_null_fmt.setForeground(Qt.darkMagenta)
         val_null_fmt.setFontWeight(QFont.Bold)
         self.set_rule(re.compile(r':\s*?(\b(null)\b)'), val_null_fmt, 1)
 
-        escaped_fmt = QTextCharFormat()
+        self.escaped_fmt = escaped_fmt = QTextCharFormat()
         escaped_fmt.setForeground(QColor('#6e3803'))
         self.set_rule(re.compile(r'\\u[0-f]{4}|\\x[0-f]{2}|\\.'), escaped_fmt)
+        self.token_fmts = {'number': val_num_fmt, 'bool': val_bool_fmt, 'null': val_null_fmt,
+                           'escape': escaped_fmt}
+
+    def tokenize(self, text):
+        fmts = self.token_fmts
+        find = text.find
+        value_at = -1
+        for m in JSON_TOKENS.finditer(text):
+            kind = m.lastgroup
+            if kind == 'colon':
+                value_at = m.end()
+            elif kind == 'string' or kind == 'key':
+                s, e = m.span('string')
+                if s == value_at:
+                    fmt = self.val_str_fmt
+                elif kind == 'key':
+                    fmt = self.key_fmt
+                else:
+                    fmt = None
+                if find(':', s, e) >= 0 or find('\\', s, e) >= 0:
+                    yield from self._string_runs(text, s, e, fmt)
+                elif fmt is not None:
+                    yield s, e, fmt
+            else:
+                yield m.span(kind) + (fmts[kind],)
+
+    def _string_runs(self, text, s, e, fmt):
+        """
+        Runs of a string with escapes or colons in it. The rules colour values
+        after colons inside strings too, and escapes over everything
+        """
+        fmts = self.token_fmts
+        values = [m.span(m.lastgroup) + (fmts[m.lastgroup],) for m in JSON_VALUES.finditer(text, s, e)]
+        escapes = [m.span() + (self.escaped_fmt,) for m in JSON_ESCAPES.finditer(text, s, e)]
+        runs = []
+        pos = s
+        for a, b, inner in sorted(values + escapes):
+            if a < pos:
+                # an escape overlapping a value, e.g. \u:123
+                return overlay([(s, e, fmt)] + values + escapes if fmt is not None else values + escapes, e - s, s)
+            if a > pos and fmt is not None:
+                runs.append((pos, a, fmt))
+            elif a == pos and runs and runs[-1][2] is inner:
+                a = runs.pop()[0]
+            runs.append((a, b, inner))
+            pos = b
+        if pos < e and fmt is not None:
+            runs.append((pos, e, fmt))
+        return runs
 
 
 class SystemHighlighter(SimpleHighlighter):
@@ -102,13 +226,36 @@ class SystemHighlighter(SimpleHighlighter):
         self.set_rule(re.compile(r'^Welcome to (Sockly)$'), welcome_fmt, 1)
 
 
-class HexdumpHighlighter(SimpleHighlighter):
+class HexdumpHighlighter(TokenHighlighter):
     def init(self):
-        grp_fmt = QTextCharFormat()
+        self.grp_fmt = grp_fmt = QTextCharFormat()
         grp_fmt.setForeground(Qt.darkCyan)
         grp_fmt.setFontWeight(QFont.Bold)
         self.set_rule(re.compile(r'^[0-f]*', re.M), grp_fmt)
 
-        dat_fmt = QTextCharFormat()
+        self.dat_fmt = dat_fmt = QTextCharFormat()
         dat_fmt.setFontWeight(QFont.DemiBold)
         self.set_rule(re.compile(r' ( [0-f]{2})+ {2}'), dat_fmt)
+
+    def tokenize(self, text):
+        for m in HEXDUMP_TOKENS.finditer(text):
+            yield m.start(), m.end(), self.grp_fmt if m.lastgroup == 'group' else self.dat_fmt
+
+
+@lru_cache()
+def get_highlighter(kind, typ):
+    """
+    Highlighter for messages of given content and type. Highlighters hold
+    no state besides their rules, so one instance is shared by all tabs
+
+    :param kind: MessageContent
+    :param typ: MessageTypes
+    :return: SimpleHighlighter or None if such messages aren't highlighted
+    """
+    if kind in (MessageContent.JSON, MessageContent.BSON):
+        return JsonHighlighter()
+    if kind == MessageContent.BINARY:
+        return HexdumpHighlighter()
+    if typ == MessageTypes.SYSTEM:
+        return SystemHighlighter()
+    return None
@@ -0,0 +1,82 @@
+from array import array
+from bisect import bisect_right
+from sockly.structs import MessageTypes
+from sockly.utils.decoding import PayloadLines
+from sockly.utils.hexdump import HexdumpLines
+
+
+def gutter_label(item, line):
+    """
+    Side bar label for `line`-th line of `item`.
+    Negative line means a separator line placed before the message
+
+    :param item: SocketMessage
+    :param line: Line number inside the message
+    :return: Label text
+    """
+    if line < 0:
+        return ''
+    if line == 0:
+        return ['', 'J', 'X', 'B'][item.content.value] + ['<~>', '->>', '<<-'][item.type.value]
+    return str(line + 1)
+
+
+class LineIndex:
+    """
+    Incrementally maintained mapping between output lines (blocks) and messages.
+
+    Non-system messages (except the very first one) are preceded by an empty
+    separator line, exactly like SocketOutput lays them out.
+    Appending is O(1), lookup is O(log n)
+    """
+    def __init__(self):
+        self.starts = array('q')
+        self.counts = array('q')
+        self.total = 0
+        self.max_width = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def clear(self):
+        self.starts = array('q')
+        self.counts = array('q')
+        self.total = 0
+        self.max_width = 0
+
+    def append(self, item):
+        sep = 1 if len(self.starts) and item.type != MessageTypes.SYSTEM else 0
+        self.starts.append(self.total + sep)
+        self.counts.append(len(item.lines))
+        self.total += sep + len(item.lines)
+        if isinstance(item.lines, (HexdumpLines, PayloadLines)):
+            width = item.lines.width
+        else:
+            width = max(map(len, item.lines), default=0)
+        self.max_width = max(self.max_width, width)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def first_line(self, i):
+        """
+        First line occupied by i-th message, including the separator before it
+        """
+        if i == 0:
+            return 0
+        return self.starts[i - 1] + self.counts[i - 1]
+
+    def locate(self, line):
+        """
+        Find message containing given line
+
+        :param line: Line (block) number
+        :return: Tuple of message index and line number inside the message
+                 (-1 if that is a separator before the message)
+        """
+        i = bisect_right(self.starts, line) - 1
+        offset = line - self.starts[i]
+        if offset >= self.counts[i]:
+            return i + 1, -1
+        return i, offset
@@ -0,0 +1,214 @@
+"""
+Load generator: sends messages over N parallel connections at a target rate.
+
+All connections and the sender run on the shared AsyncEngine, so even
+thousands of connections don't need a thread each.
+
+Messages come from a file (one per line) or a template, and may contain
+placeholders substituted for every sent message:
+  $counter    sequence number of the message, starting with 1
+  $timestamp  Unix time in milliseconds
+  $random     random 32-bit unsigned integer
+"""
+import asyncio
+import time
+from random import getrandbits
+from string import Template
+
+from lomond.errors import WebSocketError
+from sockly.utils.AsyncEngine import BaseConnection, get_engine
+from sockly.utils.connection import send
+from sockly.utils.decoding import encode_data, payload_size
+
+
+def read_messages(filename):
+    """
+    Non-empty lines of a message file
+    """
+    with open(filename) as f:
+        return [line for line in f.read().split('\n') if line]
+
+
+class LoadConnection(BaseConnection):
+    """
+    Connection of a LoadGenerator: frames are counted, not decoded nor batched for a tab
+    """
+    def __init__(self, config, generator):
+        super().__init__(config, generator.engine)
+        self.generator = generator
+        self.ready = False
+
+    def _push(self, ev):
+        self.generator.on_event(self, ev)
+
+
+class LoadGenerator:
+    """
+    :param config: Worker config, see SocklyTab._create_worker_config
+    :param messages: List of messages (templates), sent one after another in a loop
+    :param connections: Number of parallel connections
+    :param rate: Target number of messages per second over all connections, 0 for as fast as possible
+    :param total: Number of messages to send, 0 for unlimited
+    :param mode: Send mode, one of SEND_MODES
+    :param compress: Whether messages should be compressed
+    """
+    # don't queue more than this many bytes in a socket's write buffer in unlimited rate mode
+    HIGH_WATER = 1024 * 1024
+    # how many messages are sent at most before letting other tasks run
+    BURST = 256
+
+    def __init__(self, config, messages, connections=1, rate=0, total=0, mode='plain_text',
+                 compress=False, engine=None):
+        self.engine = engine or get_engine()
+        config = dict(config, persist=False)
+        self.connections = [LoadConnection(config, self) for _ in range(connections)]
+        self.templates = [Template(m) if '$' in m else m for m in messages]
+        self.rate = rate
+        self.total = total
+        self.mode = mode
+        self.compress = compress
+        self._cache = {}
+        self._stopping = False
+        self.started = None
+        self.finished = None
+        self.stopped = None
+        self.sent = 0
+        self.sent_bytes = 0
+        self.replies = 0
+        self.reply_bytes = 0
+        self.errors = 0
+        self.connected = 0
+        self.last_error = None
+
+    def start(self):
+        self.started = time.monotonic()
+        for connection in self.connections:
+            connection.start()
+        self.engine.start(self)
+
+    def stop(self):
+        """
+        Stop sending and close all connections. Doesn't block
+        """
+        self.engine.call(self._shutdown)
+
+    def _shutdown(self):
+        self._stopping = True
+        self.stopped = self.stopped or time.monotonic()
+        for connection in self.connections:
+            connection._shutdown()
+
+    @property
+    def running(self):
+        return self.started is not None and not self._stopping
+
+    def snapshot(self):
+        """
+        :return: Dict of counters and average rates since start
+        """
+        now = time.monotonic()
+        started = self.started or now
+        elapsed = (self.stopped or now) - started
+        sending = (self.finished or self.stopped or now) - started
+        return {
+            'elapsed': elapsed,
+            'connected': self.connected,
+            'sent': self.sent,
+            'sent_bytes': self.sent_bytes,
+            'replies': self.replies,
+            'reply_bytes': self.reply_bytes,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'send_rate': self.sent / sending if sending > 0 else 0,
+            'reply_rate': self.replies / elapsed if elapsed > 0 else 0,
+        }
+
+    def on_event(self, connection, ev):
+        if ev.name == 'ready':
+            connection.ready = True
+            self.connected += 1
+        elif ev.name == 'text':
+            self.replies += 1
+            self.reply_bytes += payload_size(ev.text)
+        elif ev.name == 'binary':
+            self.replies += 1
+            self.reply_bytes += len(ev.data)
+        elif ev.name in ('connect_fail', 'rejected'):
+            self._error(ev.reason)
+        elif ev.name == 'disconnected':
+            if connection.ready:
+                connection.ready = False
+                self.connected -= 1
+            if not ev.graceful and not self._stopping:
+                self._error(ev.reason)
+
+    def _error(self, reason):
+        self.errors += 1
+        self.last_error = reason
+
+    def payload(self, i):
+        """
+        Encoded i-th message, or ValueError if it is invalid for the send mode
+        """
+        template = self.templates[i % len(self.templates)]
+        if type(template) is str:
+            if template not in self._cache:
+                self._cache[template] = encode_data(template, self.mode)
+            return self._cache[template]
+        return encode_data(template.safe_substitute(
+            counter=i + 1,
+            timestamp=int(time.time() * 1000),
+            random=getrandbits(32),
+        ), self.mode)
+
+    def _targets(self):
+        ret = []
+        for connection in self.connections:
+            session = connection.conn.session
+            if connection.ready and connection.conn.is_active and session and session.transport:
+                if self.rate or session.transport.get_write_buffer_size() < self.HIGH_WATER:
+                    ret.append(connection)
+        return ret
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        started = None
+        n = 0
+        while not self._stopping and (not self.total or n < self.total):
+            targets = self._targets()
+            if not targets:
+                if not any(c in self.engine.tasks for c in self.connections):
+                    break  # all connections are gone
+                await asyncio.sleep(0.001 if self.connected else 0.05)
+                continue
+            if started is None:
+                # rate is counted from the moment first connection is ready
+                started = loop.time()
+            due = self.BURST
+            if self.rate:
+                due = min(due, int((loop.time() - started) * self.rate) - n)
+                if due <= 0:
+                    await asyncio.sleep(max(0.001, (n + 1) / self.rate - (loop.time() - started)))
+                    continue
+            if self.total:
+                due = min(due, self.total - n)
+            for i in range(due):
+                payload = self.payload(n)
+                n += 1
+                if isinstance(payload, ValueError):
+                    self._error(payload.args[0])
+                    continue
+                try:
+                    send(targets[i % len(targets)].conn, payload, self.compress)
+                except WebSocketError as error:
+                    self._error(str(error))
+                    continue
+                self.sent += 1
+                self.sent_bytes += payload_size(payload)
+            await asyncio.sleep(0)
+        self.finished = time.monotonic()
+
+    def summary(self):
+        s = self.snapshot()
+        return ('{connected} connected, sent {sent} ({send_rate:.1f} msg/s), '
+                '{replies} replies ({reply_rate:.1f} msg/s), {errors} errors').format(**s)
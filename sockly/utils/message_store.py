@@ -0,0 +1,215 @@
+import os
+import pickle
+from array import array
+from collections import OrderedDict
+from sockly.structs import SocketMessage, MessageTypes, MessageContent
+from sockly.utils.decoding import PayloadLines
+from sockly.utils.hexdump import HexdumpLines
+
+# how payload of a resident message is kept in the arena
+HEXDUMP = 0  # binary data shown as hexdump
+TEXT = 1  # UTF-8 display text
+TEXT_FRAME = 2  # UTF-8 text frame payload, pretty-printed on access
+BINARY_FRAME = 3  # binary frame payload, pretty-printed on access
+
+_TYPES = tuple(MessageTypes)
+_CONTENTS = tuple(MessageContent)
+
+
+def pack_message(item):
+    """
+    Split message into arena record fields
+
+    :return: Tuple of payload bytes, format, line count and width
+    """
+    lines = item.lines
+    if isinstance(lines, HexdumpLines):
+        return lines.data, HEXDUMP, len(lines), lines.width
+    if isinstance(lines, PayloadLines):
+        if type(lines.payload) is bytes:
+            return lines.payload, BINARY_FRAME, lines.count, lines.width
+        return (lines.payload.encode('utf-8', 'surrogatepass'), TEXT_FRAME if lines.pretty else TEXT,
+                lines.count, lines.width)
+    text = '\n'.join(lines)
+    lines = text.split('\n')
+    return text.encode('utf-8', 'surrogatepass'), TEXT, len(lines), max(map(len, lines), default=0)
+
+
+def unpack_message(typ, content, payload, fmt, count, width):
+    """
+    Re-create message from arena record fields. Lines are derived when accessed
+    """
+    if fmt == HEXDUMP:
+        lines = HexdumpLines(payload)
+    elif fmt == BINARY_FRAME:
+        lines = PayloadLines(payload, content, shape=(count, width))
+    else:
+        lines = PayloadLines(payload.decode('utf-8', 'surrogatepass'), content, pretty=fmt == TEXT_FRAME,
+                             shape=(count, width))
+    return SocketMessage(typ, lines, content)
+
+
+class MessageStore:
+    """
+    List-like storage of SocketMessage's with bounded in-memory retention.
+
+    Resident messages are kept compact: payloads are packed one after another
+    into a single bytearray (the arena) and described by parallel arrays of
+    offsets, lengths, types and line counts. Messages are re-created from the
+    arena when accessed, the most recently accessed ones are cached.
+
+    Only the last `max_messages` messages (or `max_bytes` of their payloads)
+    are kept in memory, older ones are spilled to SocklyDB and paged back on
+    access. Zero limit means unlimited.
+    Indices are stable: i-th message stays i-th after being spilled.
+    """
+    PAGE_SIZE = 256
+    CACHE_SIZE = 4096
+    VIEW_CACHE_SIZE = 1024
+
+    def __init__(self, database=None, max_messages=0, max_bytes=0):
+        self.database = database
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.store_id = os.urandom(16).hex()
+        self.offset = 0
+        self._cache = OrderedDict()
+        self._reset_arena()
+
+    def _reset_arena(self):
+        self._arena = bytearray()
+        self._base = 0  # arena position of the first resident message
+        self._offsets = array('Q')
+        self._lengths = array('I')
+        self._counts = array('I')
+        self._widths = array('I')
+        self._types = array('B')
+        self._contents = array('B')
+        self._formats = array('B')
+        self._views = OrderedDict()
+
+    def __len__(self):
+        return self.offset + len(self._offsets)
+
+    def __iter__(self):
+        for i in range(0, self.offset, self.PAGE_SIZE):
+            yield from self._load(i, min(i + self.PAGE_SIZE, self.offset))
+        yield from self.resident()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('message index out of range')
+        if i >= self.offset:
+            item = self._views.get(i)
+            if item is None:
+                item = self._views[i] = self._unpack(i - self.offset)
+                if len(self._views) > self.VIEW_CACHE_SIZE:
+                    self._views.popitem(last=False)
+            else:
+                self._views.move_to_end(i)
+            return item
+        if i not in self._cache:
+            start = i - i % self.PAGE_SIZE
+            self._load(start, min(start + self.PAGE_SIZE, self.offset))
+        self._cache.move_to_end(i)
+        return self._cache[i]
+
+    def resident(self):
+        """
+        List of messages currently kept in memory, starting with `offset`-th
+        """
+        views = self._views
+        return [views.get(self.offset + j) or self._unpack(j) for j in range(len(self._offsets))]
+
+    def append(self, item):
+        payload, fmt, count, width = pack_message(item)
+        self._offsets.append(self._base + len(self._arena))
+        self._lengths.append(len(payload))
+        self._counts.append(count)
+        self._widths.append(width)
+        self._types.append(item.type.value)
+        self._contents.append(item.content.value)
+        self._formats.append(fmt)
+        self._arena += payload
+        if isinstance(item.lines, (PayloadLines, HexdumpLines)):
+            # most likely to be rendered right away, and its lines are already there
+            self._views[len(self) - 1] = item
+            if len(self._views) > self.VIEW_CACHE_SIZE:
+                self._views.popitem(last=False)
+        self._enforce()
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def clear(self):
+        if self.offset and self.database:
+            self.database.drop_messages(self.store_id)
+        self.offset = 0
+        self._reset_arena()
+        self._cache.clear()
+
+    def set_retention(self, max_messages=0, max_bytes=0):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._enforce()
+
+    def _unpack(self, j):
+        """
+        Re-create j-th resident message from the arena
+        """
+        start = self._offsets[j] - self._base
+        return unpack_message(_TYPES[self._types[j]], _CONTENTS[self._contents[j]],
+                              bytes(self._arena[start:start + self._lengths[j]]),
+                              self._formats[j], self._counts[j], self._widths[j])
+
+    def _over_limit(self, count, size):
+        return (self.max_messages and count > self.max_messages or
+                self.max_bytes and size > self.max_bytes)
+
+    def _enforce(self):
+        if not self.database or not self._over_limit(len(self._offsets), len(self._arena)):
+            return
+        # spill a bit more than needed, so spilling happens in batches
+        # instead of once per appended message
+        count = len(self._offsets)
+        size = len(self._arena)
+        keep_messages = self.max_messages - self.max_messages // 10 if self.max_messages else 0
+        keep_bytes = self.max_bytes - self.max_bytes // 10 if self.max_bytes else 0
+        rows = []
+        while count > 1 and (keep_messages and count > keep_messages or keep_bytes and size > keep_bytes):
+            j = len(rows)
+            idx = self.offset + j
+            item = self._views.pop(idx, None) or self._unpack(j)
+            rows.append((self.store_id, idx, item.type.value, item.content.value,
+                         pickle.dumps(item, pickle.HIGHEST_PROTOCOL)))
+            size -= self._lengths[j]
+            count -= 1
+        if not rows:
+            return
+        n = len(rows)
+        cut = self._offsets[n] - self._base
+        del self._arena[:cut]
+        self._base += cut
+        for column in (self._offsets, self._lengths, self._counts, self._widths,
+                       self._types, self._contents, self._formats):
+            del column[:n]
+        self.offset += n
+        self.database.spill_messages(rows)
+
+    def _load(self, start, stop):
+        """
+        Page spilled messages [start, stop) back from the database into cache
+        """
+        ret = []
+        for row in self.database.load_messages(self.store_id, start, stop):
+            item = pickle.loads(row['payload'])
+            self._cache[row['idx']] = item
+            ret.append(item)
+        while len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return ret
@@ -0,0 +1,94 @@
+"""
+Per-tab performance counters.
+
+Counters are bumped from the GUI thread and from worker threads, and once a
+second (while the tab's PerfPanel is shown) they are turned into a sample
+(rates per second since the previous one) kept in a rolling history.
+"""
+import csv
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+
+# (key, title) of every sampled metric, in display and CSV order
+METRICS = (
+    ('in_msgs', 'In, msg/s'),
+    ('in_bytes', 'In, B/s'),
+    ('out_msgs', 'Out, msg/s'),
+    ('out_bytes', 'Out, B/s'),
+    ('backlog', 'Backlog, events'),
+    ('parse', 'parse_data, ms/s'),
+    ('highlight', 'Highlighting, ms/s'),
+    ('render', 'notify_set_changed, ms/s'),
+)
+COUNTERS = ('in_msgs', 'in_bytes', 'out_msgs', 'out_bytes')
+TIMERS = ('parse', 'highlight', 'render')
+
+
+class PerfStats:
+    """
+    :param history: Number of samples kept
+    """
+    HISTORY = 300
+
+    def __init__(self, history=HISTORY):
+        self.history = deque(maxlen=history)
+        self._lock = Lock()
+        self._current = dict.fromkeys(COUNTERS + TIMERS, 0)
+        self._last_sample = time.monotonic()
+
+    def add(self, name, value=1):
+        """
+        Bump a counter (or add seconds to a timer). Safe to call from any thread
+        """
+        with self._lock:
+            self._current[name] += value
+
+    def count(self, direction, size):
+        """
+        Count a message
+
+        :param direction: 'in' or 'out'
+        :param size: Payload size in bytes
+        """
+        with self._lock:
+            self._current[direction + '_msgs'] += 1
+            self._current[direction + '_bytes'] += size
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def sample(self, backlog=0):
+        """
+        Turn counters accumulated since the previous sample into a history row
+
+        :param backlog: Number of events received but not handled yet
+        :return: The row, dict with `time` and METRICS keys
+        """
+        now = time.monotonic()
+        with self._lock:
+            current, self._current = self._current, dict.fromkeys(COUNTERS + TIMERS, 0)
+        elapsed = now - self._last_sample or 1
+        self._last_sample = now
+        row = {'time': time.time(), 'backlog': backlog}
+        for name in COUNTERS:
+            row[name] = current[name] / elapsed
+        for name in TIMERS:
+            row[name] = current[name] * 1000 / elapsed
+        self.history.append(row)
+        return row
+
+    def series(self, name):
+        return [row[name] for row in self.history]
+
+    def export_csv(self, filename):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.DictWriter(f, ('time',) + tuple(key for key, _ in METRICS))
+            writer.writeheader()
+            writer.writerows(self.history)
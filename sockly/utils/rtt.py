@@ -0,0 +1,99 @@
+"""
+Round-trip time measurement from WebSocket pings sent by Sockly itself.
+
+Every ping carries a sequence number, send and pong arrival are timestamped
+with a monotonic clock, both on the network thread: the ping as it is
+written (see SendQueue.put_ping), the pong as soon as lomond parses it, so
+neither GUI lag nor frames queued before the ping count into RTT.
+"""
+import struct
+import time
+from collections import deque, OrderedDict
+from threading import Lock
+
+PING = struct.Struct('>6sQ')
+PREFIX = b'sockly'
+
+
+def percentile(values, p):
+    """
+    :param values: Sorted list
+    :param p: Percentile, 0 to 100
+    """
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class RttMeter:
+    """
+    Rolling RTT histogram of one connection
+
+    :param window: Number of latest RTT samples kept
+    """
+    WINDOW = 1000
+    RESULTS = 64
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.sent = 0
+        self.lost = 0
+        self._seq = 0
+        self._pending = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = Lock()
+
+    def ping(self, ws):
+        """
+        Send a timestamped ping. Call on the thread writing frames, when the ping is due to be written
+
+        :param ws: lomond WebSocket
+        """
+        with self._lock:
+            self._seq += 1
+            payload = PING.pack(PREFIX, self._seq)
+            self._pending[payload] = time.monotonic()
+            self.sent += 1
+        ws.send_ping(payload)
+
+    def on_event(self, ev):
+        """
+        Feed a lomond event, on the network thread
+        """
+        if ev.name == 'pong':
+            now = time.monotonic()
+            payload = bytes(ev.data)
+            with self._lock:
+                sent = self._pending.pop(payload, None)
+                if sent is None:
+                    return
+                # pongs come in order, so pings sent before this one won't be answered
+                while self._pending:
+                    older = next(iter(self._pending))
+                    if self._pending[older] > sent:
+                        break
+                    del self._pending[older]
+                    self.lost += 1
+                self.samples.append(now - sent)
+                self._results[payload] = now - sent
+                if len(self._results) > self.RESULTS:
+                    self._results.popitem(last=False)
+        elif ev.name == 'connecting':
+            with self._lock:
+                self._pending.clear()
+
+    def result(self, payload):
+        """
+        :return: RTT of ping with given payload in seconds, or None if it is not ours
+        """
+        with self._lock:
+            return self._results.get(bytes(payload))
+
+    def summary(self):
+        """
+        :return: Dict with min, p50, p99 and max RTT in seconds (None if no pongs yet), sent and lost counts
+        """
+        with self._lock:
+            values = sorted(self.samples)
+            ret = {'count': len(values), 'sent': self.sent, 'lost': self.lost}
+        for key, p in (('min', 0), ('p50', 50), ('p99', 99), ('max', 100)):
+            ret[key] = percentile(values, p) if values else None
+        return ret
@@ -0,0 +1,154 @@
+"""
+Outgoing frames of a connection, queued by the GUI thread and written by
+the connection's network thread, so the GUI never blocks on compression or
+on a slow socket.
+
+Every frame is timestamped (time.time()) when it is queued, when its write
+starts and when the socket (or asyncio transport) has taken all of it.
+Once written, or failed, it is reported back as a `sent` worker event.
+Pings go through the queue too, so they are written by the network thread
+(never waiting on the socket on the GUI thread) and in order with frames.
+"""
+import time
+from collections import deque
+from threading import Condition
+
+
+class QueuedFrame:
+    """
+    :param payload: `str` for text frames, `bytes` for binary ones
+    :param compressed: Whether the frame should be compressed
+    :param tag: Anything identifying the frame to whoever queued it, e.g. output message index
+    :param ping: Whether the frame is a ping, payload is made up when it is written
+    """
+    __slots__ = ('payload', 'compressed', 'tag', 'ping', 'enqueued', 'write_started', 'write_completed', 'error')
+
+    def __init__(self, payload, compressed=False, tag=None, ping=False):
+        self.payload = payload
+        self.compressed = compressed
+        self.tag = tag
+        self.ping = ping
+        self.enqueued = time.time()
+        self.write_started = None
+        self.write_completed = None
+        self.error = None
+
+    @property
+    def size(self):
+        return len(self.payload) if type(self.payload) is bytes else len(self.payload.encode())
+
+    @property
+    def waited(self):
+        """
+        Seconds the frame spent in the queue
+        """
+        return self.write_started - self.enqueued
+
+    @property
+    def write_time(self):
+        """
+        Seconds the write (including compression) took
+        """
+        return self.write_completed - self.write_started
+
+
+class FrameSent:
+    """
+    Worker event reporting a frame that was written or failed to be,
+    handled by the tab the same way as lomond events
+
+    :param frame: QueuedFrame
+    :param depth: Number of frames still queued after this one
+    """
+    __slots__ = ('frame', 'depth')
+    name = 'sent'
+
+    def __init__(self, frame, depth):
+        self.frame = frame
+        self.depth = depth
+
+
+class SendQueue:
+    """
+    :param write: Callable writing a frame, `write(payload, compressed)`, called on the network thread
+    :param report: Callable receiving FrameSent for every frame, called on the network thread
+    :param wakeup: Callable telling the network thread there are frames to drain,
+                   if it doesn't wait for them in `run`
+    :param ping: Callable sending a ping, `ping()`, called on the network thread
+    """
+    def __init__(self, write, report, wakeup=None, ping=None):
+        self._write = write
+        self._report = report
+        self._wakeup = wakeup
+        self._ping = ping
+        self._frames = deque()
+        self._cond = Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, payload, compressed=False, tag=None):
+        """
+        Queue a frame. Safe to call from any thread
+
+        :return: QueuedFrame
+        """
+        return self._put(QueuedFrame(payload, compressed, tag))
+
+    def put_ping(self):
+        """
+        Queue a ping. Safe to call from any thread
+
+        :return: QueuedFrame
+        """
+        return self._put(QueuedFrame(b'', ping=True))
+
+    def _put(self, frame):
+        with self._cond:
+            self._frames.append(frame)
+            self._cond.notify()
+        if self._wakeup:
+            self._wakeup()
+        return frame
+
+    def drain(self):
+        """
+        Write every queued frame, in order. Call on the network thread.
+        A frame that fails to be written is reported with its error, the rest are still written
+        """
+        while self._frames:
+            frame = self._frames.popleft()
+            frame.write_started = time.time()
+            try:
+                if frame.ping:
+                    self._ping()
+                else:
+                    self._write(frame.payload, frame.compressed)
+            except Exception as error:
+                # not only WebSocketError: OSError from the socket or TypeError on a bad payload
+                # mustn't kill the sender thread, or every frame queued after would never be written
+                frame.error = str(error) or type(error).__name__
+            frame.write_completed = time.time()
+            self._report(FrameSent(frame, len(self._frames)))
+
+    def run(self):
+        """
+        Drain frames as they are queued until closed. Target of a dedicated sender thread
+        """
+        while True:
+            with self._cond:
+                while not self._frames and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+            self.drain()
+
+    def close(self):
+        """
+        Stop `run`. Frames still queued are dropped
+        """
+        with self._cond:
+            self._closed = True
+            self._frames.clear()
+            self._cond.notify()
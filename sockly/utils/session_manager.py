@@ -1,7 +1,36 @@
+"""
+Sockly sessions.
+
+Session file layout (all integers are little-endian):
+  MAGIC
+  message records, each: <type: u8> <content: u8> <length: u32> <payload>
+    payload is the frame data for binary messages, UTF-8 display text otherwise.
+    Binary messages of older sessions that are not a hexdump are stored as
+    display text too, with TEXT_LINES bit set in content
+  footer: <header length: u32> <JSON header> <count: u64> <record offsets: u64 * count>
+  trailer: <footer offset: u64> MAGIC
+
+Records are only ever appended: saving a session back to the file it was
+saved to (or loaded from) writes new messages over the old footer and a new
+footer after them. Header and index are read from the footer, so opening
+doesn't touch messages at all - they are read one by one when iterated.
+
+Pickled sessions of older versions are still accepted.
+"""
+import json
 import pickle
-import traceback
+import struct
+import sys
+from array import array
+
+from sockly.structs import SocketMessage, MessageTypes, MessageContent
+from sockly.utils.hexdump import HexdumpLines
 
-from sockly.structs import SocketMessage
+MAGIC = b'SOCKLY\x02\n'
+RECORD = struct.Struct('<BBI')
+TRAILER = struct.Struct('<Q%ds' % len(MAGIC))
+# content flag: payload of a binary message is its display text instead of data
+TEXT_LINES = 0x80
 
 
 def assert_(predicate):
@@ -9,38 +38,191 @@ def assert_(predicate):
         raise AssertionError()
 
 
+def hexdump_data(lines, length=16):
+    """
+    Data shown by hexdump rows, e.g. of binary messages pickled by older
+    versions, which kept rows instead of data
+
+    :param lines: Rows as produced by `hexdump`
+    :param length: Bytes per row
+    :return: bytes, or None if `lines` aren't hexdump rows
+    """
+    data = bytearray()
+    for row in lines:
+        if not row.startswith('%08x:  ' % len(data)):
+            return None
+        try:
+            data += bytes.fromhex(row[11:11 + length * 3])
+        except ValueError:
+            return None
+    return bytes(data)
+
+
+def encode_message(item):
+    content = item.content.value
+    if isinstance(item.lines, HexdumpLines):
+        payload = item.lines.data
+    else:
+        payload = hexdump_data(item.lines) if item.content == MessageContent.BINARY else None
+        if payload is None:
+            payload = '\n'.join(item.lines).encode()
+            if item.content == MessageContent.BINARY:
+                content |= TEXT_LINES
+    return RECORD.pack(item.type.value, content, len(payload)) + payload
+
+
+def decode_message(typ, content, payload):
+    text = content & TEXT_LINES
+    content = MessageContent(content & ~TEXT_LINES)
+    if content == MessageContent.BINARY and not text:
+        lines = HexdumpLines(payload)
+    else:
+        lines = payload.decode().split('\n')
+    return SocketMessage(MessageTypes(typ), lines, content)
+
+
+def _offsets_array(data=b''):
+    ret = array('Q')
+    ret.frombytes(data)
+    if sys.byteorder != 'little':
+        ret.byteswap()
+    return ret
+
+
+def _read_footer(f):
+    """
+    :return: Tuple of footer offset, header dict and records offsets array
+    """
+    f.seek(0)
+    assert_(f.read(len(MAGIC)) == MAGIC)
+    f.seek(-TRAILER.size, 2)
+    footer_offset, magic = TRAILER.unpack(f.read(TRAILER.size))
+    assert_(magic == MAGIC)
+    f.seek(footer_offset)
+    size, = struct.unpack('<I', f.read(4))
+    header = json.loads(f.read(size).decode())
+    count, = struct.unpack('<Q', f.read(8))
+    offsets = _offsets_array(f.read(count * 8))
+    assert_(len(offsets) == count)
+    return footer_offset, header, offsets
+
+
+class SessionLog:
+    """
+    Lazy read-only sequence of messages stored in a session file
+    """
+    def __init__(self, filename, offsets):
+        self.filename = filename
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offsets[i])
+            return self._read(f)
+
+    def __iter__(self):
+        if not self.offsets:
+            return
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offsets[0])
+            for _ in range(len(self.offsets)):
+                yield self._read(f)
+
+    @staticmethod
+    def _read(f):
+        typ, content, size = RECORD.unpack(f.read(RECORD.size))
+        return decode_message(typ, content, f.read(size))
+
+
+def save_session(filename, header, messages, stored=0):
+    """
+    Write session to a file
+
+    :param filename: Session file name
+    :param header: Session header as returned by `create_session`
+    :param messages: All messages of the session
+    :param stored: Number of leading messages already stored in the file by a previous save.
+                   Only the rest is appended
+    :return: Number of messages stored in the file
+    """
+    if stored:
+        f = open(filename, 'r+b')
+        footer_offset, _, offsets = _read_footer(f)
+        if len(offsets) != stored:
+            f.close()
+            return save_session(filename, header, messages)
+        f.seek(footer_offset)
+        f.truncate()
+    else:
+        f = open(filename, 'wb')
+        f.write(MAGIC)
+        offsets = array('Q')
+    with f:
+        position = f.tell()
+        for i in range(stored, len(messages)):
+            record = encode_message(messages[i])
+            offsets.append(position)
+            f.write(record)
+            position += len(record)
+        header = json.dumps(header).encode()
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(struct.pack('<Q', len(offsets)))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        f.write(offsets.tobytes())
+        f.write(TRAILER.pack(position, MAGIC))
+    return len(messages)
+
+
+def _validate_header(data):
+    for key, typ in (
+            ('name', str),
+            ('url', str),
+            ('headers', str),
+            ('proxy_enabled', bool),
+            ('proxy', str),
+            ('compression', bool),
+            ('reconnect', bool),
+            ('input', str),
+            ('mode', str),
+            ('msg_compression', bool),
+    ):
+        assert_(key in data)
+        assert_(type(data[key]) is typ)
+    for key, validate in (
+            ('history', lambda t: type(t) is str),
+            ('favourites', lambda t: type(t) is dict and
+                                     'name' in t and
+                                     'value' in t and
+                                     type(t['name']) is str and
+                                     type(t['value']) is str),
+    ):
+        assert_(key in data)
+        assert_(type(data[key]) is list)
+        assert_(all((validate(t) for t in data[key])))
+
+
 def validate_session(filename):
     try:
         with open(filename, 'rb') as f:
+            if f.read(len(MAGIC)) == MAGIC:
+                _, data, offsets = _read_footer(f)
+                _validate_header(data)
+                data['output'] = SessionLog(filename, offsets)
+                return True, data
+            f.seek(0)
             data = pickle.load(f)
-            for key, typ in (
-                    ('name', str),
-                    ('url', str),
-                    ('headers', str),
-                    ('proxy_enabled', bool),
-                    ('proxy', str),
-                    ('compression', bool),
-                    ('reconnect', bool),
-                    ('input', str),
-                    ('mode', str),
-                    ('msg_compression', bool),
-            ):
-                assert_(key in data)
-                assert_(type(data[key]) is typ)
-            for key, validate in (
-                    ('history', lambda t: type(t) is str),
-                    ('favourites', lambda t: type(t) is dict and
-                                             'name' in t and
-                                             'value' in t and
-                                             type(t['name']) is str and
-                                             type(t['value']) is str),
-                    ('output', lambda t: type(t) is SocketMessage),
-            ):
-                assert_(key in data)
-                assert_(type(data[key]) is list)
-                assert_(all((validate(t) for t in data[key])))
+            _validate_header(data)
+            assert_('output' in data)
+            assert_(type(data['output']) is list)
+            assert_(all((type(t) is SocketMessage for t in data['output'])))
             return True, data
-    except AssertionError:
+    except (AssertionError, struct.error, ValueError, EOFError):
+        import traceback
         return False, 'Session is broken: \n' + traceback.format_exc()
     except pickle.PickleError:
         return False, 'Session parse failed'
@@ -61,10 +243,11 @@ def create_session(tab):
         'reconnect': tab.conn_persist.isChecked(),
         'history': tab.history,
         'favourites': tab.fav,
-        'output': tab.output.items,
         'input': tab.input.toPlainText(),
         'mode': tab.current_send_mode,
-        'msg_compression': tab.use_compression.isChecked()
+        'msg_compression': tab.use_compression.isChecked(),
+        'retention_messages': tab.retention_messages.value(),
+        'retention_mb': tab.retention_mb.value(),
     }
 
 
@@ -79,7 +262,6 @@ def apply_session(tab, d):
     tab.headers_input.setPlainText(d['headers'])
     tab.input.setPlainText(d['input'])
     tab.fav = d['favourites']
-    tab.output.items = d['output']
     tab.history = d['history']
 
     for key, attr in (
@@ -90,6 +272,9 @@ def apply_session(tab, d):
     ):
         getattr(tab, attr).setChecked(d[key])
 
+    for key in ('retention_messages', 'retention_mb'):
+        getattr(tab, key).setValue(d.get(key, 0))
+
     for i in (
             'plain_text',
             'binary',
@@ -103,4 +288,6 @@ def apply_session(tab, d):
     tab.update_title()
     tab.update_history()
     tab.update_favs()
-    tab.output.notify_set_changed()
+    tab.correlator.reset()
+    tab.output.clear()
+    tab.stream_messages(d['output'])
@@ -5,7 +5,9 @@ Versioning is executed one-by-one starting from DB version to app version.
 E.g. upgrade 1 -> 3 means executing 2nd, then 3rd versions' rulesets
 When database is just created or first used with wrapper v0 is implied.
 
-Database object handles multiple threads, so no need to re-create it for each.
+Database object handles multiple threads, so no need to re-create it for each:
+all of them share one connection, statements are serialized with a lock.
+File databases are opened in WAL mode.
 
 Usage:
 versions = {
@@ -63,7 +65,8 @@ class Database:
         self.init = init
         self.v = v
         self.rsp_dict = rsp_dict
-        self.connections = {}
+        self.connection = None
+        self.lock = threading.RLock()
 
         self.query('create table if not exists __desu_wrapper__ (k text, v text)')
         self.query('create unique index if not exists __desu_wrapper_uindex__ on __desu_wrapper__ (k)')
@@ -77,7 +80,7 @@ class Database:
                     raise ValueError('Cannot perform upgrade from {} to {}: no ruleset given'.format(new - 1, new))
                 for q in self.init[new]:
                     self.query(q)
-        self._internal_store_set('version', self.v)
+            self._internal_store_set('version', self.v)
 
     def _internal_store_get(self, key, default=None):
         ret = self.query('select v from __desu_wrapper__ where k = ?', str(key))
@@ -90,33 +93,42 @@ class Database:
                    str(key), str(value))
 
     def _prepare_connection(self):
-        tid = threading.get_ident()
-        if tid not in self.connections:
+        if self.connection is None:
             conn = sqlite3.connect(self.filename, check_same_thread=False)
             if self.rsp_dict:
                 conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            self.connections[tid] = (conn, cur)
-        return self.connections[tid]
+            conn.execute('pragma journal_mode=wal')
+            conn.execute('pragma synchronous=normal')
+            self.connection = (conn, conn.cursor())
+        return self.connection
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                conn, cur = self.connection
+                cur.close()
+                conn.close()
+                self.connection = None
 
     def __del__(self):
-        for conn, cur in self.connections.values():
-            cur.close()
-            conn.close()
+        self.close()
 
     def query(self, q, *params, one=False):
-        conn, cur = self._prepare_connection()
-        cur.execute(q, params)
-        conn.commit()
-        if one:
-            return cur.fetchone()
-        else:
-            return cur.fetchall()
-
-    def query_many(self, q):
-        conn, cur = self._prepare_connection()
-        cur.executemany(q, ())
-        conn.commit()
+        with self.lock:
+            conn, cur = self._prepare_connection()
+            cur.execute(q, params)
+            if conn.in_transaction:
+                conn.commit()
+            if one:
+                return cur.fetchone()
+            else:
+                return cur.fetchall()
+
+    def query_many(self, q, params=()):
+        with self.lock:
+            conn, cur = self._prepare_connection()
+            cur.executemany(q, params)
+            conn.commit()
 
     @staticmethod
     def dict_factory(cursor, row):
@@ -0,0 +1,123 @@
+"""
+Startup profiling, enabled with `--startup-profile`.
+
+Records how long every module imported after `enable()` took to import
+(cumulative and excluding nested imports) and how long init phases took,
+then prints the breakdown to stderr once the main window has painted.
+Doesn't import Qt itself, so Qt import is measured as well.
+"""
+import builtins
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from importlib.util import resolve_name
+
+_profile = None
+
+
+class StartupProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.marks = []
+        self.imports = []
+        self._depth = 0
+        self._children = [0.0]
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def stop(self):
+        builtins.__import__ = self._original_import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            try:
+                full_name = resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                full_name = name
+        else:
+            full_name = name
+        if full_name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        self._children.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._children.pop()
+            self._children[-1] += elapsed
+            self.imports.append((full_name, elapsed, elapsed - nested))
+
+    @contextmanager
+    def phase(self, name):
+        entry = [self._depth, name, 0.0]
+        self.phases.append(entry)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[2] = time.perf_counter() - start
+            self._depth -= 1
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter() - self.started))
+
+    def report(self, top=15):
+        lines = ['Startup profile, ms', 'phases:']
+        for depth, name, elapsed in self.phases:
+            lines.append('  {:8.1f}  {}{}'.format(elapsed * 1000, '  ' * depth, name))
+        for name, at in self.marks:
+            lines.append('  {:8.1f}  {} (since start)'.format(at * 1000, name))
+        lines.append('imports: {:.1f} ms in {} modules, slowest (cumulative / own):'.format(
+            self._children[0] * 1000, len(self.imports)))
+        for name, elapsed, own in sorted(self.imports, key=lambda t: -t[1])[:top]:
+            lines.append('  {:8.1f}  {:8.1f}  {}'.format(elapsed * 1000, own * 1000, name))
+        return '\n'.join(lines)
+
+
+def enable():
+    global _profile
+    _profile = StartupProfile()
+
+
+def phase(name):
+    """
+    Context manager timing an init phase, does nothing unless profiling is enabled
+    """
+    if _profile is None:
+        return nullcontext()
+    return _profile.phase(name)
+
+
+def report_on_first_paint(widget):
+    """
+    Print the report once `widget` has painted for the first time
+    """
+    if _profile is None:
+        return
+    from PyQt5.QtCore import QObject, QEvent, QTimer
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, ev):
+            if ev.type() == QEvent.Paint and _profile is not None:
+                _profile.mark('first paint')
+                widget.removeEventFilter(self)
+                QTimer.singleShot(0, finish)
+            return False
+
+    widget._startup_filter = FirstPaint()
+    widget.installEventFilter(widget._startup_filter)
+
+
+def finish(file=None):
+    """
+    Stop profiling and print the report
+    """
+    global _profile
+    if _profile is None:
+        return
+    _profile.stop()
+    print(_profile.report(), file=file or sys.stderr)
+    _profile = None
@@ -0,0 +1,76 @@
+from PyQt5 import QtWidgets, QtGui, QtCore
+from sockly.utils.correlation import BUCKETS, format_latency
+from sockly.utils.helpers import MONOSPACE, get_font, label
+
+
+def bucket_title(i):
+    if BUCKETS[i] == float('inf'):
+        return '>' + format_latency(BUCKETS[i - 1])
+    return '≤' + format_latency(BUCKETS[i])
+
+
+class Histogram(QtWidgets.QWidget):
+    """
+    Horizontal bar per latency bucket
+    """
+    def __init__(self):
+        super().__init__()
+        self.counts = [0] * len(BUCKETS)
+        self.setFont(get_font(MONOSPACE, 8))
+        self.setMinimumHeight(len(BUCKETS) * (self.fontMetrics().height() + 2))
+
+    def set_counts(self, counts):
+        self.counts = counts
+        self.update()
+
+    def paintEvent(self, ev):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(ev.rect(), self.palette().color(QtGui.QPalette.Base))
+        metrics = self.fontMetrics()
+        height = metrics.height() + 2
+        titles_width = max(metrics.width(bucket_title(i)) for i in range(len(BUCKETS))) + 8
+        count_width = metrics.width('0000000') + 8
+        bar_width = self.width() - titles_width - count_width - 4
+        peak = max(self.counts) or 1
+        text_color = self.palette().color(QtGui.QPalette.Text)
+        bar_color = self.palette().color(QtGui.QPalette.Highlight)
+        for i, count in enumerate(self.counts):
+            top = i * height
+            painter.setPen(text_color)
+            painter.drawText(QtCore.QRect(4, top, titles_width - 8, height), QtCore.Qt.AlignRight, bucket_title(i))
+            painter.fillRect(titles_width, top + 2, int(bar_width * count / peak), height - 4, bar_color)
+            painter.drawText(QtCore.QRect(self.width() - count_width, top, count_width - 4, height),
+                             QtCore.Qt.AlignRight, str(count))
+
+
+class LatencyPanel(QtWidgets.QWidget):
+    """
+    Aggregate reply latency distribution of the tab's Correlator
+    """
+    def __init__(self, correlator):
+        super().__init__()
+        self.correlator = correlator
+        layout = QtWidgets.QVBoxLayout(self)
+        self.setLayout(layout)
+        self.summary = label('')
+        self.summary.setFont(get_font(MONOSPACE, 9))
+        layout.addWidget(self.summary)
+        self.histogram = Histogram()
+        layout.addWidget(self.histogram)
+        layout.addStretch()
+        self.refresh()
+
+    def refresh(self):
+        s = self.correlator.summary()
+        text = '{answered} answered, {unanswered} unanswered, {pending} pending'.format(**s)
+        if s['duplicates']:
+            text += ', {duplicates} duplicate keys'.format(**s)
+        if s['min'] is not None:
+            text += '\nmin {} / p50 {} / p90 {} / p99 {} / max {}'.format(
+                *(format_latency(s[k]) for k in ('min', 'p50', 'p90', 'p99', 'max')))
+        self.summary.setText(text)
+        self.histogram.set_counts(self.correlator.histogram())
+
+    def showEvent(self, ev):
+        self.refresh()
+        super().showEvent(ev)
@@ -0,0 +1,133 @@
+from PyQt5 import QtWidgets, QtCore
+from sockly.utils.helpers import MONOSPACE, get_font, label, button
+from sockly.utils.load_generator import LoadGenerator, read_messages
+
+
+class LoadWindow(QtWidgets.QWidget):
+    """
+    Load test of the tab's server: messages from a file or a template sent over
+    parallel connections made with the tab's URL, headers, proxy and compression
+    """
+    def __init__(self, tab):
+        super().__init__(tab, QtCore.Qt.Window)
+        self.tab = tab
+        self.generator = None
+        layout = QtWidgets.QVBoxLayout(self)
+        self.setLayout(layout)
+
+        source_row = QtWidgets.QHBoxLayout()
+        layout.addLayout(source_row)
+        self.template_radio = QtWidgets.QRadioButton('Template')
+        self.template_radio.setChecked(True)
+        source_row.addWidget(self.template_radio)
+        self.file_radio = QtWidgets.QRadioButton('File, message per line')
+        source_row.addWidget(self.file_radio)
+        self.file_input = QtWidgets.QLineEdit()
+        self.file_input.textChanged.connect(lambda t: self.file_radio.setChecked(bool(t)))
+        source_row.addWidget(self.file_input)
+        source_row.addWidget(button('Browse', self.browse))
+
+        self.template_input = QtWidgets.QPlainTextEdit()
+        self.template_input.setFont(get_font(MONOSPACE))
+        self.template_input.setPlaceholderText('{"id": $counter, "time": $timestamp, "nonce": $random}')
+        self.template_input.setToolTip('$counter, $timestamp (ms) and $random are replaced in every message')
+        layout.addWidget(self.template_input)
+
+        params_row = QtWidgets.QHBoxLayout()
+        layout.addLayout(params_row)
+        self.connections = QtWidgets.QSpinBox()
+        self.connections.setRange(1, 10000)
+        self.connections.setValue(10)
+        params_row.addWidget(label('Connections'))
+        params_row.addWidget(self.connections)
+        self.rate = QtWidgets.QSpinBox()
+        self.rate.setRange(0, 10000000)
+        self.rate.setSpecialValueText('max')
+        self.rate.setSuffix(' msg/s')
+        params_row.addWidget(label('Rate'))
+        params_row.addWidget(self.rate)
+        self.total = QtWidgets.QSpinBox()
+        self.total.setRange(0, 2000000000)
+        self.total.setSpecialValueText('unlimited')
+        self.total.setSuffix(' msgs')
+        params_row.addWidget(label('Send'))
+        params_row.addWidget(self.total)
+
+        buttons_row = QtWidgets.QHBoxLayout()
+        layout.addLayout(buttons_row)
+        self.start_btn = button('Start', self.start)
+        buttons_row.addWidget(self.start_btn)
+        self.stop_btn = button('Stop', self.stop)
+        self.stop_btn.setEnabled(False)
+        buttons_row.addWidget(self.stop_btn)
+
+        self.status = label('')
+        self.status.setFont(get_font(MONOSPACE, 9))
+        self.status.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+        layout.addWidget(self.status)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.update_status)
+
+        self.setWindowTitle('Load test — ' + tab.tabname_input.text())
+        self.resize(700, 400)
+
+    def browse(self):
+        fname, ok = QtWidgets.QFileDialog().getOpenFileName(self, 'Choose file', filter='All files (*.*)')
+        if ok:
+            self.file_input.setText(fname)
+
+    def _messages(self):
+        if self.file_radio.isChecked():
+            try:
+                return read_messages(self.file_input.text())
+            except (OSError, UnicodeDecodeError) as e:
+                self.status.setText('Error: ' + str(e))
+                return None
+        text = self.template_input.toPlainText()
+        return [text] if text else None
+
+    def start(self):
+        messages = self._messages()
+        if not messages:
+            if not self.status.text().startswith('Error'):
+                self.status.setText('Error: nothing to send')
+            return
+        if not self.tab.url_input.text():
+            return self.status.setText('Error: URL is empty')
+        self.generator = LoadGenerator(
+            self.tab._create_worker_config(),
+            messages,
+            connections=self.connections.value(),
+            rate=self.rate.value(),
+            total=self.total.value(),
+            mode=self.tab.current_send_mode,
+            compress=self.tab.use_compression.isChecked(),
+        )
+        self.generator.start()
+        self.start_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        self.timer.start(250)
+
+    def stop(self):
+        if self.generator:
+            self.generator.stop()
+        self.start_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+        QtCore.QTimer.singleShot(500, self.timer.stop)
+
+    def update_status(self):
+        s = self.generator.snapshot()
+        lines = [
+            '{:.1f} s, {}/{} connected{}'.format(s['elapsed'], s['connected'], len(self.generator.connections),
+                                                 ', done sending' if self.generator.finished else ''),
+            'sent     {:>10}  {:>10.1f} msg/s  {:>12} B'.format(s['sent'], s['send_rate'], s['sent_bytes']),
+            'replies  {:>10}  {:>10.1f} msg/s  {:>12} B'.format(s['replies'], s['reply_rate'], s['reply_bytes']),
+            'errors   {:>10}'.format(s['errors']) + ('  last: ' + s['last_error'] if s['last_error'] else ''),
+        ]
+        self.status.setText('\n'.join(lines))
+
+    def closeEvent(self, ev):
+        if self.generator and self.generator.running:
+            self.stop()
+        super().closeEvent(ev)
@@ -0,0 +1,103 @@
+from PyQt5 import QtWidgets, QtGui, QtCore
+from sockly.utils.helpers import MONOSPACE, get_font, button
+from sockly.utils.perf_stats import METRICS
+
+
+def format_value(value):
+    if value >= 10000:
+        return '{:.1f}k'.format(value / 1000)
+    if value >= 100 or value == int(value):
+        return str(int(value))
+    return '{:.2f}'.format(value)
+
+
+class Sparkline(QtWidgets.QWidget):
+    """
+    Tiny line chart of the latest values of a metric with its title,
+    current and maximum values
+    """
+    def __init__(self, title):
+        super().__init__()
+        self.title = title
+        self.values = []
+        self.setFont(get_font(MONOSPACE, 8))
+        self.setMinimumHeight(self.fontMetrics().height() + 24)
+
+    def set_values(self, values):
+        self.values = values
+        self.update()
+
+    def paintEvent(self, ev):
+        painter = QtGui.QPainter(self)
+        painter.fillRect(ev.rect(), self.palette().color(QtGui.QPalette.Base))
+        height = self.fontMetrics().height()
+        current = self.values[-1] if self.values else 0
+        peak = max(self.values) if self.values else 0
+        painter.setPen(self.palette().color(QtGui.QPalette.Text))
+        painter.drawText(QtCore.QRect(4, 0, self.width() - 8, height), QtCore.Qt.AlignLeft,
+                         self.title)
+        painter.drawText(QtCore.QRect(4, 0, self.width() - 8, height), QtCore.Qt.AlignRight,
+                         '{}  max {}'.format(format_value(current), format_value(peak)))
+        if len(self.values) < 2 or not peak:
+            return
+        top = height + 2
+        chart_height = self.height() - top - 2
+        step = (self.width() - 8) / (len(self.values) - 1)
+        points = QtGui.QPolygonF([
+            QtCore.QPointF(4 + i * step, top + chart_height * (1 - v / peak))
+            for i, v in enumerate(self.values)
+        ])
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(QtGui.QPen(self.palette().color(QtGui.QPalette.Highlight), 1))
+        painter.drawPolyline(points)
+
+
+class PerfPanel(QtWidgets.QWidget):
+    """
+    Live per-tab performance panel: a sparkline per PerfStats metric.
+    Samples are only taken while the panel is shown
+
+    :param stats: PerfStats of the tab
+    :param backlog: Callable returning number of events received but not handled yet
+    """
+    INTERVAL = 1000
+
+    def __init__(self, stats, backlog):
+        super().__init__()
+        self.stats = stats
+        self.backlog = backlog
+        layout = QtWidgets.QVBoxLayout(self)
+        self.setLayout(layout)
+
+        self.sparklines = {}
+        for key, title in METRICS:
+            self.sparklines[key] = Sparkline(title)
+            layout.addWidget(self.sparklines[key])
+        layout.addStretch()
+        layout.addWidget(button('Export CSV', self.export_csv))
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.sample)
+
+    def sample(self):
+        self.stats.sample(self.backlog())
+        self.refresh()
+
+    def refresh(self):
+        for key, sparkline in self.sparklines.items():
+            sparkline.set_values(self.stats.series(key))
+
+    def showEvent(self, ev):
+        self.refresh()
+        self.timer.start(self.INTERVAL)
+        super().showEvent(ev)
+
+    def hideEvent(self, ev):
+        self.timer.stop()
+        super().hideEvent(ev)
+
+    def export_csv(self):
+        fname, ok = QtWidgets.QFileDialog().getSaveFileName(self, 'Export performance samples',
+                                                            filter='CSV (*.csv);; All files (*.*)')
+        if ok:
+            self.stats.export_csv(fname)
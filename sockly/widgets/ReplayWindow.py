@@ -0,0 +1,140 @@
+from PyQt5 import QtWidgets, QtCore
+from sockly.utils.CaptureReplay import CaptureReplay
+from sockly.utils.capture import CaptureReader, CaptureSender
+from sockly.utils.helpers import MONOSPACE, get_font, label, button
+
+SPEEDS = (
+    ('1x', 1),
+    ('10x', 10),
+    ('max', 0),
+)
+
+
+class ReplayWindow(QtWidgets.QWidget):
+    """
+    Replay of a recorded capture: either into the tab's output, or by
+    re-sending its outgoing frames to a server
+    """
+    def __init__(self, tab):
+        super().__init__(tab, QtCore.Qt.Window)
+        self.tab = tab
+        self.replay = None
+        self.sender = None
+        layout = QtWidgets.QVBoxLayout(self)
+        self.setLayout(layout)
+
+        file_row = QtWidgets.QHBoxLayout()
+        layout.addLayout(file_row)
+        file_row.addWidget(label('Capture'))
+        self.file_input = QtWidgets.QLineEdit()
+        file_row.addWidget(self.file_input)
+        file_row.addWidget(button('Browse', self.browse))
+
+        speed_row = QtWidgets.QHBoxLayout()
+        layout.addLayout(speed_row)
+        speed_row.addWidget(label('Speed'))
+        self.speed = QtWidgets.QComboBox()
+        for name, _ in SPEEDS:
+            self.speed.addItem(name)
+        speed_row.addWidget(self.speed)
+        speed_row.addStretch()
+
+        output_row = QtWidgets.QHBoxLayout()
+        layout.addLayout(output_row)
+        self.replay_btn = button('Replay into output', self.start_replay)
+        output_row.addWidget(self.replay_btn)
+        output_row.addStretch()
+
+        send_row = QtWidgets.QHBoxLayout()
+        layout.addLayout(send_row)
+        self.send_btn = button('Re-send outgoing to', self.start_sending)
+        send_row.addWidget(self.send_btn)
+        self.target_input = QtWidgets.QLineEdit()
+        self.target_input.setPlaceholderText('ws://localhost:8080')
+        self.target_input.setText(tab.url_input.text())
+        send_row.addWidget(self.target_input)
+
+        self.stop_btn = button('Stop', self.stop)
+        self.stop_btn.setEnabled(False)
+        layout.addWidget(self.stop_btn)
+
+        self.status = label('')
+        self.status.setFont(get_font(MONOSPACE, 9))
+        self.status.setTextInteractionFlags(QtCore.Qt.TextSelectableByMouse)
+        layout.addWidget(self.status)
+        layout.addStretch()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.update_status)
+
+        self.setWindowTitle('Replay — ' + tab.tabname_input.text())
+        self.resize(600, 200)
+
+    def browse(self):
+        fname, ok = QtWidgets.QFileDialog().getOpenFileName(self, 'Choose file', filter='Sockly capture (*.sockcap);;'
+                                                                                        ' All files (*.*)')
+        if ok:
+            self.file_input.setText(fname)
+
+    def _reader(self):
+        try:
+            return CaptureReader(self.file_input.text())
+        except (OSError, ValueError) as e:
+            self.status.setText('Error: ' + str(e))
+            return None
+
+    def _set_running(self, running):
+        self.replay_btn.setEnabled(not running)
+        self.send_btn.setEnabled(not running)
+        self.stop_btn.setEnabled(running)
+        if running:
+            self.timer.start(250)
+        else:
+            QtCore.QTimer.singleShot(500, self.timer.stop)
+
+    def start_replay(self):
+        reader = self._reader()
+        if not reader:
+            return
+        self.sender = None
+        self.replay = CaptureReplay(reader, SPEEDS[self.speed.currentIndex()][1], self.tab.batch_cap.value())
+        self.replay.frames.connect(self.tab.on_replayed_frames)
+        self.replay.finished.connect(self.on_replay_finished)
+        self.tab.add_system('Replaying ' + reader.filename)
+        self._set_running(True)
+        self.replay.start()
+
+    def on_replay_finished(self):
+        self.tab.add_system('Replay finished, {} frames'.format(self.replay.count))
+        self.update_status()
+        self._set_running(False)
+
+    def start_sending(self):
+        reader = self._reader()
+        if not reader:
+            return
+        if not self.target_input.text():
+            return self.status.setText('Error: target URL is empty')
+        self.replay = None
+        config = dict(self.tab._create_worker_config(), url=self.target_input.text())
+        self.sender = CaptureSender(config, reader, SPEEDS[self.speed.currentIndex()][1],
+                                    self.tab.use_compression.isChecked())
+        self.sender.start()
+        self._set_running(True)
+
+    def stop(self):
+        if self.replay:
+            self.replay.stop()
+        if self.sender:
+            self.sender.stop()
+        self._set_running(False)
+
+    def update_status(self):
+        if self.replay:
+            self.status.setText('{} frames replayed'.format(self.replay.count))
+        elif self.sender:
+            self.status.setText(self.sender.summary())
+
+    def closeEvent(self, ev):
+        self.stop()
+        super().closeEvent(ev)
@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from PyQt5 import QtWidgets, QtCore
+from sockly.utils.archive import get_archive
+from sockly.utils.helpers import MONOSPACE, get_font, label
+
+DIRECTIONS = ['<~>', '->>', '<<-']
+
+
+class SearchWindow(QtWidgets.QWidget):
+    """
+    Full-text search over messages archived by all tabs and past sessions.
+    Queries run off the GUI thread, as the archive writer may be holding the database
+    """
+    # callback and result of a query, see _query
+    _done = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent, QtCore.Qt.Window)
+        self.setWindowTitle('Search messages — Sockly')
+        self.database = get_archive().database
+        self._generation = 0
+        self._done.connect(lambda callback, result: callback(result))
+        layout = QtWidgets.QVBoxLayout(self)
+        self.setLayout(layout)
+
+        self.query_input = QtWidgets.QLineEdit()
+        self.query_input.setPlaceholderText('Text to find, e.g. an order id')
+        self.query_input.returnPressed.connect(self.search)
+        layout.addWidget(self.query_input)
+
+        self.status = label('')
+        layout.addWidget(self.status)
+
+        splitter = QtWidgets.QSplitter()
+        splitter.setOrientation(2)  # Vertical
+        layout.addWidget(splitter)
+
+        self.results = QtWidgets.QTreeWidget()
+        self.results.setRootIsDecorated(False)
+        self.results.setHeaderLabels(['Time', 'Tab', 'URL', 'Dir', 'Match'])
+        self.results.currentItemChanged.connect(self.show_message)
+        splitter.addWidget(self.results)
+
+        self.preview = QtWidgets.QPlainTextEdit()
+        self.preview.setReadOnly(True)
+        self.preview.setFont(get_font(MONOSPACE, 9))
+        splitter.addWidget(self.preview)
+
+        self.resize(900, 600)
+
+    def _query(self, callback, fn, *args):
+        """
+        Call `fn(*args)` on a thread of its own, then `callback(result)` on the GUI thread.
+        Result is the exception if `fn` raised one
+        """
+        def run():
+            try:
+                result = fn(*args)
+            except Exception as e:
+                result = e
+            try:
+                self._done.emit(callback, result)
+            except RuntimeError:
+                # window is gone
+                pass
+        threading.Thread(target=run, name='sockly-search', daemon=True).start()
+
+    def search(self):
+        text = self.query_input.text()
+        # results of searches still running are of no use anymore
+        self._generation += 1
+        self.results.clear()
+        self.preview.setPlainText('')
+        if not text:
+            self.status.setText('')
+            return
+        self.status.setText('Searching...')
+        self._query(partial(self.show_results, self._generation, time.perf_counter()),
+                    self.database.search_messages, text)
+
+    def show_results(self, generation, started, rows):
+        if generation != self._generation:
+            return
+        if isinstance(rows, Exception):
+            self.status.setText('Error: ' + str(rows))
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        self.status.setText('{} matches in {:.1f} ms'.format(len(rows), elapsed))
+        for row in rows:
+            it = QtWidgets.QTreeWidgetItem([
+                datetime.fromtimestamp(row['time']).strftime('%Y-%m-%d %H:%M:%S'),
+                row['tab'],
+                row['url'],
+                DIRECTIONS[row['direction']],
+                ' '.join(row['snippet'].split()),
+            ])
+            it.setData(0, QtCore.Qt.UserRole, row['id'])
+            self.results.addTopLevelItem(it)
+
+    def show_message(self, item, _):
+        if item is None:
+            return
+        self._query(partial(self.show_body, item), self.database.archived_message, item.data(0, QtCore.Qt.UserRole))
+
+    def show_body(self, item, row):
+        if row and not isinstance(row, Exception) and self.results.currentItem() is item:
+            self.preview.setPlainText(row['body'])
@@ -1,8 +1,13 @@
 from __future__ import annotations
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
 from PyQt5 import QtWidgets, QtGui, QtCore
-from sockly.utils.helpers import iter_skip, MONOSPACE, get_font
-from sockly.utils.highlighters import JsonHighlighter, SystemHighlighter, HexdumpHighlighter
-from sockly.structs import MessageContent, MessageTypes
+from sockly.utils.helpers import MONOSPACE, get_font
+from sockly.utils.highlighters import get_highlighter
+from sockly.utils.line_index import LineIndex, gutter_label
+from sockly.utils.message_store import MessageStore
+from sockly.structs import MessageTypes
+from sockly.widgets.SocketOutputView import SocketOutputView
 
 
 class SideArea(QtWidgets.QWidget):
@@ -31,7 +36,7 @@ class SideArea(QtWidgets.QWidget):
         width = max(
             self.fontMetrics().width(str(num)),
             self.fontMetrics().width(' ->>')
-        ) + 16
+        ) + 16 + self.output.parent.annotations_width(self.fontMetrics())
         if self.width() != width:
             self.setFixedWidth(width)
 
@@ -47,21 +52,6 @@ class SideArea(QtWidgets.QWidget):
             else:
                 self.update()
 
-    @staticmethod
-    def _create_items_iterator(blocks):
-        """
-        Creates side bar lines iterator for given items
-
-        :param blocks: Block items
-        :return: Side bar lines iterator
-        """
-        for i, it in enumerate(blocks):
-            if i != 0 and it.type != MessageTypes.SYSTEM:
-                yield ''
-            prefix = ['', 'J', 'X', 'B'][it.content.value]
-            yield prefix + ['<~>', '->>', '<<-'][it.type.value]
-            yield from range(2, len(it.lines) + 1)
-
     def paintEvent(self, ev):
         block = self.output.firstVisibleBlock()
         height = self.fontMetrics().height()
@@ -69,24 +59,31 @@ class SideArea(QtWidgets.QWidget):
         painter = QtGui.QPainter(self)
         painter.fillRect(ev.rect(), self.palette().color(QtGui.QPalette.Window))
         font = self.font
-        bar_iterator = self._create_items_iterator(self.output.items)
-        bar_iterator = iter_skip(bar_iterator, block.blockNumber())
+        index = self.output.index
+        items = self.output.items
+        annotations = self.output.parent.annotations
+        offset = self.output.contentOffset()
+        # document tail is always aligned with the index tail, while its head
+        # may have been trimmed by the retention policy
+        number += index.total - self.output.blockCount()
+        # an empty document still has a block, with no line of the (empty) index behind it
+        while block.isValid() and number < 0:
+            block = block.next()
+            number += 1
 
-        while block.isValid():
-            offset = self.output.contentOffset()
+        while block.isValid() and number < index.total:
             block_geometry = self.output.blockBoundingGeometry(block)
             block_top = block_geometry.translated(offset).top()
-            number += 1
 
-            rect = QtCore.QRect(0, block_top + 2, self.width() - 5, height)
+            rect = QtCore.QRect(0, int(block_top) + 2, self.width() - 5, height)
 
-            try:
-                text = next(bar_iterator)
-            except StopIteration:
-                break
+            i, line = index.locate(number)
+            number += 1
 
             painter.setFont(font)
-            painter.drawText(rect, QtCore.Qt.AlignRight, str(text))
+            painter.drawText(rect, QtCore.Qt.AlignRight, gutter_label(items[i], line))
+            if line == 0 and i in annotations:
+                self.output.parent.draw_annotation(painter, rect, i)
 
             if block_top > ev.rect().bottom():
                 break
@@ -96,6 +93,12 @@ class SideArea(QtWidgets.QWidget):
 
 
 class SocketOutputText(QtWidgets.QPlainTextEdit):
+    """
+    Document output. Messages are inserted as plain text and highlighted
+    lazily: formats of a block are set on its layout when it is painted
+    for the first time, so history that is never scrolled to is never
+    highlighted
+    """
     def __init__(self, parent):
         super().__init__()
 
@@ -109,57 +112,362 @@ class SocketOutputText(QtWidgets.QPlainTextEdit):
     def items(self):
         return self.parent.items
 
+    @property
+    def index(self):
+        return self.parent.index
+
+    def paintEvent(self, ev):
+        self._format_visible_blocks()
+        super().paintEvent(ev)
+
+    def _format_visible_blocks(self):
+        """
+        Set highlighting formats on layouts of visible blocks that don't have them yet.
+        A block's user state holds the line it was formatted as, which also
+        catches blocks reused for other lines when the document head changes
+        """
+        index = self.index
+        block = self.firstVisibleBlock()
+        number = block.blockNumber() + index.total - self.blockCount()
+        offset = self.contentOffset()
+        bottom = self.viewport().rect().bottom()
+        doc = self.document()
+        while block.isValid() and number < index.total:
+            if self.blockBoundingGeometry(block).translated(offset).top() > bottom:
+                break
+            if block.userState() != number:
+                i, k = index.locate(number)
+                runs = self.parent.line_formats(i, self.items[i]) if k >= 0 else None
+                ranges = []
+                for s, e, fmt in runs[k] if runs else ():
+                    r = QtGui.QTextLayout.FormatRange()
+                    r.start, r.length, r.format = s, e - s, fmt
+                    ranges.append(r)
+                block.setUserState(number)
+                if ranges or block.layout().formats():
+                    block.layout().setFormats(ranges)
+                    doc.markContentsDirty(block.position(), block.length())
+            number += 1
+            block = block.next()
+
 
 class SocketOutput(QtWidgets.QWidget):
-    def __init__(self):
+    # backlog (in lines) above which a shown output is rebuilt tail-first
+    # instead of appending all of it in one go
+    CATCH_UP_LINES = 5000
+    # lines rendered above the visible tail per event loop iteration
+    PREPEND_LINES = 1000
+    # messages whose highlighting runs are kept
+    FORMATS_CACHE_SIZE = 256
+
+    def __init__(self, database=None):
         super().__init__()
         self._layout = QtWidgets.QHBoxLayout(self)
         self.setLayout(self._layout)
+        # message index -> (text, is error) shown in the gutter
+        self.annotations = {}
 
         self.text = SocketOutputText(self)
         self.side = SideArea(self.text)
+        self.view = SocketOutputView(self)
+        self.view.hide()
         self._layout.addWidget(self.side)
         self._layout.addWidget(self.text)
+        self._layout.addWidget(self.view)
         self._layout.setSpacing(0)
         self._layout.setContentsMargins(4, 4, 4, 4)
 
-        self.items = []
+        self.items = MessageStore(database)
+        self.index = LineIndex()
+        self.virtual = False
+        self.stats = None
+        self._held = 0
+        self._held_appends = 0
+        # changes not rendered while the output was hidden
+        self._deferred = None
+        self._deferred_appends = 0
+        # first message of the document while older ones are still being prepended
+        self._prepend_from = None
+        self._formats = OrderedDict()
 
-        self._lazy_highlighters = {}
         self._lazy_formatters = {}
 
-    def _get_highlighter(self, kind, typ):
-        if (kind, typ) not in self._lazy_highlighters:
-            hl = None
-            if typ == MessageTypes.SYSTEM:
-                hl = SystemHighlighter()
-            if kind in (MessageContent.JSON, MessageContent.BSON):
-                hl = JsonHighlighter()
-            if kind == MessageContent.BINARY:
-                hl = HexdumpHighlighter()
-            self._lazy_highlighters[(kind, typ)] = hl
-        return self._lazy_highlighters[(kind, typ)]
+    def set_virtual(self, enabled):
+        """
+        Switch between full-document output and virtualized view
 
-    def notify_set_changed(self, kind='update', append_number=1):
-        items = self.items if kind == 'update' else self.items[-append_number:]
-        text = ''
-        base_offset = 0 if kind == 'update' else (len(self.text.toPlainText()) +
-                                                  (1 if len(self.items) - append_number else 0))
-        if kind == 'update':
+        :param enabled: Whether virtualized view should be used
+        """
+        enabled = bool(enabled)
+        if enabled == self.virtual:
+            return
+        self.virtual = enabled
+        self.side.setVisible(not enabled)
+        self.text.setVisible(not enabled)
+        self.view.setVisible(enabled)
+        if enabled:
             self.text.setPlainText('')
-        highlight = []
+            self._prepend_from = None
+        self._render('update')
+
+    def set_retention(self, max_messages=0, max_bytes=0):
+        """
+        Limit number of messages (and their size) kept in memory.
+        Older messages are spilled to disk, zero means unlimited
+
+        :param max_messages: Maximum number of messages
+        :param max_bytes: Maximum size of messages in bytes
+        """
+        self.items.set_retention(max_messages, max_bytes)
+        if self.virtual:
+            self.view.viewport().update()
+        else:
+            self._trim_document()
+
+    def _trim_document(self):
+        """
+        Remove blocks of messages spilled from memory from the top of the document
+        """
+        if not self.items.offset or self.items.offset >= len(self.index):
+            return
+        doc = self.text.document()
+        base = self.index.total - doc.blockCount()
+        n = self.index.first_line(self.items.offset) - base
+        if n <= 0:
+            return
+        cur = QtGui.QTextCursor(doc)
+        cur.setPosition(doc.findBlockByNumber(n).position(), QtGui.QTextCursor.KeepAnchor)
+        cur.removeSelectedText()
+
+    @staticmethod
+    def get_highlighter(kind, typ):
+        return get_highlighter(kind, typ)
+
+    def line_formats(self, i, item):
+        """
+        Get highlighting runs for each line of i-th message. Cached
+
+        :return: List of (start, end, format) lists, one per line, or None if not highlighted
+        """
+        if i in self._formats:
+            self._formats.move_to_end(i)
+            return self._formats[i]
+        hl = self.get_highlighter(item.content, item.type)
+        result = None
+        if hl:
+            with self.timed('highlight'):
+                runs = hl.runs('\n'.join(item.lines))
+            result = []
+            j = 0
+            pos = 0
+            for line in item.lines:
+                end = pos + len(line)
+                line_runs = []
+                while j < len(runs):
+                    s, e, fmt = runs[j]
+                    if s >= end:
+                        break
+                    if e > pos:
+                        line_runs.append((max(s, pos) - pos, min(e, end) - pos, fmt))
+                    if e > end:
+                        # continues on the next line
+                        break
+                    j += 1
+                result.append(line_runs)
+                pos = end + 1
+        self._formats[i] = result
+        if len(self._formats) > self.FORMATS_CACHE_SIZE:
+            self._formats.popitem(last=False)
+        return result
+
+    def annotate(self, i, text, error=False):
+        """
+        Show short text (e.g. reply latency) in the gutter next to the i-th message
+        """
+        first = not self.annotations
+        self.annotations[i] = (text, error)
+        if first:
+            self.side.update_width(self.text.blockCount())
+            self.view._update_scrollbars()
+        self.side.update()
+        self.view.viewport().update()
+
+    def clear(self):
+        """
+        Remove all messages, together with their lines index, annotations and spilled copies
+        """
+        self.clear_annotations()
+        self.items.clear()
+        self.notify_set_changed()
+        if not self.isVisible():
+            # rendering is deferred while hidden, but the old document must not
+            # stay around to be painted against the emptied index
+            self.text.clear()
+
+    def clear_annotations(self):
+        if self.annotations:
+            self.annotations.clear()
+            self.side.update_width(self.text.blockCount())
+            self.view._update_scrollbars()
+
+    def annotations_width(self, metrics):
+        return metrics.width('999.9ms ') if self.annotations else 0
+
+    def draw_annotation(self, painter, rect, i):
+        text, error = self.annotations[i]
+        painter.save()
+        painter.setPen(QtGui.QColor('#c62828') if error else self.palette().color(QtGui.QPalette.Mid))
+        painter.drawText(rect.adjusted(4, 0, 0, 0), QtCore.Qt.AlignLeft, text)
+        painter.restore()
+
+    def timed(self, name):
+        """
+        Time the block into `name` timer of attached PerfStats, if any
+        """
+        return self.stats.timer(name) if self.stats else nullcontext()
+
+    @contextmanager
+    def hold(self):
+        """
+        Coalesce appends notified inside the block into a single
+        notify_set_changed('append', n) call on exit
+        """
+        self._held += 1
+        try:
+            yield
+        finally:
+            self._held -= 1
+            if not self._held and self._held_appends:
+                n, self._held_appends = self._held_appends, 0
+                self.notify_set_changed('append', n)
+
+    def notify_set_changed(self, kind='update', append_number=1):
+        if kind == 'append' and not append_number:
+            return
+        if self._held:
+            if kind == 'append':
+                self._held_appends += append_number
+                return
+            self._held_appends = 0
+        with self.timed('render'):
+            if kind == 'update':
+                self._formats.clear()
+                self.index.clear()
+                self.index.extend(self.items)
+            else:
+                self.index.extend(self.items[-append_number:])
+            self._render(kind, append_number)
+
+    def _render(self, kind='update', append_number=1):
+        if not self.isVisible():
+            # hidden outputs only keep the index up to date, see showEvent
+            if kind == 'update':
+                self._deferred, self._deferred_appends = 'update', 0
+            elif self._deferred != 'update':
+                self._deferred = 'append'
+                self._deferred_appends += append_number
+            return
+        if self.virtual:
+            return self.view.notify_set_changed(kind, append_number)
+        self._render_document(kind, append_number)
+
+    def showEvent(self, ev):
+        super().showEvent(ev)
+        if self._deferred:
+            kind, n = self._deferred, self._deferred_appends
+            self._deferred, self._deferred_appends = None, 0
+            with self.timed('render'):
+                self._catch_up(kind, n)
+        elif self._prepend_from is not None:
+            QtCore.QTimer.singleShot(0, self._prepend_chunk)
+
+    def _catch_up(self, kind, append_number):
+        """
+        Render changes made while the output was hidden in one pass.
+        A large backlog is rendered starting with the visible tail, older
+        messages are prepended above it in chunks afterwards
+        """
+        if self.virtual:
+            return self.view.notify_set_changed(kind, append_number)
+        first = len(self.items) - append_number
+        if kind == 'append' and first >= self.items.offset and self._prepend_from is None and \
+                self.index.total - self.index.first_line(first) <= self.CATCH_UP_LINES:
+            return self._render_document(kind, append_number)
+        visible = self.text.viewport().height() // max(1, self.text.fontMetrics().height()) + 1
+        start = self._message_at(self.index.total - 2 * visible)
+        self._render_document('update', start=start)
+        if start > self.items.offset:
+            self._prepend_from = start
+            QtCore.QTimer.singleShot(0, self._prepend_chunk)
+
+    def _message_at(self, line):
+        """
+        Resident message containing given line, the first resident one if it was spilled
+        """
+        if line <= 0 or not len(self.index):
+            return self.items.offset
+        return max(self.items.offset, self.index.locate(line)[0])
+
+    def _prepend_chunk(self):
+        """
+        Render a chunk of messages older than the first rendered one above it
+        """
+        end = self._prepend_from
+        if end is None or not self.isVisible():
+            return
+        start = self._message_at(self.index.first_line(end) - self.PREPEND_LINES)
+        if start >= end or end >= len(self.items):
+            self._prepend_from = None
+            return
+        text = self._compose(self.items[start:end])
+        text += '\n' if self.items[end].type == MessageTypes.SYSTEM else '\n\n'
+        vbar = self.text.verticalScrollBar()
+        from_bottom = vbar.maximum() - vbar.value()
+        with self.timed('render'):
+            QtGui.QTextCursor(self.text.document()).insertText(text)
+        vbar.setValue(vbar.maximum() - from_bottom)
+        self.side.update()
+        self._prepend_from = start if start > self.items.offset else None
+        if self._prepend_from is not None:
+            QtCore.QTimer.singleShot(0, self._prepend_chunk)
+
+    @staticmethod
+    def _compose(items, leading=False):
+        """
+        Join messages into document text
+
+        :param items: Messages
+        :param leading: Whether the first message needs a separator before it
+        """
+        parts = []
         for i, item in enumerate(items):
-            if (i != 0 or kind == 'append' and base_offset > 0) and item.type != MessageTypes.SYSTEM:
-                text += '\n'
-            part = '\n'.join(item.lines)
-            hl = self._get_highlighter(item.content, item.type)
-            if hl:
-                highlight.append((hl, part, len(text)))
-            text += part
+            # every message after the first one starts on a new line,
+            # appendPlainText() takes care of that for the first one
+            separator = '\n' if i != 0 else ''
+            if (i != 0 or leading) and item.type != MessageTypes.SYSTEM:
+                separator += '\n'
+            parts.append(separator)
+            parts.append('\n'.join(item.lines))
+        return ''.join(parts)
 
+    def _render_document(self, kind='update', append_number=1, start=None):
+        """
+        :param start: First message rendered on update, the first resident one by default
+        """
+        if kind == 'update':
+            self._prepend_from = None
+            items = self.items.resident() if start is None else self.items[start:]
+            self.text.setPlainText('')
+        else:
+            # messages spilled in the meantime are not rendered into the document
+            append_number = min(append_number, len(self.items) - self.items.offset)
+            items = self.items[-append_number:] if append_number else []
+        # only the very first message of the output has no separator before it
+        leading = kind == 'append' and (not self.text.document().isEmpty() or len(self.items) > append_number)
+        text = self._compose(items, leading)
         if text:
             self.text.appendPlainText(text)
-        for i, (hl, part, offset) in enumerate(highlight):
-            hl.highlight(part, self.text.document(), base_offset + offset, False)
+        if kind == 'append':
+            self._trim_document()
         self.side.update()
         self.text.verticalScrollBar().setValue(self.text.verticalScrollBar().maximum())
@@ -0,0 +1,173 @@
+from PyQt5 import QtWidgets, QtGui, QtCore
+from sockly.utils.helpers import MONOSPACE, get_font
+from sockly.utils.line_index import gutter_label
+
+
+class SocketOutputView(QtWidgets.QAbstractScrollArea):
+    """
+    Virtualized output view.
+    Paints only visible lines of SocketOutput.items using SocketOutput.index,
+    so neither appending nor scrolling depends on the capture size.
+
+    Click selects a message, Ctrl+C copies it
+    """
+    def __init__(self, output):
+        super().__init__()
+        self.output = output
+        self.font = get_font(MONOSPACE, 9)
+        self.setFont(self.font)
+        self.setFocusPolicy(QtCore.Qt.StrongFocus)
+        self.selected = None
+        self._fonts = {}
+
+        metrics = QtGui.QFontMetrics(self.font)
+        self._line_height = metrics.height()
+        self._ascent = metrics.ascent()
+        self._char_width = metrics.width('0')
+
+    def _gutter_width(self):
+        metrics = QtGui.QFontMetrics(self.font)
+        return max(
+            metrics.width(str(self.output.index.total)),
+            metrics.width(' ->>')
+        ) + 16 + self.output.annotations_width(metrics)
+
+    def _visible_lines(self):
+        return max(1, self.viewport().height() // self._line_height)
+
+    def _update_scrollbars(self):
+        visible = self._visible_lines()
+        vbar = self.verticalScrollBar()
+        vbar.setRange(0, max(0, self.output.index.total - visible))
+        vbar.setPageStep(visible)
+        vbar.setSingleStep(1)
+
+        text_width = self.viewport().width() - self._gutter_width()
+        hbar = self.horizontalScrollBar()
+        hbar.setRange(0, max(0, self.output.index.max_width * self._char_width + 8 - text_width))
+        hbar.setPageStep(max(1, text_width))
+        hbar.setSingleStep(self._char_width)
+
+    def _font(self, weight):
+        if weight not in self._fonts:
+            font = QtGui.QFont(self.font)
+            font.setWeight(weight)
+            self._fonts[weight] = font
+        return self._fonts[weight]
+
+    def notify_set_changed(self, kind='update', append_number=1):
+        """
+        Update the view after SocketOutput.items (and index) were changed
+
+        :param kind: `update` for full refresh, `append` for appended items
+        :param append_number: Number of appended items
+        """
+        if kind == 'update':
+            self.selected = None
+
+        vbar = self.verticalScrollBar()
+        at_bottom = vbar.value() >= vbar.maximum()
+        self._update_scrollbars()
+        if at_bottom or kind == 'update':
+            vbar.setValue(vbar.maximum())
+        self.viewport().update()
+
+    @staticmethod
+    def _line_runs(line, runs, first_col, last_col):
+        """
+        Split visible part of a line into formatted runs
+
+        :return: Iterator of (start, end, format or None) tuples
+        """
+        last_col = min(last_col, len(line))
+        pos = first_col
+        for s, e, fmt in runs or ():
+            if e <= pos:
+                continue
+            if s >= last_col:
+                break
+            if s > pos:
+                yield pos, s, None
+            yield max(s, pos), min(e, last_col), fmt
+            pos = min(e, last_col)
+        if pos < last_col:
+            yield pos, last_col, None
+
+    def paintEvent(self, ev):
+        painter = QtGui.QPainter(self.viewport())
+        palette = self.palette()
+        rect = self.viewport().rect()
+        gutter = self._gutter_width()
+        painter.fillRect(rect, palette.color(QtGui.QPalette.Base))
+        painter.fillRect(0, 0, gutter, rect.height(), palette.color(QtGui.QPalette.Window))
+
+        index = self.output.index
+        items = self.output.items
+        height = self._line_height
+        width = self._char_width
+        first_line = self.verticalScrollBar().value()
+        x_offset = self.horizontalScrollBar().value()
+        first_col = x_offset // width
+        last_col = first_col + (rect.width() - gutter) // width + 2
+        text_color = palette.color(QtGui.QPalette.Text)
+        text_rect = QtCore.QRect(gutter, 0, rect.width() - gutter, rect.height())
+
+        for row in range(rect.height() // height + 1):
+            line = first_line + row
+            if line >= index.total:
+                break
+            i, k = index.locate(line)
+            item = items[i]
+            top = row * height
+
+            painter.setClipping(False)
+            painter.setFont(self.font)
+            painter.setPen(palette.color(QtGui.QPalette.WindowText))
+            painter.drawText(QtCore.QRect(0, top + 2, gutter - 5, height), QtCore.Qt.AlignRight,
+                             gutter_label(item, k))
+            if k == 0 and i in self.output.annotations:
+                self.output.draw_annotation(painter, QtCore.QRect(0, top + 2, gutter - 5, height), i)
+            if k < 0:
+                continue
+
+            painter.setClipRect(text_rect)
+            if i == self.selected:
+                painter.fillRect(gutter, top, rect.width() - gutter, height,
+                                 palette.color(QtGui.QPalette.AlternateBase))
+            text = item.lines[k]
+            runs = self.output.line_formats(i, item)
+            baseline = top + 2 + self._ascent
+            for s, e, fmt in self._line_runs(text, runs and runs[k], first_col, last_col):
+                color = text_color
+                font = self.font
+                if fmt is not None:
+                    if fmt.hasProperty(QtGui.QTextFormat.ForegroundBrush):
+                        color = fmt.foreground().color()
+                    if fmt.hasProperty(QtGui.QTextFormat.FontWeight):
+                        font = self._font(fmt.fontWeight())
+                painter.setPen(color)
+                painter.setFont(font)
+                painter.drawText(QtCore.QPoint(gutter + 4 + s * width - x_offset, baseline), text[s:e])
+        painter.end()
+
+    def resizeEvent(self, ev):
+        super().resizeEvent(ev)
+        self._update_scrollbars()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def mousePressEvent(self, ev):
+        line = self.verticalScrollBar().value() + ev.pos().y() // self._line_height
+        self.selected = None
+        if line < self.output.index.total:
+            i, k = self.output.index.locate(line)
+            if k >= 0:
+                self.selected = i
+        self.viewport().update()
+
+    def keyPressEvent(self, ev):
+        if ev.matches(QtGui.QKeySequence.Copy) and self.selected is not None:
+            QtWidgets.QApplication.clipboard().setText('\n'.join(self.output.items[self.selected].lines))
+        else:
+            super().keyPressEvent(ev)
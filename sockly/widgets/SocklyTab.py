@@ -1,16 +1,20 @@
-import base64
 import os
 import os.path
-import pickle
+import time
+from itertools import islice
 
-import bson
 from PyQt5 import QtWidgets, QtCore
 from sockly.layouts.sockly_tab import layout_tab
 from sockly.structs import SocketMessage, MessageTypes, MessageContent
-from sockly.utils.SocketThread import SocketThread
-from sockly.utils.database import SocklyDB
-from sockly.utils.helpers import hexdump, ellipsize, debounce
-from sockly.utils.session_manager import validate_session, apply_session, create_session
+from sockly.utils.archive import get_archive
+from sockly.utils.database import get_database
+from sockly.utils.correlation import Correlator, parse_key_path, format_latency
+from sockly.utils.decoding import PayloadLines, parse_data, decode_frame, encode_input, SEND_MODES
+from sockly.utils.helpers import ellipsize, debounce
+from sockly.utils.hexdump import HexdumpLines
+from sockly.utils.perf_stats import PerfStats
+from sockly.utils import startup
+from sockly.utils.session_manager import validate_session, apply_session, create_session, save_session, SessionLog
 
 try:
     import ujson as json
@@ -19,6 +23,8 @@ except ImportError:
 
 
 class SocklyTab(QtWidgets.QWidget):
+    STREAM_CHUNK = 2000
+
     title_changed = QtCore.pyqtSignal(str)
     broadcast = QtCore.pyqtSignal(str, dict, int)
 
@@ -33,12 +39,33 @@ class SocklyTab(QtWidgets.QWidget):
         self.worker = None
         self.selected_fav = None
         self.filename = None
-        self.database = SocklyDB()
+        self.load_window = None
+        self.replay_window = None
+        self.recorder = None
+        # QueuedFrame the worker wrote last
+        self._last_sent = None
+        self._streaming = None
+        self._session_stored = None
+        self.database = get_database()
+        self.stats = PerfStats()
+        self.correlator = Correlator()
+        self.correlation_timer = QtCore.QTimer(self)
+        self.correlation_timer.timeout.connect(self.expire_requests)
         self._internal_splitter_update = False
-        layout_tab(self)
+        self.ping_timer = QtCore.QTimer(self)
+        self.ping_timer.timeout.connect(self.send_ping)
+        # incoming messages received while the tab was hidden
+        self.unread = 0
+        self.title_timer = QtCore.QTimer(self)
+        self.title_timer.setSingleShot(True)
+        self.title_timer.timeout.connect(self.update_title)
+        with startup.phase('tab layout'):
+            layout_tab(self)
         self.input.fileDropped.connect(self._input_file_dropped)
-        self.clear_output()
-        self.load_settings()
+        with startup.phase('tab output'):
+            self.clear_output()
+        with startup.phase('tab settings'):
+            self.load_settings()
 
     def _broadcast(self, kind, data):
         self.parent.broadcast.emit(kind, data, self.uid)
@@ -51,14 +78,39 @@ class SocklyTab(QtWidgets.QWidget):
             if r is not None:
                 wid.restoreState(r)
 
-        for attr in ('show_http', 'show_alive_checks', 'decode_bson'):
+        for attr, default in (
+                ('show_http', 1),
+                ('show_alive_checks', 1),
+                ('decode_bson', 1),
+                ('virtual_output', 0),
+                ('archive_messages', 0),
+                ('async_engine', 0),
+                ('correlate', 0),
+        ):
             wid = getattr(self, attr)
-            wid.setChecked(bool(self.database.get_int(attr, 1)))
+            wid.setChecked(bool(self.database.get_int(attr, default)))
             wid.stateChanged.connect(lambda t, a=attr: (
                 self.database.set_int(a, int(t)),
                 self._broadcast('checkbox', {'attr': a, 'val': t})
             ))
 
+        for attr, default in (
+                ('flush_interval', 16),
+                ('batch_cap', 1000),
+                ('ping_interval', 30),
+                ('correlation_timeout', 10),
+        ):
+            wid = getattr(self, attr)
+            wid.setValue(self.database.get_int(attr, default))
+            wid.valueChanged.connect(lambda v, a=attr: (
+                self.database.set_int(a, v),
+                self._broadcast('spinbox', {'attr': a, 'val': v})
+            ))
+
+        self.correlation_key.setText(self.database.get('correlation_key', 'id'))
+        self.correlate.toggled.connect(lambda _: self.on_correlation_changed())
+        self.on_correlation_changed()
+
     @debounce(0.25)
     def _on_splitter_update(self):
         main_val = self.main_splitter.saveState()
@@ -77,8 +129,64 @@ class SocklyTab(QtWidgets.QWidget):
 
     def cleanup(self):
         if self.worker:
-            self.worker.close()
-            self.worker.terminate()
+            # batches still queued by the worker must not reach the output cleared below
+            self.worker.events.flushed.disconnect(self.on_worker_events)
+            self.worker.shutdown()
+            self.worker = None
+        if self.load_window:
+            self.load_window.close()
+        if self.replay_window:
+            self.replay_window.close()
+        if self.recorder:
+            self.recorder.close()
+        self.output.clear()
+
+    def show_load(self):
+        if self.load_window is None:
+            from sockly.widgets.LoadWindow import LoadWindow
+            self.load_window = LoadWindow(self)
+            self.load_window.template_input.setPlainText(self.input.toPlainText())
+        self.load_window.show()
+        self.load_window.raise_()
+
+    def toggle_record(self):
+        if self.recorder:
+            self.recorder.close()
+            self.add_system('Recording stopped, {} frames saved to {}'.format(self.recorder.count,
+                                                                              self.recorder.filename))
+            self.recorder = None
+            self.toggle_record_btn.setText('Record')
+        else:
+            fname, ok = QtWidgets.QFileDialog().getSaveFileName(self, 'Choose file',
+                                                                filter='Sockly capture (*.sockcap);; All files (*.*)')
+            if not ok:
+                return
+            from sockly.utils.capture import CaptureWriter
+            try:
+                self.recorder = CaptureWriter(fname, {'name': self.tabname_input.text(), 'url': self.url_input.text()})
+            except OSError as e:
+                return self.add_error(str(e))
+            self.add_system('Recording to ' + fname)
+            self.toggle_record_btn.setText('Stop recording')
+        if self.worker:
+            self.worker.recorder = self.recorder
+
+    def show_replay(self):
+        if self.replay_window is None:
+            from sockly.widgets.ReplayWindow import ReplayWindow
+            self.replay_window = ReplayWindow(self)
+        self.replay_window.show()
+        self.replay_window.raise_()
+
+    def on_replayed_frames(self, frames):
+        # rendered only: replayed traffic is neither archived (with the time of the replay),
+        # nor fed to the correlator, nor counted as unread
+        with self.output.hold():
+            for frame in frames:
+                self.render_message(SocketMessage(frame.direction, *self.parse_data(frame.payload)))
+
+    def on_retention_changed(self):
+        self.output.set_retention(self.retention_messages.value(), self.retention_mb.value() * 1024 * 1024)
 
     def set_input(self, data):
         self.input.setPlainText(data)
@@ -97,8 +205,43 @@ class SocklyTab(QtWidgets.QWidget):
         if not self.filename:
             self.filename = self.save_as()
         else:
-            with open(self.filename, 'wb') as f:
-                pickle.dump(create_session(self), f)
+            self._write_session(self.filename)
+
+    def _write_session(self, filename):
+        self._finish_streaming()
+        stored = self._session_stored[1] if self._session_stored and self._session_stored[0] == filename else 0
+        if stored > len(self.output.items):
+            stored = 0
+        count = save_session(filename, create_session(self), self.output.items, stored)
+        self._session_stored = (filename, count)
+
+    def stream_messages(self, messages):
+        """
+        Load messages into the output in chunks, so the tab is usable right away
+
+        :param messages: Sequence of SocketMessage's, e.g. session_manager.SessionLog
+        """
+        self._streaming = iter(messages)
+        self._session_stored = (messages.filename, len(messages)) if isinstance(messages, SessionLog) else None
+        self._stream_chunk()
+
+    def _stream_chunk(self):
+        if self._streaming is None:
+            return
+        chunk = list(islice(self._streaming, self.STREAM_CHUNK))
+        if len(chunk) < self.STREAM_CHUNK:
+            self._streaming = None
+        else:
+            QtCore.QTimer.singleShot(0, self._stream_chunk)
+        self.output.items.extend(chunk)
+        self.output.notify_set_changed('append', len(chunk))
+
+    def _finish_streaming(self):
+        if self._streaming is not None:
+            chunk = list(self._streaming)
+            self._streaming = None
+            self.output.items.extend(chunk)
+            self.output.notify_set_changed('append', len(chunk))
 
     def on_broadcast(self, kind, data, sender):
         if sender == self.uid:
@@ -108,14 +251,15 @@ class SocklyTab(QtWidgets.QWidget):
             self.right_splitter.restoreState(data['right'])
         if kind == 'checkbox':
             getattr(self, data['attr']).setChecked(data['val'])
+        if kind == 'spinbox':
+            getattr(self, data['attr']).setValue(data['val'])
 
     def save_as(self):
         fname, ok = QtWidgets.QFileDialog().getSaveFileName(self, 'Choose file', filter='Sockly session (*.sly);;'
                                                                                         ' All files (*.*)')
         if not ok:
             return None
-        with open(fname, 'wb') as f:
-            pickle.dump(create_session(self), f)
+        self._write_session(fname)
         return fname
 
     def open(self):
@@ -150,22 +294,35 @@ class SocklyTab(QtWidgets.QWidget):
 
     def toggle_connect(self):
         if self.state == 'idle':
-            self.worker = SocketThread(self._create_worker_config())
-            self.worker.signal.connect(self.on_worker_event)
+            if self.async_engine.isChecked():
+                from sockly.utils.AsyncEngine import AsyncConnection as worker_class
+            else:
+                from sockly.utils.SocketThread import SocketThread as worker_class
+            self.worker = worker_class(self._create_worker_config(), self.stats)
+            self.worker.recorder = self.recorder
+            self.worker.events.flushed.connect(self.on_worker_events)
+            self._last_sent = None
+            self.update_send_queue()
             self.worker.start()
         elif self.state == 'connected':
             self.worker.close()
         elif self.state in ('connecting', 'backoff'):
             self.on_disconnect()
             self.add_system('Connection dropped by user')
-            self.worker.terminate()
+            self.worker.shutdown()
 
-    def on_worker_event(self, ev):
+    def on_worker_events(self, events):
+        with self.output.hold():
+            for ev, message, key in events:
+                self.on_worker_event(ev, message, key)
+
+    def on_worker_event(self, ev, message=None, key=None):
         if ev.name == 'connecting':
             self.send_button.setEnabled(False)
             self.toggle_connect_btn.setText('Cancel')
             self.toggle_controls(False)
             self.state = 'connecting'
+            self.rtt_label.setText('RTT: no pongs yet')
             self.add_system('Connecting...')
             self.open_btn.setEnabled(False)
             self.update_title()
@@ -174,8 +331,11 @@ class SocklyTab(QtWidgets.QWidget):
             self.toggle_connect_btn.setText('Disconnect')
             self.state = 'connected'
             self.add_system('Connected!', *(format_response(ev.response) if self.show_http.isChecked() else []))
+            self.on_ping_interval_changed()
+            self.send_ping()
         elif ev.name == 'back_off':
             self.state = 'backoff'
+            self.ping_timer.stop()
             self.send_button.setEnabled(False)
             self.toggle_connect_btn.setText('Cancel')
             self.add_system('Reconnecting in ' + str(round(ev.delay, 1)))
@@ -187,17 +347,24 @@ class SocklyTab(QtWidgets.QWidget):
             self.add_error(ev.reason)
         elif ev.name == 'poll' and self.show_alive_checks.isChecked():
             self.add_system('->> Poll')
-        elif ev.name == 'pong' and self.show_alive_checks.isChecked():
-            self.add_system('<<- Pong: ' + str(ev.data))
+        elif ev.name == 'pong':
+            rtt = self.worker.rtt.result(ev.data)
+            if rtt is not None:
+                self.update_rtt()
+            if self.show_alive_checks.isChecked():
+                self.add_system('<<- Pong: ' + (format_ms(rtt) if rtt is not None else str(ev.data)))
         elif ev.name == 'ping' and self.show_alive_checks.isChecked():
             self.add_system('<<- Ping: ' + str(ev.data))
         elif ev.name == 'text' or ev.name == 'binary':
-            self.add_incoming(ev.text if ev.name == 'text' else ev.data)
+            self.add_incoming(ev.text if ev.name == 'text' else ev.data, message, ev.received_time, key)
+        elif ev.name == 'sent':
+            self.on_frame_sent(ev)
         elif ev.name == 'disconnected':
             self.on_disconnect()
             self.add_system('Disconnected ({}), {}'.format(ev.reason, 'graceful' if ev.graceful else 'failure'))
 
     def on_disconnect(self):
+        self.ping_timer.stop()
         self.send_button.setEnabled(False)
         self.toggle_connect_btn.setEnabled(True)
         self.toggle_connect_btn.setText('Connect')
@@ -206,9 +373,63 @@ class SocklyTab(QtWidgets.QWidget):
         self.toggle_controls(True)
         self.update_title()
 
+    def on_correlation_key_changed(self):
+        self.database.set('correlation_key', self.correlation_key.text())
+        self.on_correlation_changed()
+
+    def on_correlation_changed(self):
+        self.correlator.path = parse_key_path(self.correlation_key.text())
+        self.correlator.timeout = self.correlation_timeout.value()
+        if self.worker:
+            # incoming keys are extracted by the worker, while decoding
+            self.worker.config['correlation_key'] = self.correlation_key_path
+        if self.correlate.isChecked():
+            self.correlation_timer.start(500)
+        else:
+            self.correlation_timer.stop()
+
+    def expire_requests(self):
+        for i in self.correlator.expire(time.time()):
+            self.output.annotate(i, 'no reply', True)
+        if self.latency_panel and self.latency_panel.isVisible():
+            self.latency_panel.refresh()
+
+    def on_panel_tab_changed(self, widget):
+        if widget is self.perf_tab and self.perf_panel is None:
+            from sockly.widgets.PerfPanel import PerfPanel
+            self.perf_panel = PerfPanel(self.stats, lambda: len(self.worker.events) if self.worker else 0)
+            self.perf_tab.layout().addWidget(self.perf_panel)
+        elif widget is self.latency_tab and self.latency_panel is None:
+            from sockly.widgets.LatencyPanel import LatencyPanel
+            self.latency_panel = LatencyPanel(self.correlator)
+            self.latency_tab.layout().addWidget(self.latency_panel)
+
+    def on_ping_interval_changed(self):
+        if self.ping_interval.value() and self.state == 'connected':
+            self.ping_timer.start(self.ping_interval.value() * 1000)
+        else:
+            self.ping_timer.stop()
+
+    def send_ping(self):
+        if not self.ping_interval.value() or not self.worker or not self.worker.conn.is_active:
+            return
+        # written by the network thread, which may be busy writing a large frame
+        self.worker.send_ping()
+        self.update_send_queue()
+        if self.show_alive_checks.isChecked():
+            self.add_system('->> Ping')
+
+    def update_rtt(self):
+        s = self.worker.rtt.summary()
+        self.rtt_label.setText('RTT: {} / {} / {} / {}, {} pongs, {} lost'.format(
+            *(format_ms(s[k]) for k in ('min', 'p50', 'p99', 'max')), s['count'], s['lost']
+        ))
+
     def clear_output(self):
-        self.output.items.clear()
-        self.output.notify_set_changed()
+        self._streaming = None
+        self._session_stored = None
+        self.correlator.reset()
+        self.output.clear()
         self.add_system('Welcome to Sockly')
 
     def toggle_controls(self, val):
@@ -235,19 +456,22 @@ class SocklyTab(QtWidgets.QWidget):
             'headers': self._create_headers(),
             'proxy': self.proxy_input.text() if self.proxy_enabled.isChecked() else None,
             'compress': self.conn_use_compression.isChecked(),
-            'persist': self.conn_persist.isChecked()
+            'persist': self.conn_persist.isChecked(),
+            'flush_interval': self.flush_interval.value(),
+            'batch_cap': self.batch_cap.value(),
+            'decode_bson': self.decode_bson.isChecked(),
+            'correlation_key': self.correlation_key_path,
+            # pings are sent by the tab itself, see send_ping
+            'ping_rate': 0,
         }
 
+    @property
+    def correlation_key_path(self):
+        return self.correlator.path if self.correlate.isChecked() else None
+
     @property
     def current_send_mode(self):
-        for i in (
-                'plain_text',
-                'binary',
-                'hex',
-                'base64',
-                'json',
-                'bson',
-        ):
+        for i in SEND_MODES:
             if getattr(self, 'send_{}_radio'.format(i)).isChecked():
                 return i
         return None
@@ -256,81 +480,101 @@ class SocklyTab(QtWidgets.QWidget):
         if not self.worker or not self.worker.conn.is_active:
             return self.add_error('connection is not active')
         data = self.input.toPlainText()
-        res = self._validate(data)
+        sm = self.current_send_mode
+        res = encode_input(data, sm)
         if isinstance(res, ValueError):
             return self.add_error(res.args[0])
+        res, value = res
         self.add_history_item(data)
-        self.worker.send(res)
-        sm = self.current_send_mode
+        frame = self.worker.send(res, tag=len(self.output.items))
+        self.update_send_queue()
         if sm == 'plain_text':
             content = MessageContent.PLAIN
-            data = data.split('\n')
-        elif sm == 'json':
-            content = MessageContent.JSON
-            data = json.dumps(json.loads(data), indent=2).split('\n')
-        elif sm == 'bson':
-            content = MessageContent.BSON
-            data = json.dumps(json.loads(data), indent=2).split('\n')
+            data = PayloadLines(data, content)
+        elif sm in ('json', 'bson'):
+            content = MessageContent.JSON if sm == 'json' else MessageContent.BSON
+            data = PayloadLines(res, content, json.dumps(value, indent=2).split('\n'))
         else:
             content = MessageContent.BINARY
-            data = hexdump(res)
-        self.output.items.append(SocketMessage(
+            data = HexdumpLines(res)
+        self.add_message(SocketMessage(
             MessageTypes.OUTGOING,
             data,
             content
         ))
-        self.output.notify_set_changed('append')
-
-    def _validate(self, data):
-        sm = self.current_send_mode
-        if sm == 'plain_text':
-            return data
-        if sm == 'binary':
-            return data.encode()
-        if sm == 'hex':
-            try:
-                return bytes.fromhex(data)
-            except ValueError:
-                return ValueError('Invalid hex!')
-        if sm == 'base64':
-            try:
-                return base64.b64decode(data.encode())
-            except:
-                return ValueError('Invalid Base64!')
-        if sm == 'json':
-            try:
-                return json.dumps(json.loads(data))  # validate and minify
-            except:
-                return ValueError('Invalid JSON!')
-        if sm == 'bson':
-            try:
-                return bson.dumps(json.loads(data))
-            except:
-                return ValueError('Invalid JSON!')
+        if value is not None and self.correlate.isChecked():
+            duplicates = self.correlator.duplicates
+            # latency counts from the frame's write, known by the time a reply comes
+            self.correlator.request(value, len(self.output.items) - 1, frame)
+            if self.correlator.duplicates > duplicates:
+                self.output.annotate(len(self.output.items) - 1, 'duplicate key', True)
+
+    def on_frame_sent(self, ev):
+        frame = ev.frame
+        if frame.ping:
+            # a failed ping is just never answered
+            return self.update_send_queue()
+        if frame.error:
+            self.add_error('message not sent: ' + frame.error)
+        else:
+            self.stats.count('out', frame.size)
+        self.update_send_queue(frame)
+
+    def update_send_queue(self, frame=None):
+        """
+        :param frame: QueuedFrame written last, if any
+        """
+        if frame is not None:
+            self._last_sent = frame
+        text = 'Send queue: {} queued'.format(len(self.worker.queue))
+        if self._last_sent is not None:
+            text += ', last: waited {}, written in {}'.format(format_ms(self._last_sent.waited),
+                                                             format_ms(self._last_sent.write_time))
+        self.send_label.setText(text)
 
     def add_system(self, text, *additional):
-        self.output.items.append(SocketMessage(
+        self.add_message(SocketMessage(
             MessageTypes.SYSTEM,
             [text, *additional],
             MessageContent.PLAIN
         ))
-        self.output.notify_set_changed('append')
 
     def add_error(self, text, *additional):
         self.add_system('Error: ' + text, *additional)
 
-    def add_incoming(self, data):
-        self.output.items.append(SocketMessage(
-            MessageTypes.INCOMING,
-            *self.parse_data(data)
-        ))
+    def add_incoming(self, data, message=None, received_at=None, key=None):
+        """
+        :param data: Frame payload
+        :param message: Already decoded message, if any
+        :param received_at: Unix time the frame was received at, now by default
+        :param key: Correlation key extracted along with decoded message, if any
+        """
+        if message is None:
+            with self.stats.timer('parse'):
+                message, key = decode_frame(data, self.decode_bson.isChecked(), self.correlation_key_path)
+        self.add_message(message)
+        if key is not None and self.correlate.isChecked():
+            match = self.correlator.response(key, received_at or time.time())
+            if match:
+                request, latency = match
+                self.output.annotate(request, format_latency(latency))
+                self.output.annotate(len(self.output.items) - 1, format_latency(latency))
+
+    def render_message(self, message):
+        self.output.items.append(message)
         self.output.notify_set_changed('append')
 
+    def add_message(self, message):
+        self.render_message(message)
+        if message.type != MessageTypes.SYSTEM and self.archive_messages.isChecked():
+            get_archive().add(self.tabname_input.text(), self.url_input.text(), message)
+        if message.type == MessageTypes.INCOMING and not self.isVisible():
+            self.unread += 1
+            if not self.title_timer.isActive():
+                self.title_timer.start(250)
+
     def on_json(self, enabled):
-        if enabled:
-            self.input.jhl.highlight(self.input.toPlainText(), self.input.document())
-        else:
-            self.input.jhl.reset(self.input.document())
+        self.input_highlighter.set_enabled(self.send_json_radio.isChecked() or self.send_bson_radio.isChecked())
 
     def on_bson(self, enabled):
         self.on_json(enabled)
@@ -382,7 +626,16 @@ class SocklyTab(QtWidgets.QWidget):
         self.history_list.addItems(self.history)
 
     def update_title(self):
-        self.title_changed.emit(self.generate_title())
+        title = self.generate_title()
+        if self.unread:
+            title = '({}) {}'.format(self.unread, title)
+        self.title_changed.emit(title)
+
+    def showEvent(self, ev):
+        super().showEvent(ev)
+        if self.unread:
+            self.unread = 0
+            self.update_title()
 
     def generate_title(self):
         url = self.url_input.text()
@@ -416,6 +669,7 @@ class SocklyTab(QtWidgets.QWidget):
             elif sm == 'hex':
                 self.input.insertPlainText(data.hex())
             elif sm == 'base64':
+                import base64
                 self.input.setPlainText(base64.b64encode(data).decode())
             elif sm == 'json':
                 try:
@@ -423,33 +677,23 @@ class SocklyTab(QtWidgets.QWidget):
                 except:
                     pass
             elif sm == 'bson':
+                import bson
                 try:
                     self.input.insertPlainText(json.dumps(bson.loads(data), indent=2))
                 except:
                     pass
 
     def parse_data(self, data):
-        text = []
-        typ = None
+        with self.stats.timer('parse'):
+            return parse_data(data, self.decode_bson.isChecked())
+
+    def on_decode_bson(self, enabled):
+        if self.worker:
+            self.worker.config['decode_bson'] = enabled
 
-        if type(data) is bytes:
-            try:
-                if not self.decode_bson.isChecked():
-                    raise Exception()
-                text = json.dumps(bson.loads(data), indent=2).split('\n')
-                typ = MessageContent.BSON
-            except:
-                text = hexdump(data)
-                typ = MessageContent.BINARY
-        else:
-            try:
-                text = json.dumps(json.loads(data), indent=2).split('\n')
-                typ = MessageContent.JSON
-            except:
-                text = data.split('\n')
-                typ = MessageContent.PLAIN
 
-        return text, typ
+def format_ms(seconds):
+    return '{:.2f} ms'.format(seconds * 1000)
 
 
 def format_response(rsp):
@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# before anything imports sockly: the settings database lives in HOME,
+# tests must never touch the user's one
+os.environ['HOME'] = os.environ['APPDATA'] = tempfile.mkdtemp(prefix='sockly-tests-')
+os.makedirs(os.path.join(os.environ['HOME'], '.config'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
@@ -0,0 +1,109 @@
+import time
+
+import pytest
+from lomond import events
+
+from benchmarks.ws_server import StandInServer
+from sockly.structs import MessageTypes
+from sockly.utils.capture import CaptureWriter, CaptureReader, CaptureSender, MAGIC
+from sockly.utils.send_queue import SendQueue
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'c.sockcap')
+    writer = CaptureWriter(path, {'url': 'ws://localhost/'})
+    writer.record(MessageTypes.OUTGOING, '{"id": 1}', writer.started + 0.5)
+    writer.record(MessageTypes.INCOMING, b'\x00\xff', writer.started + 1.25)
+    writer.record(MessageTypes.INCOMING, 'ünïcode')
+    writer.close()
+    # closed captures ignore late frames
+    writer.record(MessageTypes.INCOMING, 'late')
+    assert writer.count == 3
+
+    reader = CaptureReader(path)
+    assert reader.header['url'] == 'ws://localhost/'
+    assert 'started' in reader.header
+    frames = list(reader)
+    assert [(f.direction, f.payload) for f in frames] == [
+        (MessageTypes.OUTGOING, '{"id": 1}'),
+        (MessageTypes.INCOMING, b'\x00\xff'),
+        (MessageTypes.INCOMING, 'ünïcode'),
+    ]
+    assert [f.time for f in frames[:2]] == [0.5, 1.25]
+    # readable more than once
+    assert len(list(reader)) == 3
+
+
+def test_cut_short(tmp_path):
+    path = tmp_path / 'c.sockcap'
+    writer = CaptureWriter(str(path), {})
+    for i in range(3):
+        writer.record(MessageTypes.INCOMING, 'frame %d' % i)
+    writer.close()
+    path.write_bytes(path.read_bytes()[:-3])
+    assert [f.payload for f in CaptureReader(str(path))] == ['frame 0', 'frame 1']
+
+
+def test_not_a_capture(tmp_path):
+    path = tmp_path / 'c.sockcap'
+    path.write_bytes(b'something else')
+    with pytest.raises(ValueError):
+        CaptureReader(str(path))
+    path.write_bytes(MAGIC + b'\x10\x00\x00\x00{"broken')
+    with pytest.raises(ValueError):
+        CaptureReader(str(path))
+
+
+def test_on_event(tmp_path):
+    path = str(tmp_path / 'c.sockcap')
+    writer = CaptureWriter(path, {})
+    writer.on_event(events.Text('in'))
+    writer.on_event(events.Binary(b'\x01'))
+    writer.on_event(events.Ping(b''))
+
+    def write(payload, compressed):
+        if payload == 'bad':
+            raise OSError('Broken pipe')
+
+    queue = SendQueue(write, writer.on_event)
+    frame = queue.put('out')
+    queue.put('bad')
+    # waits in the queue before it is written
+    time.sleep(0.2)
+    queue.drain()
+    writer.close()
+
+    frames = list(CaptureReader(path))
+    # outgoing frames are recorded once written, failed ones aren't
+    assert [(f.direction, f.payload) for f in frames] == [
+        (MessageTypes.INCOMING, 'in'),
+        (MessageTypes.INCOMING, b'\x01'),
+        (MessageTypes.OUTGOING, 'out'),
+    ]
+    sent = frames[-1].time
+    assert sent - frames[1].time >= 0.2
+    assert abs(sent - (frame.write_started - CaptureReader(path).header['started'])) < 0.05
+
+
+def test_sender(tmp_path):
+    path = str(tmp_path / 'c.sockcap')
+    writer = CaptureWriter(path, {})
+    for i in range(20):
+        writer.record(MessageTypes.OUTGOING, 'out %d' % i)
+        writer.record(MessageTypes.INCOMING, 'in %d' % i)
+    writer.close()
+
+    server = StandInServer(echo=True).start()
+    config = {'url': server.url, 'headers': {}, 'proxy': None, 'compress': False, 'persist': False}
+    sender = CaptureSender(config, CaptureReader(path), speed=0)
+    sender.start()
+    try:
+        deadline = time.time() + 10
+        while (not sender.finished or sender.replies < 20) and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        sender.stop()
+        server.stop()
+    assert sender.finished
+    assert (sender.sent, sender.replies, sender.errors) == (20, 20, 0)
+    assert sender.summary() == 'done, sent 20, 20 replies, 0 errors'
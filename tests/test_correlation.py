@@ -0,0 +1,109 @@
+import bson
+
+from sockly.structs import MessageContent
+from sockly.utils.correlation import Correlator, BUCKETS, parse_key_path, extract_key, format_latency
+from sockly.utils.decoding import decode_frame
+from sockly.utils.send_queue import QueuedFrame
+
+
+def test_key_path():
+    assert parse_key_path('id') == ['id']
+    assert parse_key_path(' params.0.id ') == ['params', 0, 'id']
+    assert parse_key_path('a..-1') == ['a', -1]
+    assert parse_key_path('') == []
+
+    value = {'id': 7, 'params': [{'id': 'x'}, 2], '0': {'k': [1, 2]}, 'none': None}
+    assert extract_key(value, ['id']) == 7
+    assert extract_key(value, ['params', 0, 'id']) == 'x'
+    assert extract_key(value, ['params', -1]) == 2
+    # unhashable values are keyed by their JSON
+    assert extract_key(value, [0, 'k']) == extract_key({'k': [1, 2]}, ['k'])
+    assert type(extract_key(value, [0, 'k'])) is str
+    assert extract_key(value, ['params', 5]) is None
+    assert extract_key(value, ['id', 'x']) is None
+    assert extract_key(value, ['none']) is None
+    assert extract_key(value, []) is None
+    assert extract_key('text', ['id']) is None
+
+
+def test_format_latency():
+    assert format_latency(0.0012) == '1.2ms'
+    assert format_latency(2.5) == '2.50s'
+
+
+def test_request_response():
+    correlator = Correlator()
+    assert correlator.request({'id': 1}, 0, 100.0)
+    assert not correlator.request({'no': 'key'}, 1, 100.0)
+    assert correlator.request({'id': 2}, 2, 100.5)
+    assert correlator.response(3, 101.0) is None
+    assert correlator.response(None, 101.0) is None
+    assert correlator.response(2, 101.0) == (2, 0.5)
+    assert correlator.response(2, 101.0) is None
+    assert list(correlator.pending) == [1]
+
+    s = correlator.summary()
+    assert (s['answered'], s['unanswered'], s['pending'], s['duplicates']) == (1, 0, 1, 0)
+    assert s['min'] == s['max'] == 0.5
+
+
+def test_latency_from_write():
+    correlator = Correlator()
+    frame = QueuedFrame('{"id": 1}')
+    frame.enqueued = 100.0
+    correlator.request({'id': 1}, 0, frame)
+    # written after waiting in the send queue
+    frame.write_started = 100.8
+    index, latency = correlator.response(1, 101.0)
+    assert index == 0
+    assert abs(latency - 0.2) < 1e-9
+
+
+def test_duplicates():
+    correlator = Correlator()
+    assert correlator.request({'id': 1}, 0, 100.0)
+    assert not correlator.request({'id': 1}, 1, 100.5)
+    assert correlator.duplicates == 1
+    # the request sent first keeps waiting for its reply
+    assert correlator.response(1, 101.0) == (0, 1.0)
+    assert correlator.summary()['duplicates'] == 1
+    correlator.reset()
+    assert correlator.duplicates == 0
+
+
+def test_expire():
+    correlator = Correlator(timeout=10)
+    unsent = QueuedFrame('{"id": 3}')
+    unsent.enqueued = 105.0
+    correlator.request({'id': 1}, 0, 100.0)
+    correlator.request({'id': 2}, 1, 102.0)
+    correlator.request({'id': 3}, 2, unsent)
+    assert correlator.expire(111.0) == [0]
+    assert correlator.expire(116.0) == [1, 2]
+    assert correlator.unanswered == 3
+    assert not correlator.pending
+
+
+def test_histogram():
+    correlator = Correlator(window=3)
+    for i, latency in enumerate((0.0005, 0.003, 0.003, 100)):
+        correlator.request({'id': i}, i, 0.0)
+        correlator.response(i, latency)
+    counts = correlator.histogram()
+    assert len(counts) == len(BUCKETS)
+    # only the latest 3 are kept
+    assert sum(counts) == 3
+    assert counts[BUCKETS.index(0.005)] == 2
+    assert counts[-1] == 1
+
+
+def test_decode_frame_key():
+    message, key = decode_frame('{"id": 5, "result": true}', key_path=['id'])
+    assert message.content == MessageContent.JSON
+    assert key == 5
+    message, key = decode_frame(bson.dumps({'id': 'b'}), key_path=['id'])
+    assert message.content == MessageContent.BSON
+    assert key == 'b'
+    assert decode_frame('{"id": 5}')[1] is None
+    assert decode_frame('5', key_path=['id'])[1] is None
+    assert decode_frame('plain id', key_path=['id'])[1] is None
@@ -0,0 +1,28 @@
+from sockly.utils.database import SocklyDB
+
+
+def test_migrations_rerun(tmp_path):
+    path = str(tmp_path / 'sockly.db')
+    database = SocklyDB(path)
+    database.archive_messages([('s', 'tab', 'ws://localhost/', 2, 0, 1.0, 'hello world')])
+    # older builds rewrote the version, so migrations may run again on an upgraded database
+    database.query("update __desu_wrapper__ set v = '1' where k = 'version'")
+    database.close()
+
+    database = SocklyDB(path)
+    assert database._internal_store_get('version') == str(database.v)
+    assert [row['snippet'] for row in database.search_messages('world')] == ['hello [world]']
+    database.archive_messages([('s', 'tab', 'ws://localhost/', 2, 0, 2.0, 'world again')])
+    assert len(database.search_messages('world')) == 2
+
+
+def test_prune_messages(tmp_path):
+    database = SocklyDB(str(tmp_path / 'sockly.db'))
+    assert database.prune_messages(10) == 0
+    database.archive_messages([('s', 'tab', 'ws://localhost/', 2, 0, float(i), 'message %d' % i) for i in range(95)])
+    assert database.prune_messages(10, chunk=7) == 85
+    assert database.prune_messages(10) == 0
+    rows = database.query('select body from messages order by id')
+    assert [row['body'] for row in rows] == ['message %d' % i for i in range(85, 95)]
+    # pruned from the full-text index too
+    assert len(database.search_messages('message')) == 10
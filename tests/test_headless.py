@@ -0,0 +1,79 @@
+import json
+import subprocess
+import sys
+
+import bson
+
+from benchmarks.ws_server import StandInServer, TEXT, BINARY
+from sockly.utils.decoding import encode_data
+
+# runs headless the way `python -m sockly --headless` does, and reports whether any widgets were loaded
+RUNNER = '''
+import sys
+from sockly.headless import main
+code = main(sys.argv[1:])
+print('qt loaded:', 'PyQt5.QtWidgets' in sys.modules or 'PyQt5.QtGui' in sys.modules, file=sys.stderr)
+sys.exit(code)
+'''
+
+
+def run_headless(*args, stdin=None):
+    proc = subprocess.run([sys.executable, '-c', RUNNER, '--headless', *args], input=stdin,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+    return proc.returncode, proc.stdout.decode(), proc.stderr.decode()
+
+
+def test_ndjson():
+    server = StandInServer([
+        (TEXT, b'{"a": [1, 2]}'),
+        (TEXT, b'plain'),
+        (BINARY, b'\x00\x01\xff'),
+        (BINARY, bson.dumps({'b': 2})),
+    ], echo=True).start()
+    try:
+        code, out, err = run_headless(server.url, '--send', '-', '--mode', 'json', '--ndjson', '--count', '5',
+                                      stdin=b'{"sent": true}\nnot json\n')
+    finally:
+        server.stop()
+
+    assert code == 0, err
+    records = [json.loads(line) for line in out.splitlines()]
+    assert len(records) == 5
+    for record in records:
+        assert set(record) == {'time', 'content', 'size', 'data'}
+    by_data = {json.dumps(r['data'], sort_keys=True): (r['content'], r['size']) for r in records}
+    assert by_data[json.dumps({'a': [1, 2]})] == ('json', 13)
+    assert by_data[json.dumps('plain')] == ('plain', 5)
+    assert by_data[json.dumps('0001ff')] == ('binary', 3)
+    assert by_data[json.dumps({'b': 2})] == ('bson', len(bson.dumps({'b': 2})))
+    # sent minified, echoed back
+    sent = len(encode_data('{"sent": true}', 'json').encode())
+    assert by_data[json.dumps({'sent': True})] == ('json', sent)
+
+    assert 'Error: Invalid JSON!' in err
+    summary = [line for line in err.splitlines() if line.startswith('received ')]
+    assert len(summary) == 1
+    assert summary[0].startswith('received 5 frames (')
+    assert ', sent 1 frames ({} bytes) in '.format(sent) in summary[0]
+    assert 'qt loaded: False' in err
+
+
+def test_encoded_sizes():
+    server = StandInServer([], echo=True).start()
+    try:
+        code, out, err = run_headless(server.url, '--send', '-', '--quiet', '--count', '1', stdin='ünï\n'.encode())
+    finally:
+        server.stop()
+
+    assert code == 0, err
+    # bytes on the wire, not characters
+    assert 'received 1 frames (5 bytes), sent 1 frames (5 bytes) in ' in err
+
+
+def test_connect_fail():
+    code, out, err = run_headless('ws://127.0.0.1:1/', '--duration', '1')
+    assert code == 1
+    assert out == ''
+    assert 'Error: ' in err
+    assert 'received 0 frames (0 bytes), sent 0 frames (0 bytes)' in err
+    assert 'qt loaded: False' in err
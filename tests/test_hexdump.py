@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from sockly.utils.hexdump import HexdumpLines, hexdump
+
+
+def reference_hexdump(src, length=16, sep='.'):
+    # the byte-by-byte implementation HexdumpLines replaced, bytes input only
+    filter_ = ''.join([(len(repr(chr(x))) == 3) and chr(x) or sep for x in range(256)])
+    lines = []
+    for c in range(0, len(src), length):
+        chars = src[c:c + length]
+        hexstr = ' '.join(['{:02x}'.format(x) for x in chars])
+        printable = ''.join(['{}'.format((x <= 127 and filter_[x]) or sep) for x in chars])
+        lines.append('%08x:  %-*s  |%s|' % (c, length * 3, hexstr, printable))
+    return lines
+
+
+SIZES = [0, 1, 15, 16, 17, 31, 32, 33, 1000, 4099]
+
+
+@pytest.mark.parametrize('length', [16, 8, 5])
+@pytest.mark.parametrize('size', SIZES)
+def test_same_as_reference(size, length):
+    rng = random.Random(size)
+    data = bytes(rng.getrandbits(8) for _ in range(size))
+    expected = reference_hexdump(data, length)
+    lines = HexdumpLines(data, length)
+
+    assert hexdump(data, length) == expected
+    assert list(lines) == expected
+    assert len(lines) == len(expected)
+    # rows formatted one by one match the bulk ones
+    assert [lines[i] for i in range(len(lines))] == expected
+    assert lines[-3:] == expected[-3:]
+    assert lines.width == max(map(len, expected), default=0)
+
+
+def test_every_byte():
+    data = bytes(range(256)) * 2
+    assert hexdump(data) == reference_hexdump(data)
+    assert hexdump(data, sep='?') == reference_hexdump(data, sep='?')
+
+
+def test_out_of_range():
+    lines = HexdumpLines(b'x' * 17)
+    assert lines[-2] == lines[0]
+    with pytest.raises(IndexError):
+        lines[2]
+    with pytest.raises(IndexError):
+        lines[-3]
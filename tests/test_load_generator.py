@@ -0,0 +1,17 @@
+from lomond import events
+
+from sockly.utils.load_generator import LoadGenerator, payload_size
+
+
+def test_payload_size():
+    assert payload_size('plain') == 5
+    assert payload_size('ünï') == 5
+    assert payload_size(b'\x00\xff') == 2
+
+
+def test_reply_bytes():
+    generator = LoadGenerator({'url': 'ws://localhost/'}, ['x'], connections=0, engine=object())
+    generator.on_event(None, events.Text('ünï'))
+    generator.on_event(None, events.Binary(b'\x00\xff'))
+    # encoded sizes, same as sent_bytes
+    assert (generator.replies, generator.reply_bytes) == (2, 7)
@@ -0,0 +1,102 @@
+import pytest
+
+from sockly.structs import SocketMessage, MessageTypes, MessageContent
+from sockly.utils.database import SocklyDB
+from sockly.utils.decoding import parse_data
+from sockly.utils.hexdump import HexdumpLines
+from sockly.utils.message_store import MessageStore
+
+
+def incoming(data):
+    return SocketMessage(MessageTypes.INCOMING, *parse_data(data))
+
+
+def lines(message):
+    return list(message.lines)
+
+
+@pytest.fixture
+def database(tmp_path):
+    return SocklyDB(str(tmp_path / 'sockly.db'))
+
+
+def test_kinds_round_trip():
+    messages = [
+        incoming('plain'),
+        incoming('{"a": [1, 2]}'),
+        incoming(b'\x00\x01\xff'),
+        SocketMessage(MessageTypes.OUTGOING, HexdumpLines(bytes(40)), MessageContent.BINARY),
+        SocketMessage(MessageTypes.SYSTEM, ['Error: x', 'detail'], MessageContent.PLAIN),
+    ]
+    store = MessageStore()
+    store.extend(messages)
+    # re-created from the arena, not the cached views
+    store._views.clear()
+
+    assert len(store) == len(messages)
+    for message, stored in zip(messages, store):
+        assert (stored.type, stored.content) == (message.type, message.content)
+        assert lines(stored) == lines(message)
+    assert lines(store[-1]) == ['Error: x', 'detail']
+    assert [lines(m) for m in store[1:3]] == [lines(m) for m in messages[1:3]]
+    with pytest.raises(IndexError):
+        store[len(messages)]
+
+
+def test_spill_keeps_indices(database):
+    store = MessageStore(database, max_messages=100)
+    for i in range(1000):
+        store.append(incoming('m%d' % i))
+
+    assert len(store) == 1000
+    assert 0 < len(store.resident()) <= 100
+    assert store.offset == 1000 - len(store.resident())
+    for i in (0, 1, 255, 256, store.offset - 1, store.offset, 999):
+        assert lines(store[i]) == ['m%d' % i]
+    assert [lines(m)[0] for m in store] == ['m%d' % i for i in range(1000)]
+
+
+def test_spill_by_size(database):
+    store = MessageStore(database, max_bytes=10000)
+    for i in range(100):
+        store.append(incoming(b'%03d' % i + bytes(997)))
+    assert len(store.resident()) <= 10
+    assert store[0].lines.data[:3] == b'000'
+    assert store[99].lines.data[:3] == b'099'
+
+
+def test_retention_change(database):
+    store = MessageStore(database)
+    store.extend(incoming('m%d' % i) for i in range(50))
+    assert store.offset == 0
+    store.set_retention(max_messages=10)
+    assert len(store.resident()) <= 10
+    assert lines(store[0]) == ['m0']
+
+
+def test_clear_drops_spilled(database):
+    store = MessageStore(database, max_messages=10)
+    other = MessageStore(database, max_messages=10)
+    for i in range(100):
+        store.append(incoming('m%d' % i))
+        other.append(incoming('o%d' % i))
+    store.clear()
+
+    assert len(store) == 0
+    assert store.offset == 0
+    assert list(database.load_messages(store.store_id, 0, 100)) == []
+    # stores share the database, but not their messages
+    assert lines(other[0]) == ['o0']
+
+    store.append(incoming('again'))
+    assert lines(store[0]) == ['again']
+
+
+def test_spilled_messages_are_temporary(tmp_path):
+    path = str(tmp_path / 'sockly.db')
+    database = SocklyDB(path)
+    store = MessageStore(database, max_messages=10)
+    store.extend(incoming('m%d' % i) for i in range(100))
+    assert store.offset
+    # kept per connection, so another Sockly process neither sees nor keeps them
+    assert list(SocklyDB(path).load_messages(store.store_id, 0, 100)) == []
@@ -0,0 +1,81 @@
+import time
+
+from lomond import events
+
+from sockly.utils.rtt import RttMeter, percentile
+
+
+class FakeSocket:
+    def __init__(self):
+        self.pings = []
+
+    def send_ping(self, data):
+        self.pings.append(data)
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 0) == 1
+    assert percentile(values, 50) == 51
+    assert percentile(values, 99) == 100
+    assert percentile(values, 100) == 100
+    assert percentile([5], 99) == 5
+
+
+def test_pong():
+    meter = RttMeter()
+    ws = FakeSocket()
+    meter.ping(ws)
+    meter.ping(ws)
+    assert len(set(ws.pings)) == 2
+    time.sleep(0.01)
+    meter.on_event(events.Pong(ws.pings[0]))
+
+    rtt = meter.result(ws.pings[0])
+    assert 0.01 <= rtt < 1
+    assert meter.result(ws.pings[1]) is None
+    s = meter.summary()
+    assert (s['count'], s['sent'], s['lost']) == (1, 2, 0)
+    assert s['min'] == s['p50'] == s['max'] == rtt
+
+
+def test_not_ours():
+    meter = RttMeter()
+    meter.on_event(events.Pong(b'someone else'))
+    meter.on_event(events.Text('text'))
+    assert meter.result(b'someone else') is None
+    assert meter.summary() == {'count': 0, 'sent': 0, 'lost': 0, 'min': None, 'p50': None, 'p99': None, 'max': None}
+
+
+def test_lost():
+    meter = RttMeter()
+    ws = FakeSocket()
+    for _ in range(3):
+        meter.ping(ws)
+    # pongs come in order, the earlier pings won't be answered anymore
+    meter.on_event(events.Pong(ws.pings[2]))
+    meter.on_event(events.Pong(ws.pings[0]))
+    s = meter.summary()
+    assert (s['count'], s['sent'], s['lost']) == (1, 3, 2)
+    assert meter.result(ws.pings[0]) is None
+
+
+def test_reconnect():
+    meter = RttMeter()
+    ws = FakeSocket()
+    meter.ping(ws)
+    meter.on_event(events.Connecting('ws://localhost/'))
+    meter.on_event(events.Pong(ws.pings[0]))
+    assert meter.summary()['count'] == 0
+
+
+def test_window():
+    meter = RttMeter(window=5)
+    ws = FakeSocket()
+    for _ in range(RttMeter.RESULTS + 10):
+        meter.ping(ws)
+        meter.on_event(events.Pong(ws.pings[-1]))
+    assert meter.summary()['count'] == 5
+    # results are kept for the latest pongs only
+    assert meter.result(ws.pings[0]) is None
+    assert meter.result(ws.pings[-1]) is not None
@@ -0,0 +1,89 @@
+from threading import Thread
+
+from lomond.errors import WebSocketError
+from sockly.utils.send_queue import SendQueue
+
+
+def test_drain_in_order():
+    written, reports = [], []
+    queue = SendQueue(lambda payload, compressed: written.append((payload, compressed)), reports.append)
+    frames = [queue.put('a', tag=0), queue.put(b'\x00\x01', True, tag=1)]
+    assert len(queue) == 2
+    queue.drain()
+
+    assert written == [('a', False), (b'\x00\x01', True)]
+    assert [r.frame for r in reports] == frames
+    assert [r.depth for r in reports] == [1, 0]
+    assert [f.size for f in frames] == [1, 2]
+    for frame in frames:
+        assert frame.error is None
+        assert frame.enqueued <= frame.write_started <= frame.write_completed
+
+
+def test_failed_write_keeps_draining():
+    errors = iter([WebSocketError('closed'), OSError('Broken pipe'), TypeError('bad payload'), None])
+    written, reports = [], []
+
+    def write(payload, compressed):
+        error = next(errors)
+        if error:
+            raise error
+        written.append(payload)
+
+    queue = SendQueue(write, reports.append)
+    for payload in 'abcd':
+        queue.put(payload)
+    queue.drain()
+
+    assert written == ['d']
+    assert [r.frame.error for r in reports] == ['closed', 'Broken pipe', 'bad payload', None]
+    assert all(r.frame.write_completed for r in reports)
+
+
+def test_sender_thread_survives_errors():
+    reports = []
+
+    def write(payload, compressed):
+        if payload == 'bad':
+            raise OSError('Broken pipe')
+
+    queue = SendQueue(write, reports.append)
+    sender = Thread(target=queue.run, daemon=True)
+    sender.start()
+    queue.put('bad')
+    queue.put('good')
+    for _ in range(500):
+        if len(reports) == 2:
+            break
+        sender.join(0.01)
+    queue.close()
+    sender.join(1)
+
+    assert not sender.is_alive()
+    assert [(r.frame.payload, r.frame.error) for r in reports] == [('bad', 'Broken pipe'), ('good', None)]
+
+
+def test_close_drops_queued():
+    reports = []
+    queue = SendQueue(lambda payload, compressed: None, reports.append)
+    queue.put('a')
+    queue.close()
+    queue.run()
+    assert len(queue) == 0
+    assert reports == []
+
+
+def test_ping():
+    written, pings, reports = [], [], []
+    queue = SendQueue(lambda payload, compressed: written.append(payload), reports.append,
+                      ping=lambda: pings.append(written[:]))
+    queue.put('a')
+    frame = queue.put_ping()
+    queue.put('b')
+    queue.drain()
+
+    # written in order with frames, by the network thread
+    assert pings == [['a']]
+    assert written == ['a', 'b']
+    assert [r.frame.ping for r in reports] == [False, True, False]
+    assert frame.error is None and frame.write_started is not None
@@ -0,0 +1,97 @@
+import pickle
+
+from sockly.structs import SocketMessage, MessageTypes, MessageContent
+from sockly.utils.decoding import PayloadLines
+from sockly.utils.hexdump import HexdumpLines, hexdump
+from sockly.utils.message_store import MessageStore
+from sockly.utils.session_manager import validate_session, save_session, hexdump_data
+
+HEADER = {
+    'name': 'legacy',
+    'url': 'ws://localhost:8080/',
+    'headers': '',
+    'proxy_enabled': False,
+    'proxy': '',
+    'compression': False,
+    'reconnect': False,
+    'history': ['{"a": 1}'],
+    'favourites': [{'name': 'fav', 'value': 'x'}],
+    'input': '',
+    'mode': 'plain_text',
+    'msg_compression': False,
+}
+DATA = bytes(range(256)) + b'tail'
+
+
+def legacy_session(path, output):
+    # older versions pickled the whole session, messages with their display lines
+    with open(path, 'wb') as f:
+        pickle.dump(dict(HEADER, output=output), f)
+
+
+def load(path):
+    ok, data = validate_session(str(path))
+    assert ok, data
+    return data
+
+
+def test_hexdump_data():
+    assert hexdump_data(hexdump(DATA)) == DATA
+    assert hexdump_data(hexdump(b'')) == b''
+    assert hexdump_data(['not a hexdump']) is None
+    assert hexdump_data(hexdump(DATA)[1:]) is None
+
+
+def test_legacy_round_trip(tmp_path):
+    legacy = tmp_path / 'legacy.sockly'
+    legacy_session(legacy, [
+        SocketMessage(MessageTypes.SYSTEM, ['Welcome to Sockly'], MessageContent.PLAIN),
+        SocketMessage(MessageTypes.INCOMING, hexdump(DATA), MessageContent.BINARY),
+        SocketMessage(MessageTypes.OUTGOING, ['{', '  "a": 1', '}'], MessageContent.JSON),
+        # binary content with lines that aren't a hexdump is kept as is
+        SocketMessage(MessageTypes.INCOMING, ['some', 'text'], MessageContent.BINARY),
+    ])
+    data = load(legacy)
+    header = {k: v for k, v in data.items() if k != 'output'}
+
+    saved = tmp_path / 'saved.sockly'
+    assert save_session(str(saved), header, data['output']) == 4
+    data = load(saved)
+    messages = list(data['output'])
+
+    assert data['name'] == 'legacy'
+    assert [m.type for m in messages] == [MessageTypes.SYSTEM, MessageTypes.INCOMING,
+                                          MessageTypes.OUTGOING, MessageTypes.INCOMING]
+    assert isinstance(messages[1].lines, HexdumpLines)
+    assert messages[1].lines.data == DATA
+    assert list(messages[1].lines) == hexdump(DATA)
+    assert list(messages[2].lines) == ['{', '  "a": 1', '}']
+    assert messages[3].content == MessageContent.BINARY
+    assert list(messages[3].lines) == ['some', 'text']
+
+    # saved again, nothing changes
+    resaved = tmp_path / 'resaved.sockly'
+    save_session(str(resaved), header, messages)
+    assert [list(m.lines) for m in load(resaved)['output']] == [list(m.lines) for m in messages]
+
+
+def test_legacy_round_trip_through_output(tmp_path):
+    # loaded messages are kept by the output's MessageStore, which is what gets saved
+    legacy = tmp_path / 'legacy.sockly'
+    legacy_session(legacy, [SocketMessage(MessageTypes.INCOMING, hexdump(DATA), MessageContent.BINARY)])
+    store = MessageStore()
+    store.extend(load(legacy)['output'])
+
+    saved = tmp_path / 'saved.sockly'
+    save_session(str(saved), HEADER, store)
+    message, = load(saved)['output']
+    assert message.lines.data == DATA
+
+
+def test_append(tmp_path):
+    path = tmp_path / 'session.sockly'
+    messages = [SocketMessage(MessageTypes.INCOMING, PayloadLines('m%d' % i, MessageContent.PLAIN),
+                              MessageContent.PLAIN) for i in range(10)]
+    assert save_session(str(path), HEADER, messages[:6]) == 6
+    assert save_session(str(path), HEADER, messages, stored=6) == 10
+    assert [m.lines[0] for m in load(path)['output']] == ['m%d' % i for i in range(10)]